@@ -1,4 +1,6 @@
-from flask import Flask
+import threading
+
+from flask import Flask, request
 from flask_cors import CORS
 
 from app.config import Config
@@ -6,14 +8,36 @@ from app.routes.data_api import data_api
 from app.routes.geo_api import geo_api
 from app.routes.health_check import health_api
 from app.services.cache import init_redis, load_cities_to_redis_from_db
+from app.services.database import engine
+from app.services.search_index import get_search_index
+from app.services.zcta_index import get_zcta_index
+from app.utils import metrics
 
 app = Flask(__name__)
 app.config.from_object(Config)
 CORS(app, origins=["http://localhost:3000"])
+metrics.instrument_engine(engine)
+
+@app.before_request
+def start_request_metrics():
+    metrics.start_request()
+
+@app.after_request
+def finish_request_metrics(response):
+    # Route templates, not raw paths, so the endpoint label stays bounded
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    server_timing = metrics.finish_request(endpoint, request.method, response.status_code)
+    if server_timing and Config.SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing
+    return response
 
-# Initialize Redis
-init_redis(app)
-load_cities_to_redis_from_db()
+if not Config.SKIP_APP_INIT:
+    # Initialize Redis
+    init_redis(app)
+    load_cities_to_redis_from_db()
+    # Build the autocomplete and ZCTA indexes in the background so the first requests do not pay for them
+    threading.Thread(target=get_search_index, daemon=True).start()
+    threading.Thread(target=get_zcta_index, daemon=True).start()
 app.register_blueprint(geo_api)
 app.register_blueprint(data_api)
 app.register_blueprint(health_api)
\ No newline at end of file
@@ -0,0 +1,138 @@
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+
+from app import app as flask_app
+from app.services import async_geospatial
+from app.services.geospatial import REDIS_NEARBY_COUNT_MODES
+from app.utils.geo_utils import resolve_geometry_tier
+
+
+@asynccontextmanager
+async def lifespan(_):
+    await async_geospatial.init_async_clients()
+    yield
+    await async_geospatial.close_async_clients()
+
+
+asgi_app = FastAPI(lifespan=lifespan)
+asgi_app.add_middleware(CORSMiddleware, allow_origins=["http://localhost:3000"])
+
+
+def _geometry_tier(request):
+    zoom = request.query_params.get("zoom")
+    try:
+        zoom = float(zoom) if zoom is not None else None
+    except ValueError:
+        zoom = None
+    return resolve_geometry_tier(request.query_params.get("detail"), zoom)
+
+
+@asgi_app.get("/nearby-redis")
+async def get_nearby_from_redis(request: Request):
+    args = request.query_params
+    try:
+        lat = float(args.get('lat'))
+        lng = float(args.get('lng'))
+        radius = float(args.get('radius', 5000))
+        page = int(args.get('page', 1))
+        limit = int(args.get('limit', 10))
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "Invalid parameters"}, 400)
+
+    if page < 1 or limit < 1:
+        return JSONResponse({"error": "Page and limit must be positive integers"}, 400)
+    count_mode = args.get('count', 'none')
+    if count_mode not in REDIS_NEARBY_COUNT_MODES:
+        return JSONResponse({"error": f"count must be one of {', '.join(REDIS_NEARBY_COUNT_MODES)}"}, 400)
+
+    try:
+        return await async_geospatial.get_nearby_cities_from_redis(lat, lng, radius, page, limit, count_mode)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, 500)
+
+
+@asgi_app.get("/nearby")
+async def get_nearby(request: Request):
+    args = request.query_params
+    try:
+        lat = float(args.get('lat'))
+        lng = float(args.get('lng'))
+        radius = float(args.get('radius', 5000))
+        page = int(args.get('page', 1))
+        limit = int(args.get('limit', 10))
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "Invalid lat/lng, radius, page, or limit"}, 400)
+
+    if limit < 1:
+        return JSONResponse({"error": "limit must be a positive integer"}, 400)
+
+    try:
+        tier = _geometry_tier(request)
+    except ValueError as ve:
+        return JSONResponse({"error": str(ve)}, 400)
+
+    cursor = args.get('cursor')
+    if cursor or args.get('paginate') == 'cursor':
+        return await async_geospatial.fetch_nearby_cities_keyset(
+            lat, lng, radius, limit, cursor, args.get('count', 'none'), tier
+        )
+    return await async_geospatial.fetch_nearby_cities(lat, lng, radius, page, limit, tier, args.get('count', 'none'))
+
+
+@asgi_app.get("/demographics")
+async def get_demographics(request: Request):
+    try:
+        lat = float(request.query_params["lat"])
+        lng = float(request.query_params["lng"])
+    except (KeyError, ValueError):
+        lat = lng = None
+    try:
+        tier = _geometry_tier(request)
+    except ValueError as ve:
+        return JSONResponse({"error": str(ve)}, 400)
+    return await async_geospatial.fetch_demographics(
+        lat, lng, tier, request.headers.get("accept-encoding"), request.headers.get("if-none-match")
+    )
+
+
+@asgi_app.get("/health")
+async def health_check():
+    redis_status = await async_geospatial.check_redis()
+    db_status = await async_geospatial.check_db()
+
+    status_code = 200
+    overall_health = "OK"
+
+    if isinstance(redis_status, tuple) or isinstance(db_status, tuple):
+        overall_health = "DEGRADED"
+        status_code = 500
+
+    return JSONResponse({
+        "health": overall_health,
+        "redis": redis_status if not isinstance(redis_status, tuple) else redis_status[0],
+        "postgres": db_status if not isinstance(db_status, tuple) else db_status[0]
+    }, status_code)
+
+
+@asgi_app.get("/health/ping_redis")
+async def ping_redis():
+    result = await async_geospatial.check_redis()
+    if isinstance(result, tuple):
+        return JSONResponse(result[0], result[1])
+    return JSONResponse({"redis": result}, 200)
+
+
+@asgi_app.get("/health/ping_db")
+async def ping_db():
+    result = await async_geospatial.check_db()
+    if isinstance(result, tuple):
+        return JSONResponse(result[0], result[1])
+    return JSONResponse({"postgres": result}, 200)
+
+
+# Every other route of geo_api, data_api and health_api is served by the Flask app itself
+asgi_app.mount("/", WSGIMiddleware(flask_app))
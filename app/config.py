@@ -13,8 +13,76 @@ class Config:
         f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
     )
 
+    # Same database, as a plain DSN for asyncpg (ASGI serving mode)
+    ASYNC_DATABASE_DSN = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    ASYNC_PG_POOL_MIN_SIZE = int(os.getenv("ASYNC_PG_POOL_MIN_SIZE", "5"))
+    ASYNC_PG_POOL_MAX_SIZE = int(os.getenv("ASYNC_PG_POOL_MAX_SIZE", "20"))
+
+    # "flask" (default, threaded dev server) or "asgi" (uvicorn + app/asgi.py)
+    SERVER_MODE = os.getenv("SERVER_MODE", "flask")
+    ASGI_WORKERS = int(os.getenv("ASGI_WORKERS", "1"))
+    # Port `python -m app.main` listens on, in either mode
+    SERVER_PORT = int(os.getenv("SERVER_PORT", "5001"))
+
+    # Skip connecting to Redis and syncing the city index when the app package is imported
+    # (set by the offline benchmarks, which wire their own clients)
+    SKIP_APP_INIT = os.getenv("SKIP_APP_INIT", "0") == "1"
+    # Add a Server-Timing header (stage, DB and Redis breakdown) to every response
+    SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
     REDIS_HOST = os.getenv("REDIS_HOST", "redis-cache")
     REDIS_PORT = os.getenv("REDIS_PORT", "6379")
     REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # TTL (seconds) of cached city:data payloads
+    CITY_DATA_TTL = int(os.getenv("CITY_DATA_TTL", "86400"))
+    # TTL (seconds) of cached geojson:* geometries; reloads also drop them explicitly
+    GEOJSON_TTL = int(os.getenv("GEOJSON_TTL", "604800"))
+    # TTL (seconds) of cached vector tiles; reloads also drop them explicitly
+    TILE_TTL = int(os.getenv("TILE_TTL", "604800"))
+    # TTL (seconds) of "does not exist" entries, so unknown ids do not hit Postgres on every request
+    NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", "300"))
+
+    # In-process LRU in front of Redis: entry TTL (seconds) and memory budget (MB) per namespace
+    LOCAL_CACHE_TTL = int(os.getenv("LOCAL_CACHE_TTL", "60"))
+    LOCAL_CACHE_GEOJSON_MB = int(os.getenv("LOCAL_CACHE_GEOJSON_MB", "128"))
+    LOCAL_CACHE_CITY_DATA_MB = int(os.getenv("LOCAL_CACHE_CITY_DATA_MB", "32"))
+    LOCAL_CACHE_CITY_META_MB = int(os.getenv("LOCAL_CACHE_CITY_META_MB", "16"))
+    # Seconds a request waits for another thread already loading the same key
+    CACHE_LOAD_TIMEOUT = float(os.getenv("CACHE_LOAD_TIMEOUT", "10"))
+
+    # Seconds between checks of the boundary dataset version in Redis
+    BOUNDARY_INDEX_CHECK_INTERVAL = int(os.getenv("BOUNDARY_INDEX_CHECK_INTERVAL", "30"))
+    # Point lookups: size (degrees) of the quantized lat/lng cells cached per county, and max cells kept
+    POINT_CELL_DEGREES = float(os.getenv("POINT_CELL_DEGREES", "0.01"))
+    POINT_CELL_CACHE_SIZE = int(os.getenv("POINT_CELL_CACHE_SIZE", "200000"))
+
+    # Seconds between checks of the demography dataset version in Redis
+    DEMOGRAPHY_STORE_CHECK_INTERVAL = int(os.getenv("DEMOGRAPHY_STORE_CHECK_INTERVAL", "30"))
+
+    # POST /demographics/batch: max points per request, and points resolved per streamed chunk
+    DEMOGRAPHICS_BATCH_MAX_POINTS = int(os.getenv("DEMOGRAPHICS_BATCH_MAX_POINTS", "200000"))
+    DEMOGRAPHICS_BATCH_CHUNK_SIZE = int(os.getenv("DEMOGRAPHICS_BATCH_CHUNK_SIZE", "5000"))
+
+    # GET /demographics/heatmap: max grid cells returned for one viewport
+    HEATMAP_MAX_CELLS = int(os.getenv("HEATMAP_MAX_CELLS", "20000"))
+
+    # Whole-response cache of the GeoJSON endpoints (/demographics, /search, /encompassing_boundaries):
+    # Redis TTL (seconds), largest body kept, compression levels, and the browser max-age (seconds)
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+    RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+    RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "9"))
+    RESPONSE_MAX_AGE = int(os.getenv("RESPONSE_MAX_AGE", "300"))
+    # /search responses are only stored once a query has been seen this many times
+    # among the most recent RESPONSE_POPULAR_KEYS queries of a process
+    RESPONSE_POPULAR_THRESHOLD = int(os.getenv("RESPONSE_POPULAR_THRESHOLD", "3"))
+    RESPONSE_POPULAR_KEYS = int(os.getenv("RESPONSE_POPULAR_KEYS", "10000"))
+
+    # /nearby-redis: searches of one center before its full result set is stored (GEOSEARCHSTORE),
+    # how long stored results live (seconds), and how many recent centers each process tracks
+    NEARBY_HOT_THRESHOLD = int(os.getenv("NEARBY_HOT_THRESHOLD", "3"))
+    NEARBY_RESULTS_TTL = int(os.getenv("NEARBY_RESULTS_TTL", "300"))
+    NEARBY_HOT_CENTERS = int(os.getenv("NEARBY_HOT_CENTERS", "10000"))
@@ -1,4 +1,9 @@
-from app import app
+from app.config import Config
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    if Config.SERVER_MODE == "asgi":
+        import uvicorn
+        uvicorn.run("app.asgi:asgi_app", host='0.0.0.0', port=Config.SERVER_PORT, workers=Config.ASGI_WORKERS)
+    else:
+        from app import app
+        app.run(host='0.0.0.0', port=Config.SERVER_PORT, debug=True)
@@ -1,6 +1,7 @@
 from sqlalchemy import Float
 from app.services.database import Base
 from sqlalchemy import Column, Integer, String, BigInteger
+from sqlalchemy.orm import synonym
 from geoalchemy2 import Geometry
 
 class StateDemography(Base):
@@ -10,12 +11,12 @@ class StateDemography(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     geoidfq = Column(String, index=True)
-    total_population = Column(String)  # Change to String (Text)
-    female_population = Column(String)  # Change to String (Text)
-    median_gross_rent_in_dollars = Column(String)  # Change to String (Text)
-    median_household_income_past12months = Column(String)  # Change to String (Text)
-    male_bachelors_degree_25yrs_above = Column(String)  # Change to String (Text)
-    female_bachelors_degree_25yrs_above = Column(String)  # Change to String (Text)
+    total_population = Column(BigInteger)
+    female_population = Column(BigInteger)
+    median_gross_rent_in_dollars = Column(Integer)
+    median_household_income_past12months = Column(Integer)
+    male_bachelors_degree_25yrs_above = Column(BigInteger)
+    female_bachelors_degree_25yrs_above = Column(BigInteger)
     state = Column(String)
     year = Column(Integer)
 
@@ -26,12 +27,12 @@ class CountyDemography(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     geoidfq = Column(String, index=True)
-    total_population = Column(String)  # Change to String (Text)
-    female_population = Column(String)  # Change to String (Text)
-    median_gross_rent_in_dollars = Column(String)  # Change to String (Text)
-    median_household_income_past12months = Column(String)  # Change to String (Text)
-    male_bachelors_degree_25yrs_above = Column(String)  # Change to String (Text)
-    female_bachelors_degree_25yrs_above = Column(String)  # Change to String (Text)
+    total_population = Column(BigInteger)
+    female_population = Column(BigInteger)
+    median_gross_rent_in_dollars = Column(Integer)
+    median_household_income_past12months = Column(Integer)
+    male_bachelors_degree_25yrs_above = Column(BigInteger)
+    female_bachelors_degree_25yrs_above = Column(BigInteger)
     state = Column(String)
     county = Column(String)
     year = Column(Integer)
@@ -104,4 +105,32 @@ class ZCTA(Base):
     lsad20 = Column(String)
     aland20 = Column(BigInteger)
     awater20 = Column(BigInteger)
-    wkb_geometry = Column(Geometry(geometry_type="GEOMETRY", srid=4326))
\ No newline at end of file
+    wkb_geometry = Column(Geometry(geometry_type="GEOMETRY", srid=4326))
+
+    # Same name as the other boundary tables, so layer-generic queries work on ZCTAs too
+    geoidfq = synonym("affgeoid20")
+
+class SimplifiedBoundary(Base):
+    __tablename__ = "simplified_boundaries"
+    __table_args__ = {"schema": "gis"}
+
+    layer = Column(String, primary_key=True)
+    tier = Column(String, primary_key=True)
+    geoidfq = Column(String, primary_key=True)
+    wkb_geometry = Column(Geometry(geometry_type="GEOMETRY", srid=4326))
+
+
+class BoundaryHierarchy(Base):
+    """
+    Precomputed state -> county -> place containment, one row per overlapping parent/child pair.
+    """
+    __tablename__ = "boundary_hierarchy"
+    __table_args__ = {"schema": "gis"}
+
+    parent_layer = Column(String, nullable=False)
+    parent_geoidfq = Column(String, primary_key=True)
+    child_layer = Column(String, nullable=False)
+    child_geoidfq = Column(String, primary_key=True, index=True)
+    child_name = Column(String)
+    # Share of the child's area inside the parent (1.0 when fully contained)
+    overlap_fraction = Column(Float, nullable=False)
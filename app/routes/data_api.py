@@ -1,6 +1,8 @@
-from flask import  request, jsonify
-from app.services import cache
-from app.services.geospatial import fetch_demographics
+from flask import  request, jsonify, Response, stream_with_context
+from app.services import cache, demography_store, heatmap
+from app.services.geospatial import fetch_demographics, stream_demographics_batch, aggregate_polygon_demographics
+from app.utils.geo_utils import resolve_geometry_tier
+from app.utils.json_utils import json_response, loads
 from flask import Blueprint
 
 data_api = Blueprint('data_api', __name__)
@@ -8,13 +10,123 @@ data_api = Blueprint('data_api', __name__)
 def load_cities_to_redis():
     try:
         cache.redis_client.ping()
-        total = cache.load_cities_to_redis_from_db()
+        total = cache.load_cities_to_redis_from_db(force=True)
         return jsonify({"message": f"{total} cities loaded into Redis"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@data_api.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(cache.get_cache_stats())
+
 @data_api.route('/demographics', methods=['GET'])
 def get_demographics():
     lat = request.args.get("lat", type=float)
     lng = request.args.get("lng", type=float)
-    return fetch_demographics(lat, lng)
\ No newline at end of file
+    try:
+        tier = resolve_geometry_tier(request.args.get("detail"), request.args.get("zoom", type=float))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    return fetch_demographics(lat, lng, tier,
+                              request.headers.get("Accept-Encoding"), request.headers.get("If-None-Match"))
+
+@data_api.route('/demographics/batch', methods=['POST'])
+def get_demographics_batch():
+    """
+    Body: a JSON array of points, or NDJSON (one point per line) with an
+    application/x-ndjson content type. Geometry is omitted unless ?geometry=true.
+    """
+    tier = None
+    if request.args.get("geometry", "false").lower() == "true":
+        try:
+            tier = resolve_geometry_tier(request.args.get("detail"), request.args.get("zoom", type=float))
+        except ValueError as ve:
+            return jsonify({"error": str(ve)}), 400
+
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        # Parsed lazily, so large uploads are resolved while they are still being read
+        items = (line for line in request.stream if line.strip())
+    else:
+        try:
+            items = loads(request.get_data())
+        except ValueError:
+            return jsonify({"error": "Body must be a JSON array of points or NDJSON"}), 400
+        if not isinstance(items, list):
+            return jsonify({"error": "Body must be a JSON array of points or NDJSON"}), 400
+
+    return Response(stream_with_context(stream_demographics_batch(items, tier)), mimetype="application/x-ndjson")
+
+@data_api.route('/demographics/polygon', methods=['POST'])
+def polygon_demographics():
+    """
+    Body: {"polygon_wkt": "..."}. ?weighting=area|population, ?year=.
+    """
+    return aggregate_polygon_demographics(
+        request.get_json(silent=True),
+        request.args.get("weighting", "area"),
+        request.args.get("year", type=int),
+    )
+
+@data_api.route('/demographics/rank', methods=['GET'])
+def rank_demographics():
+    try:
+        result = demography_store.rank(
+            request.args.get("level", "counties"),
+            request.args.get("metric", "total_population"),
+            year=request.args.get("year", type=int),
+            order=request.args.get("order", "desc"),
+            limit=max(1, min(request.args.get("limit", 10, type=int), 500)),
+            state=request.args.get("state"),
+        )
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except LookupError as le:
+        return jsonify({"error": str(le)}), 404
+    return jsonify(result)
+
+@data_api.route('/demographics/percentile', methods=['GET'])
+def demographics_percentile():
+    try:
+        result = demography_store.percentile(
+            request.args.get("geoidfq"),
+            request.args.get("metric", "total_population"),
+            year=request.args.get("year", type=int),
+        )
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except LookupError as le:
+        return jsonify({"error": str(le)}), 404
+    return jsonify(result)
+
+@data_api.route('/demographics/timeseries', methods=['GET'])
+def demographics_timeseries():
+    try:
+        result = demography_store.time_series(
+            request.args.get("geoidfq"),
+            request.args.get("metric", "total_population"),
+        )
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except LookupError as le:
+        return jsonify({"error": str(le)}), 404
+    return jsonify(result)
+
+@data_api.route('/demographics/heatmap', methods=['GET'])
+def demographics_heatmap():
+    """
+    ?bbox=min_lng,min_lat,max_lng,max_lat&metric=&zoom= (or &resolution=)&year=&density=true
+    """
+    try:
+        result = heatmap.heatmap(
+            request.args.get("metric", "total_population"),
+            heatmap.parse_bbox(request.args.get("bbox")),
+            zoom=request.args.get("zoom", type=float),
+            resolution=request.args.get("resolution", type=int),
+            year=request.args.get("year", type=int),
+            density=request.args.get("density", "false").lower() == "true",
+        )
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except LookupError as le:
+        return jsonify({"error": str(le)}), 404
+    return json_response(result)
@@ -1,7 +1,13 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response
 
 from app.services.geospatial import fetch_cities_within_polygon, fetch_nearby_cities, fetch_encompassing_boundaries, \
-    get_nearby_cities_from_redis, search_boundaries_service
+    get_nearby_cities_from_redis, search_boundaries_service, fetch_nearby_cities_keyset, fetch_boundary_geometries, \
+    REDIS_NEARBY_COUNT_MODES
+from app.services import response_cache, zcta_index
+from app.services.search_index import autocomplete, normalize
+from app.services.tiles import get_tile
+from app.utils.geo_utils import resolve_geometry_tier
+from app.utils.json_utils import json_response
 from flask import Blueprint
 
 geo_api = Blueprint('geo_api', __name__)
@@ -19,10 +25,14 @@ def get_nearby_from_redis():
 
     if page < 1 or limit < 1:
         return jsonify({"error": "Page and limit must be positive integers"}), 400
+    # Top-k by default: only the nearest page * limit + 1 cities; count=exact adds a server-side total
+    count_mode = request.args.get('count', 'none')
+    if count_mode not in REDIS_NEARBY_COUNT_MODES:
+        return jsonify({"error": f"count must be one of {', '.join(REDIS_NEARBY_COUNT_MODES)}"}), 400
 
     try:
-        result = get_nearby_cities_from_redis(lat, lng, radius, page, limit)
-        return jsonify(result)
+        result = get_nearby_cities_from_redis(lat, lng, radius, page, limit, count_mode)
+        return json_response(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -46,7 +56,21 @@ def get_nearby():
     except (TypeError, ValueError):
         return jsonify({"error": "Invalid lat/lng, radius, page, or limit"}), 400
 
-    return fetch_nearby_cities(lat, lng, radius, page, limit)
+    if limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    try:
+        tier = resolve_geometry_tier(request.args.get('detail'), request.args.get('zoom', type=float))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    # Keyset mode: ?paginate=cursor for the first page, then ?cursor=<next_cursor>
+    cursor = request.args.get('cursor')
+    if cursor or request.args.get('paginate') == 'cursor':
+        count_mode = request.args.get('count', 'none')
+        return fetch_nearby_cities_keyset(lat, lng, radius, limit, cursor, count_mode, tier)
+
+    return fetch_nearby_cities(lat, lng, radius, page, limit, tier, request.args.get('count', 'none'))
 
 @geo_api.route('/encompassing_boundaries', methods=['GET'])
 def encompassing_boundaries():
@@ -57,7 +81,19 @@ def encompassing_boundaries():
     except (TypeError, ValueError):
         return jsonify({"error": "Invalid page or limit parameters"}), 400
 
-    return fetch_encompassing_boundaries(geoidfq, page, limit)
+    try:
+        tier = resolve_geometry_tier(request.args.get('detail'), request.args.get('zoom', type=float))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    if limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    # Keyset mode: ?paginate=cursor for the first page, then ?cursor=<next_cursor>
+    cursor = request.args.get('cursor')
+    keyset = request.args.get('paginate') == 'cursor'
+    return fetch_encompassing_boundaries(geoidfq, page, limit, tier, cursor, keyset,
+                                         request.headers.get("Accept-Encoding"), request.headers.get("If-None-Match"))
 
 @geo_api.route('/search', methods=['GET'])
 def search_boundaries():
@@ -68,9 +104,82 @@ def search_boundaries():
         return jsonify({"error": "Invalid boundaryType. Must be 'states' or 'counties'."}), 400
 
     try:
-        results = search_boundaries_service(boundary_type, query)
-        return jsonify(results)
+        tier = resolve_geometry_tier(request.args.get('detail'), request.args.get('zoom', type=float))
+        # Only repeated queries are stored, so typing does not leave one entry per keystroke
+        key = response_cache.response_key("search", boundary_type, tier, normalize(query))
+        return response_cache.flask_response(key, lambda: search_boundaries_service(boundary_type, query, tier),
+                                             request.headers.get("Accept-Encoding"),
+                                             request.headers.get("If-None-Match"),
+                                             store=response_cache.is_popular(key))
     except ValueError as ve:
         return jsonify({"error": str(ve)}), 400
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+@geo_api.route('/autocomplete', methods=['GET'])
+def autocomplete_boundaries():
+    query = request.args.get('q', '')
+    layers = request.args.get('layers')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    fuzzy = request.args.get('fuzzy', 'true').lower() != 'false'
+    try:
+        results = autocomplete(query, layers.split(',') if layers else None, limit, fuzzy)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    return json_response({"query": query, "results": results})
+
+@geo_api.route('/geometry', methods=['GET'])
+def boundary_geometry():
+    ids = [geoidfq for geoidfq in request.args.get('ids', '').split(',') if geoidfq]
+    if not ids or len(ids) > 100:
+        return jsonify({"error": "ids must list 1 to 100 comma-separated geoidfqs"}), 400
+    try:
+        tier = resolve_geometry_tier(request.args.get('detail'), request.args.get('zoom', type=float))
+        return json_response(fetch_boundary_geometries(ids, tier))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+@geo_api.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+def vector_tile(layer, z, x, y):
+    try:
+        tile, etag = get_tile(layer, z, x, y)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 404
+    response = Response(tile, mimetype="application/vnd.mapbox-vector-tile")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return response.make_conditional(request)
+
+@geo_api.route('/zcta/lookup', methods=['GET'])
+def zcta_lookup():
+    try:
+        lat = float(request.args.get('lat'))
+        lng = float(request.args.get('lng'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "lat and lng query parameters are required"}), 400
+    try:
+        return json_response(zcta_index.lookup_point(lat, lng))
+    except LookupError as le:
+        return jsonify({"error": str(le)}), 404
+
+@geo_api.route('/zcta/nearby', methods=['GET'])
+def zcta_nearby():
+    try:
+        lat = float(request.args.get('lat'))
+        lng = float(request.args.get('lng'))
+        radius = float(request.args.get('radius', 5000))
+        page = int(request.args.get('page', 1))
+        limit = int(request.args.get('limit', 10))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid parameters"}), 400
+
+    if page < 1 or limit < 1:
+        return jsonify({"error": "Page and limit must be positive integers"}), 400
+    return json_response(zcta_index.nearby(lat, lng, radius, page, limit))
+
+@geo_api.route('/zcta/<zcta>', methods=['GET'])
+def zcta_details(zcta):
+    try:
+        return json_response(zcta_index.get_zcta(zcta))
+    except LookupError as le:
+        return jsonify({"error": str(le)}), 404
@@ -1,5 +1,6 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, Response
 from app.services import cache
+from app.utils import metrics
 from app.services.database import get_db
 from sqlalchemy import text
 
@@ -40,6 +41,12 @@ def ping_db():
     return jsonify({"postgres": result}), 200
 
 
+@health_api.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
 def check_redis():
     try:
         pong = cache.redis_client.ping()
@@ -0,0 +1,206 @@
+"""
+Tags every lat/lng row of a CSV or Parquet file with its state and county
+(FIPS codes and names) and that county's demographics for one year.
+
+The input is streamed in chunks; each chunk's points are resolved in worker
+processes with a bulk STRtree query against the state and county polygons, and
+results are appended to the output in input order, so memory stays bounded by
+the chunk size times the number of chunks in flight.
+
+    python -m app.scripts.assign_counties points.csv tagged.csv --lat-col latitude --lng-col longitude
+    python -m app.scripts.assign_counties points.parquet tagged.parquet --year 2022 --workers 8
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Standalone job: skip the web app's Redis/index startup when app is imported
+os.environ.setdefault("SKIP_APP_INIT", "1")
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from app.services.database import SessionLocal, engine
+from app.services.demography_store import METRICS, load_table
+from app.services.spatial_index import load_layer
+from app.models.entities import County, CountyDemography, State
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Layers used by the worker processes; inherited from the parent when forked
+_layers = None
+
+
+def load_layers():
+    session = SessionLocal()
+    try:
+        return {"states": load_layer(session, State), "counties": load_layer(session, County)}
+    finally:
+        session.close()
+
+
+def _init_worker():
+    global _layers
+    # Connections inherited from the parent process must not be reused after fork
+    engine.dispose(close=False)
+    if _layers is None:  # not forked from the parent that loaded them
+        _layers = load_layers()
+
+
+def _assign_chunk(lats, lngs):
+    points = shapely.points(lngs, lats)
+    return _layers["states"].locate_many(points), _layers["counties"].locate_many(points)
+
+
+def _fips(geoidfqs):
+    # 0400000USss / 0500000USssccc -> ss / ssccc
+    return pd.Series(geoidfqs, dtype=object).str[9:].astype("string").array
+
+
+def _names(geoidfqs, names):
+    # A string dtype even when nothing matched, so every Parquet chunk has the same schema
+    return pd.Series(geoidfqs, dtype=object).map(names).astype("string").array
+
+
+def _read_chunks(path, chunk_size):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq  # only imported for Parquet files
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class _Writer:
+    def __init__(self, path):
+        self.path = path
+        self.parquet = None
+        self.started = False
+
+    def write(self, frame):
+        if self.path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self.parquet is None:
+                self.parquet = pq.ParquetWriter(self.path, table.schema)
+            self.parquet.write_table(table.cast(self.parquet.schema))
+        else:
+            frame.to_csv(self.path, mode="a" if self.started else "w", header=not self.started, index=False)
+        self.started = True
+
+    def close(self):
+        if self.parquet is not None:
+            self.parquet.close()
+
+
+class _Tagger:
+    """
+    Turns a chunk plus its (state, county) geoidfqs into the output rows.
+    """
+
+    def __init__(self, layers, demography, year, metrics):
+        self.state_names = dict(zip(layers["states"].geoidfqs, layers["states"].names))
+        self.county_names = dict(zip(layers["counties"].geoidfqs, layers["counties"].names))
+        self.metrics = {metric: demography.metrics[metric] for metric in metrics}
+        # County geoidfq -> its demography row for the year
+        self.rows = {geoidfq: position for (geoidfq, row_year), position in demography.row_by_key.items()
+                     if row_year == year}
+
+    def tag(self, frame, state_ids, county_ids):
+        frame = frame.copy()
+        frame["state_fips"] = _fips(state_ids)
+        frame["state_name"] = _names(state_ids, self.state_names)
+        frame["county_fips"] = _fips(county_ids)
+        frame["county_name"] = _names(county_ids, self.county_names)
+        positions = pd.Series(county_ids, dtype=object).map(self.rows).fillna(-1).to_numpy(dtype=np.int64)
+        found = positions >= 0
+        for metric, values in self.metrics.items():
+            column = np.full(len(frame), np.nan)
+            column[found] = values[positions[found]]
+            frame[metric] = column
+        return frame
+
+
+def assign_counties(input_path, output_path, lat_col="lat", lng_col="lng", year=None, metrics=METRICS,
+                    chunk_size=DEFAULT_CHUNK_SIZE, workers=None):
+    """
+    Tag every row of input_path with state/county FIPS, names and county demographics, writing output_path.
+
+    Returns:
+        int: Rows written.
+    """
+    global _layers
+    _layers = layers = load_layers()
+    session = SessionLocal()
+    try:
+        demography = load_table(session, CountyDemography)
+    finally:
+        session.close()
+    year = demography.year_or_latest(year)
+    if year not in demography.years:
+        raise ValueError(f"No county demographics for {year}; available: {demography.years}")
+    tagger = _Tagger(layers, demography, year, metrics)
+    print(f"Loaded {len(layers['states'])} states and {len(layers['counties'])} counties; "
+          f"joining {year} demographics.")
+
+    workers = workers or os.cpu_count() or 1
+    writer = _Writer(output_path)
+    started = time.perf_counter()
+    total = 0
+    in_flight = deque()
+
+    def flush_one():
+        frame, future = in_flight.popleft()
+        state_ids, county_ids = future.result()
+        writer.write(tagger.tag(frame, state_ids, county_ids))
+        return len(frame)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for frame in _read_chunks(input_path, chunk_size):
+                missing = {lat_col, lng_col} - set(frame.columns)
+                if missing:
+                    raise ValueError(f"Input has no {', '.join(sorted(missing))} column")
+                lats = pd.to_numeric(frame[lat_col], errors="coerce").to_numpy(dtype=np.float64)
+                lngs = pd.to_numeric(frame[lng_col], errors="coerce").to_numpy(dtype=np.float64)
+                in_flight.append((frame, pool.submit(_assign_chunk, lats, lngs)))
+                # Keep a couple of chunks per worker queued, no more
+                if len(in_flight) >= 2 * workers:
+                    total += flush_one()
+                    print(f"Tagged {total} rows ({total / (time.perf_counter() - started):,.0f} rows/s)")
+            while in_flight:
+                total += flush_one()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {total} rows to {output_path} in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s).")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV or .parquet file with lat/lng columns")
+    parser.add_argument("output", help="CSV or .parquet file to write")
+    parser.add_argument("--lat-col", default="lat")
+    parser.add_argument("--lng-col", default="lng")
+    parser.add_argument("--year", type=int, help="Demography year to join (default: latest loaded)")
+    parser.add_argument("--metrics", default=",".join(METRICS), help="Comma-separated demography columns to add")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    metrics = [metric for metric in args.metrics.split(",") if metric]
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        parser.error(f"Unknown metrics: {', '.join(sorted(unknown))}")
+    assign_counties(args.input, args.output, args.lat_col, args.lng_col, args.year, metrics,
+                    args.chunk_size, args.workers)
+
+
+if __name__ == "__main__":
+    main()
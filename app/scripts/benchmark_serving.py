@@ -0,0 +1,103 @@
+"""
+Closed-loop load generator comparing serving modes (e.g. Flask on :5001 vs ASGI on :5002).
+
+For each base URL it ramps the number of concurrent clients and reports the
+highest throughput reached while the p95 latency stays under the target.
+
+    python -m app.scripts.benchmark_serving \
+        --url http://localhost:5001 --url http://localhost:5002 \
+        --path "/nearby-redis?lat=40.71&lng=-74.0&radius=50000" \
+        --path "/demographics?lat=40.71&lng=-74.0&detail=low" \
+        --target-p95-ms 100 --duration 10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import httpx
+import numpy as np
+
+
+async def _client(http, urls, deadline, latencies, errors):
+    for url in urls:
+        if time.perf_counter() >= deadline:
+            return
+        start = time.perf_counter()
+        try:
+            response = await http.get(url)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_level(base_url, paths, concurrency, duration):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _client(http, itertools.cycle(paths[i % len(paths):] + paths[:i % len(paths)]), deadline, latencies, errors)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    samples = np.array(latencies) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": float(np.percentile(samples, 50)) if len(samples) else None,
+        "p95_ms": float(np.percentile(samples, 95)) if len(samples) else None,
+        "p99_ms": float(np.percentile(samples, 99)) if len(samples) else None,
+    }
+
+
+async def benchmark(base_url, paths, target_p95_ms, duration, max_concurrency):
+    levels = []
+    best = None
+    concurrency = 1
+    while concurrency <= max_concurrency:
+        level = await run_level(base_url, paths, concurrency, duration)
+        levels.append(level)
+        print(f"{base_url} c={concurrency}: {level['throughput_rps']:.1f} req/s, "
+              f"p95 {level['p95_ms']:.1f} ms, errors {level['errors']}")
+        if level["p95_ms"] is None or level["p95_ms"] > target_p95_ms:
+            break
+        if best is None or level["throughput_rps"] > best["throughput_rps"]:
+            best = level
+        concurrency *= 2
+    return {"url": base_url, "target_p95_ms": target_p95_ms, "best_under_target": best, "levels": levels}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", action="append", required=True, help="Base URL of a running server (repeatable)")
+    parser.add_argument("--path", action="append", required=True, help="Request path with query (repeatable)")
+    parser.add_argument("--target-p95-ms", type=float, default=100.0)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--max-concurrency", type=int, default=512)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = [
+        asyncio.run(benchmark(url, args.path, args.target_p95_ms, args.duration, args.max_concurrency))
+        for url in args.url
+    ]
+    for result in results:
+        best = result["best_under_target"]
+        summary = f"{best['throughput_rps']:.1f} req/s at c={best['concurrency']}" if best else "target never met"
+        print(f"{result['url']}: {summary} (p95 <= {args.target_p95_ms} ms)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
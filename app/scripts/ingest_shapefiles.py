@@ -0,0 +1,272 @@
+"""
+Loads the census cartographic boundary shapefiles straight from their zips into PostGIS.
+
+Each zip is read member by member with pyshp (nothing is extracted and there is
+no intermediate GeoJSON), converted to EWKB with shapely and streamed into an
+unlogged staging table with a binary COPY. Layers are ingested in parallel
+worker processes, each in a single transaction. The staged rows then either
+replace the whole table (mode="replace": the GIST index is dropped and rebuilt
+once after the insert) or replace only the rows with the same key
+(mode="upsert"), so reruns never duplicate rows.
+
+    python -m app.scripts.ingest_shapefiles --mode upsert --workers 4
+"""
+import argparse
+import io
+import os
+import struct
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import shapefile
+import shapely
+from shapely.geometry import shape as to_shapely
+
+from app.services.database import engine
+
+SHAPEFILES_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "shapefiles")
+
+# Shapefile (zip) name -> target table in the gis schema
+SHAPEFILE_TABLES = {
+    "cb_2023_us_state_500k": "states_table",
+    "cb_2023_us_region_500k": "regions_table",
+    "cb_2023_us_county_500k": "counties_table",
+    "cb_2023_us_place_500k": "city_table",
+    "cb_2020_us_zcta520_500k": "zcta_table",
+}
+
+# Column identifying a feature across reruns, for upserts (geoidfq unless listed)
+KEY_COLUMNS = {"zcta_table": "affgeoid20"}
+
+MODES = ("replace", "upsert")
+MAX_WORKERS = int(os.getenv("SHAPEFILE_INGEST_WORKERS", "4"))
+
+# Features converted to EWKB per vectorized shapely call / rows per COPY chunk
+FEATURE_BATCH_SIZE = 1000
+COPY_BUFFER_SIZE = 1 << 20
+
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_COPY_TRAILER = struct.pack("!h", -1)
+_NULL = struct.pack("!i", -1)
+
+
+def _text(value):
+    return str(value).encode("utf-8")
+
+
+# Binary COPY encoders by information_schema data_type; geometry values arrive as EWKB already
+_ENCODERS = {
+    "character varying": _text,
+    "character": _text,
+    "text": _text,
+    "bigint": lambda value: struct.pack("!q", int(value)),
+    "integer": lambda value: struct.pack("!i", int(value)),
+    "smallint": lambda value: struct.pack("!h", int(value)),
+    "double precision": lambda value: struct.pack("!d", float(value)),
+    "real": lambda value: struct.pack("!f", float(value)),
+    "USER-DEFINED": bytes,
+}
+
+
+def _sql_type(field):
+    # DBF field -> column type for tables the schema does not define (e.g. regions_table)
+    if field.field_type in ("N", "F"):
+        return "DOUBLE PRECISION" if field.decimal else "BIGINT"
+    return "VARCHAR"
+
+
+class _CopyStream(io.RawIOBase):
+    """
+    File-like view over a generator of byte chunks, for cursor.copy_expert.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk)
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _copy_chunks(reader, columns, encoders):
+    """
+    Yields the binary COPY stream for every feature: the listed record columns, then wkb_geometry.
+    """
+    yield _COPY_HEADER
+    field_count = struct.pack("!h", len(columns) + 1)
+    batch = []
+
+    def encode(batch):
+        geometries = [to_shapely(shape.__geo_interface__) if shape.shapeType != shapefile.NULL else None
+                      for shape, _ in batch]
+        wkbs = shapely.to_wkb(shapely.set_srid(geometries, 4326), include_srid=True)
+        out = bytearray()
+        for (_, record), wkb in zip(batch, wkbs):
+            out += field_count
+            for (position, _), encoder in zip(columns, encoders):
+                value = record[position]
+                if value is None or (value == "" and encoder is not _text):
+                    out += _NULL
+                else:
+                    encoded = encoder(value)
+                    out += struct.pack("!i", len(encoded)) + encoded
+            if wkb is None:
+                out += _NULL
+            else:
+                out += struct.pack("!i", len(wkb)) + wkb
+        return bytes(out)
+
+    for shape_record in reader.iterShapeRecords():
+        batch.append((shape_record.shape, shape_record.record))
+        if len(batch) == FEATURE_BATCH_SIZE:
+            yield encode(batch)
+            batch = []
+    if batch:
+        yield encode(batch)
+    yield _COPY_TRAILER
+
+
+def _merge(cur, table, staging, columns, mode):
+    column_list = ", ".join(columns)
+    index = f"{table}_wkb_geometry_geom_idx"
+    if mode == "replace":
+        # Insert without the index and build it once over the final rows
+        cur.execute(f"DROP INDEX IF EXISTS gis.{index}")
+        cur.execute(f"TRUNCATE gis.{table} RESTART IDENTITY")
+        cur.execute(f"INSERT INTO gis.{table} ({column_list}) SELECT {column_list} FROM gis.{staging}")
+        cur.execute(f"CREATE INDEX {index} ON gis.{table} USING GIST (wkb_geometry)")
+    else:
+        key = KEY_COLUMNS.get(table, "geoidfq")
+        # Also clears duplicates left behind by earlier append-only loads
+        cur.execute(f"DELETE FROM gis.{table} AS t USING gis.{staging} AS s WHERE t.{key} = s.{key}")
+        cur.execute(f"INSERT INTO gis.{table} ({column_list}) SELECT {column_list} FROM gis.{staging}")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {index} ON gis.{table} USING GIST (wkb_geometry)")
+    cur.execute(f"ANALYZE gis.{table}")
+
+
+def ingest_shapefile(zip_path, table, mode="replace"):
+    """
+    Load one zipped shapefile into gis.<table> in a single transaction.
+
+    Returns:
+        tuple: (table, rows loaded, seconds taken).
+    """
+    base = os.path.splitext(os.path.basename(zip_path))[0]
+    started = time.perf_counter()
+    conn = engine.raw_connection()
+    try:
+        with zipfile.ZipFile(zip_path) as archive, \
+                archive.open(f"{base}.shp") as shp, archive.open(f"{base}.dbf") as dbf:
+            # No .shx: features are read sequentially, so the index file is never needed
+            reader = shapefile.Reader(shp=shp, dbf=dbf, encoding="utf-8")
+            fields = [field for field in reader.fields if field.name != "DeletionFlag"]
+            cur = conn.cursor()
+
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS gis.{table} (
+                    ogc_fid SERIAL PRIMARY KEY,
+                    {", ".join(f"{field.name.lower()} {_sql_type(field)}" for field in fields)},
+                    wkb_geometry geometry(Geometry, 4326)
+                )
+            """)
+            cur.execute("SELECT column_name, data_type FROM information_schema.columns "
+                        "WHERE table_schema = 'gis' AND table_name = %s", (table,))
+            types = dict(cur.fetchall())
+            columns = [(i, field.name.lower()) for i, field in enumerate(fields) if field.name.lower() in types]
+            skipped = [field.name for field in fields if field.name.lower() not in types]
+            if skipped:
+                print(f"{base}: gis.{table} has no column for {', '.join(skipped)}; skipping them.")
+
+            staging = f"{table}_ingest"
+            names = [name for _, name in columns] + ["wkb_geometry"]
+            cur.execute(f"DROP TABLE IF EXISTS gis.{staging}")
+            cur.execute(f"CREATE UNLOGGED TABLE gis.{staging} (LIKE gis.{table} INCLUDING DEFAULTS)")
+            stream = _CopyStream(_copy_chunks(reader, columns, [_ENCODERS[types[name]] for _, name in columns]))
+            cur.copy_expert(f"COPY gis.{staging} ({', '.join(names)}) FROM STDIN WITH (FORMAT binary)",
+                            stream, size=COPY_BUFFER_SIZE)
+            rows = cur.rowcount
+
+            _merge(cur, table, staging, names, mode)
+            cur.execute(f"DROP TABLE gis.{staging}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return table, rows, time.perf_counter() - started
+
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused after fork
+    engine.dispose(close=False)
+
+
+def ingest_shapefiles(shapefiles_dir=SHAPEFILES_DIR, mode="replace", workers=None, paths=None):
+    """
+    Ingest every mapped cb_*.zip in shapefiles_dir (or just `paths`), one layer per worker process.
+
+    Returns:
+        dict: table -> rows loaded. Raises RuntimeError if any layer failed; the others are still loaded.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    if paths is None:
+        paths = [os.path.join(shapefiles_dir, name) for name in sorted(os.listdir(shapefiles_dir))
+                 if name.startswith("cb_") and name.endswith(".zip")]
+
+    jobs = []
+    for path in paths:
+        base = os.path.splitext(os.path.basename(path))[0]
+        if base not in SHAPEFILE_TABLES:
+            print(f"⚠️  Skipping {path} - no table mapping found.")
+            continue
+        jobs.append((path, SHAPEFILE_TABLES[base]))
+    if not jobs:
+        print("No shapefiles to ingest.")
+        return {}
+
+    workers = min(len(jobs), workers or MAX_WORKERS)
+    print(f"📦 Ingesting {len(jobs)} shapefiles ({mode}) with {workers} workers...")
+    loaded, failed = {}, []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(ingest_shapefile, path, table, mode): path for path, table in jobs}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                table, rows, seconds = future.result()
+            except Exception as e:
+                print(f"❌ Failed to ingest {os.path.basename(path)}: {e}")
+                failed.append(os.path.basename(path))
+                continue
+            loaded[table] = rows
+            print(f"✅ {os.path.basename(path)} → gis.{table}: {rows} rows in {seconds:.2f}s")
+
+    if failed:
+        raise RuntimeError(f"Failed to ingest {', '.join(failed)}")
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="Zips to ingest (default: every mapped zip in the shapefiles dir)")
+    parser.add_argument("--mode", choices=MODES, default="replace")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: SHAPEFILE_INGEST_WORKERS or 4)")
+    args = parser.parse_args()
+    ingest_shapefiles(mode=args.mode, workers=args.workers, paths=args.paths or None)
+
+
+if __name__ == "__main__":
+    main()
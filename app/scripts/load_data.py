@@ -1,7 +1,12 @@
 from app import load_cities_to_redis_from_db
+from app.services.cache import bump_dataset_version, delete_keys
 from app.scripts.load_demographic_data import load_demographic_data
 from app.scripts.load_geographical_data import load_geographical_data
 from app.services.database import get_db
+from app.services.demography_store import DEMOGRAPHY_DATASET
+from app.services.heatmap import GRID_DATASET, HEX_SIZES
+from app.services.spatial_index import BOUNDARIES_DATASET
+from app.utils.geo_utils import GEOMETRY_TIERS
 from sqlalchemy.sql import text
 
 def calculate_centroids_lat_lng():
@@ -25,11 +30,194 @@ def calculate_centroids_lat_lng():
     finally:
         session.close()
 
+# Boundary layers served with simplified geometry tiers, and their source tables
+TIERED_LAYERS = {"states": "states_table", "counties": "counties_table", "cities": "city_table"}
+
+def build_geometry_tiers():
+    session = next(get_db())
+    try:
+        print("Building simplified geometry tiers...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS gis.simplified_boundaries (
+                layer VARCHAR NOT NULL,
+                tier VARCHAR NOT NULL,
+                geoidfq VARCHAR NOT NULL,
+                wkb_geometry geometry(Geometry, 4326),
+                PRIMARY KEY (layer, tier, geoidfq)
+            );
+        """))
+
+        for layer, table in TIERED_LAYERS.items():
+            for tier, tolerance in GEOMETRY_TIERS.items():
+                if tolerance is None:
+                    continue
+                session.execute(
+                    text("DELETE FROM gis.simplified_boundaries WHERE layer = :layer AND tier = :tier"),
+                    {"layer": layer, "tier": tier}
+                )
+                session.execute(text(f"""
+                    INSERT INTO gis.simplified_boundaries (layer, tier, geoidfq, wkb_geometry)
+                    SELECT DISTINCT ON (geoidfq)
+                        :layer, :tier, geoidfq, ST_SimplifyPreserveTopology(wkb_geometry, :tolerance)
+                    FROM gis.{table}
+                    WHERE wkb_geometry IS NOT NULL AND geoidfq IS NOT NULL
+                    ORDER BY geoidfq, ogc_fid DESC;
+                """), {"layer": layer, "tier": tier, "tolerance": tolerance})
+                print(f"Built '{tier}' tier for {layer}.")
+
+        session.commit()
+        # Cached GeoJSON of every tier, search results embedding it and vector tiles may now be stale
+        deleted = (delete_keys("geojson:*") + delete_keys("search:*") + delete_keys("response:*")
+                   + delete_keys("tile:*"))
+        print(f"Geometry tiers built; dropped {deleted} cached GeoJSON entries, responses and tiles.")
+    except Exception as e:
+        session.rollback()
+        print(f"Error building geometry tiers: {e}")
+    finally:
+        session.close()
+
+# Parent layer -> child layer (and their source tables) stored in gis.boundary_hierarchy
+HIERARCHY_LEVELS = (("states", "states_table", "counties", "counties_table"),
+                    ("counties", "counties_table", "cities", "city_table"))
+
+# Overlaps below this share of the child's area are slivers from mismatched edges, not containment
+MIN_OVERLAP_FRACTION = 0.001
+
+def build_boundary_hierarchy():
+    session = next(get_db())
+    try:
+        print("Building boundary hierarchy...")
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS gis.boundary_hierarchy (
+                parent_layer VARCHAR NOT NULL,
+                parent_geoidfq VARCHAR NOT NULL,
+                child_layer VARCHAR NOT NULL,
+                child_geoidfq VARCHAR NOT NULL,
+                child_name VARCHAR,
+                overlap_fraction DOUBLE PRECISION NOT NULL,
+                PRIMARY KEY (parent_geoidfq, child_geoidfq)
+            );
+            CREATE INDEX IF NOT EXISTS boundary_hierarchy_child_idx ON gis.boundary_hierarchy (child_geoidfq);
+        """))
+        session.execute(text("TRUNCATE gis.boundary_hierarchy"))
+
+        for parent_layer, parent_table, child_layer, child_table in HIERARCHY_LEVELS:
+            # A child straddling a boundary gets one row per parent, weighted by overlap
+            session.execute(text(f"""
+                INSERT INTO gis.boundary_hierarchy
+                    (parent_layer, parent_geoidfq, child_layer, child_geoidfq, child_name, overlap_fraction)
+                SELECT :parent_layer, parent_geoidfq, :child_layer, child_geoidfq, child_name, overlap_fraction
+                FROM (
+                    SELECT
+                        parent.geoidfq AS parent_geoidfq,
+                        child.geoidfq AS child_geoidfq,
+                        child.name AS child_name,
+                        CASE
+                            WHEN ST_CoveredBy(child.wkb_geometry, parent.wkb_geometry) THEN 1.0
+                            ELSE ST_Area(ST_Intersection(child.wkb_geometry, parent.wkb_geometry))
+                                 / NULLIF(ST_Area(child.wkb_geometry), 0)
+                        END AS overlap_fraction
+                    FROM (
+                        SELECT DISTINCT ON (geoidfq) geoidfq, wkb_geometry
+                        FROM gis.{parent_table}
+                        WHERE wkb_geometry IS NOT NULL AND geoidfq IS NOT NULL
+                        ORDER BY geoidfq, ogc_fid DESC
+                    ) parent
+                    JOIN (
+                        SELECT DISTINCT ON (geoidfq) geoidfq, name, wkb_geometry
+                        FROM gis.{child_table}
+                        WHERE wkb_geometry IS NOT NULL AND geoidfq IS NOT NULL
+                        ORDER BY geoidfq, ogc_fid DESC
+                    ) child ON ST_Intersects(child.wkb_geometry, parent.wkb_geometry)
+                ) pairs
+                WHERE overlap_fraction >= :min_overlap;
+            """), {"parent_layer": parent_layer, "child_layer": child_layer, "min_overlap": MIN_OVERLAP_FRACTION})
+            print(f"Linked {child_layer} to {parent_layer}.")
+
+        session.commit()
+        session.execute(text("ANALYZE gis.boundary_hierarchy"))
+        # Cached /encompassing_boundaries responses list the old children
+        deleted = delete_keys("response:*")
+        print(f"Boundary hierarchy built; dropped {deleted} cached responses.")
+    except Exception as e:
+        session.rollback()
+        print(f"Error building boundary hierarchy: {e}")
+    finally:
+        session.close()
+
+def build_demography_grid():
+    session = next(get_db())
+    try:
+        print("Building demography heatmap grid...")
+        # Declared in schema.sql; created here too for databases initialised before it was
+        session.execute(text("""
+            CREATE TABLE IF NOT EXISTS gis.demography_grid (
+                resolution SMALLINT NOT NULL,
+                i INTEGER NOT NULL,
+                j INTEGER NOT NULL,
+                geoidfq VARCHAR NOT NULL,
+                lng DOUBLE PRECISION NOT NULL,
+                lat DOUBLE PRECISION NOT NULL,
+                fraction DOUBLE PRECISION NOT NULL,
+                land_m2 DOUBLE PRECISION,
+                PRIMARY KEY (resolution, i, j, geoidfq)
+            );
+        """))
+
+        for resolution, size in enumerate(HEX_SIZES):
+            session.execute(text("DELETE FROM gis.demography_grid WHERE resolution = :resolution"),
+                            {"resolution": resolution})
+            # One row per (hexagon, county) overlap with the share of the county's area in the
+            # hexagon. Counties are split into their parts first so the grid generated for e.g.
+            # the Aleutians covers each island, not a bounding box spanning the antimeridian.
+            session.execute(text("""
+                INSERT INTO gis.demography_grid (resolution, i, j, geoidfq, lng, lat, fraction, land_m2)
+                SELECT :resolution, i, j, geoidfq,
+                       ST_X(ST_Transform(ST_Centroid(cell), 4326)), ST_Y(ST_Transform(ST_Centroid(cell), 4326)),
+                       fraction, fraction * aland
+                FROM (
+                    SELECT h.i, h.j, h.geom AS cell, parts.geoidfq, parts.aland,
+                           sum(CASE
+                               WHEN ST_CoveredBy(parts.part, h.geom) THEN ST_Area(parts.part)
+                               ELSE ST_Area(ST_Intersection(parts.part, h.geom))
+                           END) / max(parts.county_area) AS fraction
+                    FROM (
+                        SELECT geoidfq, aland, ST_Area(geom) AS county_area, (ST_Dump(geom)).geom AS part
+                        FROM (
+                            SELECT DISTINCT ON (geoidfq) geoidfq, aland, ST_Transform(wkb_geometry, 3857) AS geom
+                            FROM gis.counties_table
+                            WHERE wkb_geometry IS NOT NULL AND geoidfq IS NOT NULL
+                            ORDER BY geoidfq, ogc_fid DESC
+                        ) counties
+                    ) parts
+                    CROSS JOIN LATERAL ST_HexagonGrid(:size, parts.part) h
+                    WHERE ST_Intersects(parts.part, h.geom) AND parts.county_area > 0
+                    GROUP BY h.i, h.j, h.geom, parts.geoidfq, parts.aland
+                ) overlaps
+                WHERE fraction > 0;
+            """), {"resolution": resolution, "size": size})
+            print(f"Built heatmap grid resolution {resolution} ({size / 1000:g} km hexagons).")
+
+        session.commit()
+        session.execute(text("ANALYZE gis.demography_grid"))
+        bump_dataset_version(GRID_DATASET)
+        print("Demography heatmap grid built.")
+    except Exception as e:
+        session.rollback()
+        print(f"Error building demography heatmap grid: {e}")
+    finally:
+        session.close()
+
 if __name__ == '__main__':
     load_demographic_data()
+    bump_dataset_version(DEMOGRAPHY_DATASET)
     print("Loaded demographic data")
     load_geographical_data()
+    bump_dataset_version(BOUNDARIES_DATASET)
     print("Loaded geographical data")
     calculate_centroids_lat_lng()
     print("Calculated centroids for all cities...")
+    build_geometry_tiers()
+    build_boundary_hierarchy()
+    build_demography_grid()
     load_cities_to_redis_from_db()
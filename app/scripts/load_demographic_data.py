@@ -1,94 +1,149 @@
 import os
-import pandas as pd
 import subprocess
+import time
 import traceback
-
-from app.models.entities import StateDemography, CountyDemography
-from app.services.database import get_db
-
-session = next(get_db())
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.services.database import engine
+
+# Columns shared by both demography tables, in the order they appear in the CSVs
+METRIC_COLUMNS = [
+    "total_population",
+    "female_population",
+    "median_gross_rent_in_dollars",
+    "median_household_income_past12months",
+    "male_bachelors_degree_25yrs_above",
+    "female_bachelors_degree_25yrs_above",
+]
+STATE_COLUMNS = ["name", "geoidfq"] + METRIC_COLUMNS + ["state"]
+COUNTY_COLUMNS = STATE_COLUMNS + ["county"]
+
+# Target type of each metric; medians fit in INTEGER, counts may not
+METRIC_TYPES = {
+    "total_population": "BIGINT",
+    "female_population": "BIGINT",
+    "median_gross_rent_in_dollars": "INTEGER",
+    "median_household_income_past12months": "INTEGER",
+    "male_bachelors_degree_25yrs_above": "BIGINT",
+    "female_bachelors_degree_25yrs_above": "BIGINT",
+}
+
+YEARS = range(2017, 2024)
+MAX_WORKERS = int(os.getenv("DEMOGRAPHY_LOAD_WORKERS", "4"))
+
+def _numeric_sql(column):
+    # ACS marks missing estimates with negative sentinels (e.g. -666666666); those become NULL
+    return f"CASE WHEN {column}::text ~ '^[0-9]+(\\.[0-9]+)?$' THEN round({column}::text::numeric) END"
+
+def ensure_numeric_columns():
+    """
+    Convert the metric columns of databases created before they were typed from TEXT to numbers.
+    """
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            for table in ("state_demography", "county_demography"):
+                cursor.execute("""
+                    SELECT column_name FROM information_schema.columns
+                    WHERE table_schema = 'gis' AND table_name = %s AND data_type = 'text'
+                """, (table,))
+                text_columns = {row[0] for row in cursor.fetchall()}
+                for column, sql_type in METRIC_TYPES.items():
+                    if column in text_columns:
+                        print(f"Converting gis.{table}.{column} to {sql_type}...")
+                        cursor.execute(
+                            f"ALTER TABLE gis.{table} ALTER COLUMN {column} TYPE {sql_type} USING {_numeric_sql(column)}"
+                        )
+        connection.commit()
+    finally:
+        connection.close()
+
+def _copy_csv(table, columns, csv_file, year):
+    """
+    Stream one CSV into a temp staging table with COPY, then replace that
+    year's rows in the target table with it in a single transaction.
+
+    Returns the number of rows loaded.
+    """
+    column_list = ", ".join(columns)
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TEMP TABLE demography_staging ({", ".join(f"{c} TEXT" for c in columns)})
+                ON COMMIT DROP
+            """)
+            with open(csv_file) as f:
+                cursor.copy_expert(
+                    f"COPY demography_staging ({column_list}) FROM STDIN WITH (FORMAT csv, HEADER true)", f
+                )
+            # Re-running a year replaces it instead of duplicating it
+            cursor.execute(f"DELETE FROM gis.{table} WHERE year = %s", (year,))
+            select_list = ", ".join(_numeric_sql(c) if c in METRIC_TYPES else c for c in columns)
+            cursor.execute(f"""
+                INSERT INTO gis.{table} ({column_list}, year)
+                SELECT {select_list}, %s FROM demography_staging
+            """, (year,))
+            rows = cursor.rowcount
+        connection.commit()
+        return rows
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
 
 def load_state_data(csv_file, year):
-    # Read state data from CSV
-    state_df = pd.read_csv(csv_file)
-
-    for index, row in state_df.iterrows():
-        # Create StateDemography record
-        state_record = StateDemography(
-            name=row['NAME'],
-            geoidfq=row['GEO_ID'],
-            total_population=row['total_population'],
-            female_population=row['female_population'],
-            median_gross_rent_in_dollars=row['median_gross_rent_in_dollars'],
-            median_household_income_past12months=row['median_household_income_past12months'],
-            male_bachelors_degree_25yrs_above=row['male_bachelors_degree_25yrs_above'],
-            female_bachelors_degree_25yrs_above=row['female_bachelors_degree_25yrs_above'],
-            state=row['state'],
-            year=year
-        )
-
-        session.add(state_record)
-    session.commit()
-
+    return _copy_csv("state_demography", STATE_COLUMNS, csv_file, year)
 
 def load_county_data(csv_file, year):
-    # Read county data from CSV
-    county_df = pd.read_csv(csv_file)
-
-    for index, row in county_df.iterrows():
-        # Create CountyDemography record
-        county_record = CountyDemography(
-            name=row['NAME'],
-            geoidfq=row['GEO_ID'],
-            total_population=row['total_population'],
-            female_population=row['female_population'],
-            median_gross_rent_in_dollars=row['median_gross_rent_in_dollars'],
-            median_household_income_past12months=row['median_household_income_past12months'],
-            male_bachelors_degree_25yrs_above=row['male_bachelors_degree_25yrs_above'],
-            female_bachelors_degree_25yrs_above=row['female_bachelors_degree_25yrs_above'],
-            state=row['state'],
-            county=row['county'],
-            year=year
-        )
-
-        session.add(county_record)
-    session.commit()
+    return _copy_csv("county_demography", COUNTY_COLUMNS, csv_file, year)
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused after fork
+    engine.dispose(close=False)
+
+def _load_year(year, state_csv, county_csv):
+    results = []
+    for label, loader, csv_file in (("state", load_state_data, state_csv), ("county", load_county_data, county_csv)):
+        if not os.path.exists(csv_file):
+            continue
+        started = time.perf_counter()
+        rows = loader(csv_file, year)
+        results.append((label, rows, time.perf_counter() - started))
+    return results
 
 def load_data_for_all_years():
-    years = range(2017, 2024)
     base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "./data"))
 
-    for year in years:
+    jobs = {}
+    for year in YEARS:
         state_csv = os.path.join(base_dir, f"{year}_states_demography.csv")
         county_csv = os.path.join(base_dir, f"{year}_counties_demography.csv")
-
-        print(f"\n📅 Processing year {year}...state: {state_csv} county: {county_csv}")
-
-        # Flags for each
-        state_ok = os.path.exists(state_csv)
-        county_ok = os.path.exists(county_csv)
-
-        if not state_ok and not county_ok:
+        if not os.path.exists(state_csv) and not os.path.exists(county_csv):
             print(f"⚠️  No data files found for {year}. Skipping...")
             continue
+        jobs[year] = (state_csv, county_csv)
 
-        if state_ok:
-            try:
-                print(f"📥 Loading state data from {state_csv}")
-                load_state_data(state_csv, year)
-            except Exception as e:
-                print(f"❌ Failed to load state data for {year}: {e}")
-                traceback.print_exc()
+    ensure_numeric_columns()
 
-        if county_ok:
+    started = time.perf_counter()
+    total_rows = 0
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=_init_worker) as pool:
+        futures = {pool.submit(_load_year, year, *csv_files): year for year, csv_files in jobs.items()}
+        for future in as_completed(futures):
+            year = futures[future]
             try:
-                print(f"📥 Loading county data from {county_csv}")
-                load_county_data(county_csv, year)
+                for label, rows, seconds in future.result():
+                    total_rows += rows
+                    print(f"📥 {year} {label}: {rows} rows in {seconds:.2f}s ({rows / seconds:,.0f} rows/s)")
             except Exception as e:
-                print(f"❌ Failed to load county data for {year}: {e}")
+                print(f"❌ Failed to load demographic data for {year}: {e}")
                 traceback.print_exc()
 
-    print("\n✅ Finished processing all available data files.")
+    elapsed = time.perf_counter() - started
+    print(f"\n✅ Finished processing all available data files: {total_rows} rows in {elapsed:.2f}s "
+          f"({total_rows / elapsed:,.0f} rows/s).")
 
 def generate_csv_files():
     print("Generating CSVs using batch_data_from_acs.sh...")
@@ -1,21 +1,11 @@
-import subprocess
-import os
+from app.scripts.ingest_shapefiles import ingest_shapefiles
 
-def load_geographical_data():
-    current_dir = os.path.abspath(os.path.dirname(__file__))
-    script_path = os.path.join(current_dir, "load_shapefiles_into_db.sh")
-
-    print("Running geographical data loader script...\n")
+def load_geographical_data(mode="replace"):
+    print("Loading geographical data from shapefiles...\n")
 
     try:
-        subprocess.run(
-            ["bash", script_path],
-            check=True,
-            stdout=None,
-            stderr=None,
-            text=True
-        )
+        ingest_shapefiles(mode=mode)
         print("\nGeographical data loaded successfully.")
-    except subprocess.CalledProcessError as e:
+    except Exception as e:
         print("\nError while loading geographical data:")
-        print(f"Exit code: {e.returncode}")
+        print(e)
@@ -11,12 +11,12 @@ CREATE TABLE IF NOT EXISTS gis.state_demography (
     id SERIAL PRIMARY KEY,
     name TEXT,
     geoidfq TEXT,
-    total_population TEXT,
-    female_population TEXT,
-    median_gross_rent_in_dollars TEXT,
-    median_household_income_past12months TEXT,
-    male_bachelors_degree_25yrs_above TEXT,
-    female_bachelors_degree_25yrs_above TEXT,
+    total_population BIGINT,
+    female_population BIGINT,
+    median_gross_rent_in_dollars INTEGER,
+    median_household_income_past12months INTEGER,
+    male_bachelors_degree_25yrs_above BIGINT,
+    female_bachelors_degree_25yrs_above BIGINT,
     state TEXT,
     year INTEGER
 );
@@ -34,12 +34,12 @@ CREATE TABLE IF NOT EXISTS gis.county_demography (
     id SERIAL PRIMARY KEY,
     name TEXT,
     geoidfq TEXT,
-    total_population TEXT,
-    female_population TEXT,
-    median_gross_rent_in_dollars TEXT,
-    median_household_income_past12months TEXT,
-    male_bachelors_degree_25yrs_above TEXT,
-    female_bachelors_degree_25yrs_above TEXT,
+    total_population BIGINT,
+    female_population BIGINT,
+    median_gross_rent_in_dollars INTEGER,
+    median_household_income_past12months INTEGER,
+    male_bachelors_degree_25yrs_above BIGINT,
+    female_bachelors_degree_25yrs_above BIGINT,
     state TEXT,
     county TEXT,
     year INTEGER
@@ -136,3 +136,42 @@ CREATE TABLE IF NOT EXISTS gis.zcta_table (
 
 CREATE INDEX IF NOT EXISTS zcta_table_wkb_geometry_geom_idx
 ON gis.zcta_table USING GIST (wkb_geometry);
+
+-- -------------------------------------
+-- Simplified Boundaries (per detail tier)
+-- -------------------------------------
+CREATE TABLE IF NOT EXISTS gis.simplified_boundaries (
+    layer VARCHAR NOT NULL,
+    tier VARCHAR NOT NULL,
+    geoidfq VARCHAR NOT NULL,
+    wkb_geometry geometry(Geometry, 4326),
+    PRIMARY KEY (layer, tier, geoidfq)
+);
+
+CREATE TABLE IF NOT EXISTS gis.boundary_hierarchy (
+    parent_layer VARCHAR NOT NULL,
+    parent_geoidfq VARCHAR NOT NULL,
+    child_layer VARCHAR NOT NULL,
+    child_geoidfq VARCHAR NOT NULL,
+    child_name VARCHAR,
+    overlap_fraction DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (parent_geoidfq, child_geoidfq)
+);
+
+CREATE INDEX IF NOT EXISTS boundary_hierarchy_child_idx ON gis.boundary_hierarchy (child_geoidfq);
+
+-- -------------------------------------
+-- Demography heatmap grid (hexagon/county overlaps per resolution)
+-- -------------------------------------
+-- The primary key leads with resolution, so it also indexes the per-resolution reads and rebuilds
+CREATE TABLE IF NOT EXISTS gis.demography_grid (
+    resolution SMALLINT NOT NULL,
+    i INTEGER NOT NULL,
+    j INTEGER NOT NULL,
+    geoidfq VARCHAR NOT NULL,
+    lng DOUBLE PRECISION NOT NULL,
+    lat DOUBLE PRECISION NOT NULL,
+    fraction DOUBLE PRECISION NOT NULL,
+    land_m2 DOUBLE PRECISION,
+    PRIMARY KEY (resolution, i, j, geoidfq)
+);
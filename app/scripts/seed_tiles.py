@@ -0,0 +1,52 @@
+"""
+Pre-render the low-zoom vector tiles of each layer into Redis, so the first map
+loads never wait on ST_AsMVT over whole-country geometries.
+
+    python -m app.scripts.seed_tiles --layers states,counties --max-zoom 6
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app  # noqa: F401  (initializes the Redis clients)
+from app.services.tiles import TILE_LAYERS, get_tile, tiles_covering
+
+# Continental US, Alaska and Hawaii
+US_BBOX = (-179.2, 18.9, -66.9, 71.4)
+
+
+def seed(layers, min_zoom, max_zoom, bbox, workers):
+    jobs = [(layer, z, x, y)
+            for layer in layers
+            for z in range(min_zoom, max_zoom + 1)
+            for x, y in tiles_covering(bbox, z)]
+    print(f"Seeding {len(jobs)} tiles with {workers} workers...")
+
+    started = time.perf_counter()
+    total_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for tile, _ in pool.map(lambda job: get_tile(*job, refresh=True), jobs):
+            total_bytes += len(tile)
+    elapsed = time.perf_counter() - started
+    print(f"Seeded {len(jobs)} tiles ({total_bytes / 1024 / 1024:.1f} MB) in {elapsed:.1f}s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--layers", default=",".join(TILE_LAYERS), help="Comma-separated layers to seed")
+    parser.add_argument("--min-zoom", type=int, default=0)
+    parser.add_argument("--max-zoom", type=int, default=6)
+    parser.add_argument("--bbox", type=float, nargs=4, default=US_BBOX,
+                        metavar=("MIN_LNG", "MIN_LAT", "MAX_LNG", "MAX_LAT"))
+    parser.add_argument("--workers", type=int, default=4, help="Tiles rendered concurrently")
+    args = parser.parse_args()
+
+    layers = args.layers.split(",")
+    unknown = set(layers) - set(TILE_LAYERS)
+    if unknown:
+        parser.error(f"Unknown layers: {', '.join(sorted(unknown))}")
+    seed(layers, args.min_zoom, args.max_zoom, args.bbox, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Async counterparts of the hot geo endpoints, used by the ASGI serving mode (app/asgi.py).
+
+They share SQL, cache keys and payload shapes with app/services/geospatial.py.
+Redis and Postgres are reached through an asyncio Redis client and an asyncpg
+pool. Anything CPU-bound or still synchronous (the in-memory boundary index,
+cache-miss backfills) runs in the threadpool.
+"""
+import asyncio
+import re
+
+import asyncpg
+import redis.asyncio as aioredis
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from app.config import Config
+from app.services import cache, demography_store, geospatial, response_cache, spatial_index
+from app.services.cache import city_data_key
+from app.services.database import SessionLocal
+from app.utils.geo_utils import FULL_TIER, degree_radius
+from app.utils.json_utils import dumps, loads, fragment
+
+redis_client = None  # Global asyncio Redis client
+pg_pool = None  # Global asyncpg connection pool
+
+NEARBY_PAGE_SQL = f"""
+    SELECT
+        city_table.geoidfq,
+        ST_Distance(city_table.wkb_geometry, ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)) AS distance
+    FROM gis.city_table
+    WHERE {geospatial.NEARBY_CITIES_FILTER}
+    ORDER BY distance
+    OFFSET :offset
+    LIMIT :limit_plus_one
+"""
+
+_BIND_PARAM = re.compile(r"(?<![:\w]):(\w+)")
+
+
+async def init_async_clients():
+    global redis_client, pg_pool
+    print("Initializing async Redis client and Postgres pool..")
+    redis_client = aioredis.Redis(
+        host=Config.REDIS_HOST,
+        port=int(Config.REDIS_PORT),
+        db=0,
+        decode_responses=True
+    )
+    await redis_client.ping()
+    pg_pool = await asyncpg.create_pool(
+        Config.ASYNC_DATABASE_DSN,
+        min_size=Config.ASYNC_PG_POOL_MIN_SIZE,
+        max_size=Config.ASYNC_PG_POOL_MAX_SIZE
+    )
+
+
+async def close_async_clients():
+    if pg_pool is not None:
+        await pg_pool.close()
+    if redis_client is not None:
+        await redis_client.aclose()
+
+
+def _positional(sql, params):
+    """
+    Rewrites SQLAlchemy-style :name binds to asyncpg's $n placeholders.
+    """
+    names = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    return _BIND_PARAM.sub(replace, sql), [params[name] for name in names]
+
+
+def _json_response(payload, status=200):
+    return Response(dumps(payload), status_code=status, media_type="application/json")
+
+
+def _sync_boundary_geojson(layer, geoidfqs, tier):
+    session = SessionLocal()
+    try:
+        return geospatial.get_boundary_geojson(session, layer, geoidfqs, tier)
+    finally:
+        session.close()
+
+
+def _sync_hydrate_cities(city_ids, tier):
+    session = SessionLocal()
+    try:
+        return geospatial.hydrate_cities(session, city_ids, tier)
+    finally:
+        session.close()
+
+
+async def _cached_many(namespace, keys):
+    """
+    Async read of both cache tiers (in-process LRU, then one Redis MGET); negatives count as misses.
+    """
+    found = cache.local_get_many(namespace, keys)
+    pending = [key for key in keys if key not in found]
+    if pending:
+        from_redis = {key: value for key, value in zip(pending, await redis_client.mget(pending)) if value}
+        cache.local_set_many(namespace, from_redis)
+        found.update(from_redis)
+    return {key: value for key, value in found.items() if value != cache.NEGATIVE}
+
+
+async def get_boundary_geojson(layer, geoidfqs, tier=FULL_TIER):
+    """
+    Async read path of geospatial.get_boundary_geojson; misses are loaded by the sync version.
+    """
+    _, key_for = geospatial.BOUNDARY_LAYERS[layer]
+    keys = {geoidfq: key_for(geoidfq, tier) for geoidfq in dict.fromkeys(geoidfqs)}
+    cached = await _cached_many("geojson", list(keys.values())) if keys else {}
+    result = {geoidfq: fragment(cached[key]) for geoidfq, key in keys.items() if key in cached}
+    missing = [geoidfq for geoidfq in keys if geoidfq not in result]
+    if missing:
+        result.update(await run_in_threadpool(_sync_boundary_geojson, layer, missing, tier))
+    return result
+
+
+async def hydrate_cities(city_ids, tier=FULL_TIER):
+    """
+    Async read path of geospatial.hydrate_cities. A page with any miss is handed
+    to the sync version as a whole, which loads the misses through the cache layer.
+    """
+    city_ids = list(city_ids)
+    cached = await _cached_many("city:data", [city_data_key(cid) for cid in city_ids]) if city_ids else {}
+    cities = [loads(cached[city_data_key(cid)]) for cid in city_ids if city_data_key(cid) in cached]
+    if len(cities) < len(city_ids) or not all(geospatial.CITY_PAYLOAD_FIELDS <= city.keys() for city in cities):
+        return await run_in_threadpool(_sync_hydrate_cities, city_ids, tier)
+
+    stats = {"hits": len(city_ids), "misses": 0}
+    cache.record_cache_stats("city:data", **stats)
+    if tier is None:
+        cities = [{k: v for k, v in city.items() if k != "geojson"} for city in cities]
+    elif tier != FULL_TIER:
+        geometries = await get_boundary_geojson("cities", city_ids, tier)
+        cities = [dict(city, geojson=geometries.get(city["geoidfq"])) for city in cities]
+    return cities, stats
+
+
+async def _nearby_city_ids_from_redis(lat, lng, radius, offset, limit, count_mode):
+    """
+    Async counterpart of geospatial._nearby_city_ids_from_redis.
+    """
+    plan, arg = geospatial.plan_nearby_search(lat, lng, radius, offset, limit, count_mode)
+    if plan == "stored":
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.zrange(arg, offset, offset + limit - 1, withscores=True)
+            pipe.zcard(arg)
+            page_rows, total_count = await pipe.execute()
+        if total_count:
+            return page_rows, total_count, offset + limit < total_count
+        plan = "store"
+    if plan == "store":
+        async with redis_client.pipeline(transaction=False) as pipe:
+            geospatial.nearby_store_commands(pipe, arg, lat, lng, radius, offset, limit)
+            total_count, _, page_rows = await pipe.execute()
+        return page_rows, total_count, offset + limit < total_count
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        geospatial.nearby_top_k_commands(pipe, lat, lng, radius, arg, count_mode)
+        rows, *total_count = await pipe.execute()
+    return rows[offset:offset + limit], total_count[0] if total_count else None, len(rows) > offset + limit
+
+
+async def get_nearby_cities_from_redis(lat, lng, radius, page, limit, count_mode="none"):
+    offset = (page - 1) * limit
+    page_rows, total_count, has_more = await _nearby_city_ids_from_redis(lat, lng, radius, offset, limit, count_mode)
+    distances = {geoidfq: distance for geoidfq, distance in page_rows}
+
+    nearby, stats = await hydrate_cities([geoidfq for geoidfq, _ in page_rows])
+    for city_data in nearby:
+        city_data["distance"] = distances[city_data["geoidfq"]]
+
+    payload = geospatial.nearby_page_payload(lat, lng, radius, page, limit, count_mode, nearby, total_count, has_more)
+    payload["cache"] = stats
+    return _json_response(payload)
+
+
+def _resolve_boundaries(lat, lng):
+    state_id, county_id = spatial_index.lookup_point(lat, lng)
+    state = spatial_index.get_boundary("states", state_id) if state_id else None
+    county = spatial_index.get_boundary("counties", county_id) if county_id else None
+    return state, county
+
+
+def _demographics_response(state, county, tier, accept_encoding, if_none_match):
+    def build():
+        return {
+            "state": {
+                "name": state.name,
+                "geography": _sync_boundary_geojson("states", [state.geoidfq], tier)[state.geoidfq],
+                "demographics": demography_store.get_records(state.geoidfq)
+            },
+            "county": {
+                "name": county.name,
+                "geography": _sync_boundary_geojson("counties", [county.geoidfq], tier)[county.geoidfq],
+                "demographics": demography_store.get_records(county.geoidfq)
+            }
+        }
+
+    key = response_cache.response_key("demographics", state.geoidfq, county.geoidfq, tier)
+    return response_cache.cached_response(key, build, accept_encoding, if_none_match)
+
+
+async def fetch_demographics(lat, lng, tier=FULL_TIER, accept_encoding=None, if_none_match=None):
+    if lat is None or lng is None:
+        return _json_response({"error": "lat and lng query parameters are required"}, 400)
+
+    try:
+        state, county = await run_in_threadpool(_resolve_boundaries, lat, lng)
+        if not state:
+            return _json_response({"error": "No state found for given coordinates"}, 404)
+        if not county:
+            return _json_response({"error": "No county found for given coordinates"}, 404)
+
+        # Same cached, precompressed response as the Flask path; only a miss reads any GeoJSON
+        status, body, headers = await run_in_threadpool(
+            _demographics_response, state, county, tier, accept_encoding, if_none_match
+        )
+        return Response(body, status_code=status, media_type="application/json", headers=headers)
+
+    except Exception as e:
+        return _json_response({"error": str(e)}, 500)
+
+
+async def _count_nearby_cities(params, count_mode):
+    """
+    Async counterpart of geospatial._count_nearby_cities.
+    """
+    if count_mode == "none":
+        return None
+    count_sql = geospatial.NEARBY_ESTIMATE_SQL if count_mode == "estimate" else geospatial.NEARBY_COUNT_SQL
+    count_sql, count_args = _positional(count_sql, params)
+    total_count = await pg_pool.fetchval(count_sql, *count_args)
+    if count_mode == "estimate":
+        return int(loads(total_count)[0]["Plan"]["Plan Rows"])
+    return total_count
+
+
+async def fetch_nearby_cities(lat, lng, radius, page, limit, tier=FULL_TIER, count_mode="none"):
+    if count_mode not in geospatial.NEARBY_COUNT_MODES:
+        return _json_response({"error": f"count must be one of {', '.join(geospatial.NEARBY_COUNT_MODES)}"}, 400)
+    params = {"lat": lat, "lng": lng, "radius": radius, "radius_degrees": degree_radius(lat, radius),
+              "offset": (page - 1) * limit, "limit_plus_one": limit + 1}
+    page_sql, page_args = _positional(NEARBY_PAGE_SQL, params)
+
+    total_count, rows = await asyncio.gather(
+        _count_nearby_cities(params, count_mode),
+        pg_pool.fetch(page_sql, *page_args),
+    )
+    page_rows = rows[:limit]
+
+    distances = {row["geoidfq"]: row["distance"] for row in page_rows}
+    nearby, stats = await hydrate_cities([row["geoidfq"] for row in page_rows], tier)
+    for city_data in nearby:
+        city_data["distance"] = distances[city_data["geoidfq"]]
+
+    return _json_response({
+        "latitude": lat, "longitude": lng, "radius": radius,
+        "page": page, "limit": limit,
+        "total_count": total_count, "nearby": nearby,
+        "total_count_estimated": count_mode == "estimate",
+        "total_pages": (total_count + limit - 1) // limit if total_count is not None else None,
+        "has_more": len(rows) > limit,
+        "cache": stats
+    })
+
+
+async def fetch_nearby_cities_keyset(lat, lng, radius, limit, cursor=None, count_mode="none", tier=FULL_TIER):
+    try:
+        after = geospatial.decode_nearby_cursor(cursor) if cursor else None
+    except ValueError as ve:
+        return _json_response({"error": str(ve)}, 400)
+    if count_mode not in geospatial.NEARBY_COUNT_MODES:
+        return _json_response({"error": f"count must be one of {', '.join(geospatial.NEARBY_COUNT_MODES)}"}, 400)
+
+    sql, params = geospatial.nearby_keyset_query(lat, lng, radius, limit, after)
+    page_sql, page_args = _positional(sql, params)
+    rows = await pg_pool.fetch(page_sql, *page_args)
+    page_rows = rows[:limit]
+
+    total_count = await _count_nearby_cities(params, count_mode)
+
+    distances = {row["geoidfq"]: row["distance"] for row in page_rows}
+    nearby, stats = await hydrate_cities([row["geoidfq"] for row in page_rows], tier)
+    for city_data in nearby:
+        city_data["distance"] = distances[city_data["geoidfq"]]
+
+    return _json_response({
+        "latitude": lat, "longitude": lng, "radius": radius,
+        "limit": limit, "nearby": nearby,
+        "next_cursor": geospatial.next_nearby_cursor(rows, limit),
+        "total_count": total_count,
+        "total_count_estimated": count_mode == "estimate",
+        "cache": stats
+    })
+
+
+async def check_redis():
+    try:
+        pong = await redis_client.ping()
+        return {"status": "OK", "ping": pong}
+    except Exception as e:
+        return {"status": "ERROR", "error": str(e)}, 500
+
+
+async def check_db():
+    try:
+        await pg_pool.fetchval("SELECT 1")
+        return {"status": "OK"}
+    except Exception as e:
+        return {"status": "ERROR", "error": str(e)}, 500
@@ -1,53 +1,391 @@
-import redis
+import threading
+import time
+from collections import defaultdict, namedtuple, OrderedDict
+
+import numpy as np
+
+from app.config import Config
+from app.utils import metrics
+from app.utils.geo_utils import geo_scores, GEO_LAT_MIN, GEO_LAT_MAX
 
 redis_client = None  # Global client instance
+binary_redis_client = None  # Same server, without response decoding (vector tiles)
+
+# Cumulative per-namespace hit/miss counters for this process
+_cache_stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+_cache_stats_lock = threading.Lock()
+
+# Cached in place of a value that does not exist (encoded JSON null)
+NEGATIVE = "null"
+
+CacheNamespace = namedtuple("CacheNamespace", ["ttl", "local_ttl", "local_max_bytes", "negative_ttl"])
+
+CACHE_NAMESPACES = {
+    "geojson": CacheNamespace(Config.GEOJSON_TTL, Config.LOCAL_CACHE_TTL,
+                              Config.LOCAL_CACHE_GEOJSON_MB * 1024 * 1024, Config.NEGATIVE_CACHE_TTL),
+    "city:data": CacheNamespace(Config.CITY_DATA_TTL, Config.LOCAL_CACHE_TTL,
+                                Config.LOCAL_CACHE_CITY_DATA_MB * 1024 * 1024, Config.NEGATIVE_CACHE_TTL),
+    # city:data without the geometry, for listings that never return it
+    "city:meta": CacheNamespace(Config.CITY_DATA_TTL, Config.LOCAL_CACHE_TTL,
+                                Config.LOCAL_CACHE_CITY_META_MB * 1024 * 1024, Config.NEGATIVE_CACHE_TTL),
+}
+
+
+class LocalCache:
+    """
+    Thread-safe in-process LRU of encoded values, bounded by total size and per-entry TTL.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self.size -= len(value)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_local_caches = {namespace: LocalCache(ns.local_max_bytes) for namespace, ns in CACHE_NAMESPACES.items()}
+
+# Keys some thread of this process is currently loading -> event set when it is done
+_inflight = {}
+_inflight_lock = threading.Lock()
 
 def init_redis(app):
-    global redis_client
+    global redis_client, binary_redis_client
     print("Initializing Redis..")
-    redis_client = redis.Redis(
+    redis_client = metrics.InstrumentedRedis(
         host=app.config.get("REDIS_HOST", "localhost"),
         port=app.config.get("REDIS_PORT", 6379),
         db=0,
         decode_responses=True
     )
     redis_client.ping()
+    binary_redis_client = metrics.InstrumentedRedis(
+        host=app.config.get("REDIS_HOST", "localhost"),
+        port=app.config.get("REDIS_PORT", 6379),
+        db=0
+    )
+
+CITIES_DATASET = "cities"
+
+# One pass over just the indexed columns; changes whenever any city is added, removed or moved
+CITIES_STAMP_SQL = """
+    SELECT count(*) || ':' || coalesce(md5(string_agg(
+        geoidfq || ':' || centroid_lat::text || ':' || centroid_lon::text, ',' ORDER BY geoidfq
+    )), '')
+    FROM gis.city_table
+    WHERE centroid_lat IS NOT NULL AND centroid_lon IS NOT NULL
+"""
 
-def load_cities_to_redis_from_db():
+def _sync_city_chunk(pipe, geoidfqs, lats, lngs):
+    """
+    Queue GEOADDs for the cities of a chunk whose stored score differs from the DB. Returns their geoidfqs.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    # Redis cannot index the poles; the old loader skipped these too (GEOADD rejects them)
+    valid = (lats >= GEO_LAT_MIN) & (lats <= GEO_LAT_MAX)
+    stored = redis_client.zmscore(cities_geo_index(), geoidfqs)
+    expected = geo_scores(np.where(valid, lats, 0.0), lngs)
+
+    changed = []
+    for geoidfq, lat, lng, ok, old, new in zip(geoidfqs, lats, lngs, valid, stored, expected):
+        if ok and (old is None or float(old) != new):
+            pipe.geoadd(cities_geo_index(), (float(lng), float(lat), geoidfq))
+            changed.append(geoidfq)
+    return changed
+
+def load_cities_to_redis_from_db(force=False):
+    """
+    Sync the cities:geo index with the city centroids in the DB.
+
+    Skipped entirely when the DB's stamp (row count + digest of the indexed
+    columns) matches the one stored with the index. Otherwise (geoidfq, lat,
+    lon) rows are streamed with a server-side cursor, only cities whose Redis
+    score differs are re-added, cities gone from the DB are removed, and the
+    cached payloads of every touched city are dropped.
+
+    Args:
+        force (bool): Compare every city even if the stamps match.
+
+    Returns:
+        int: Number of cities in the index.
+    """
+    from sqlalchemy import select, text
     from app.services.database import SessionLocal
     from app.models.entities import City
 
+    CHUNK_SIZE = 5000
+    stamp_key = dataset_stamp_key(CITIES_DATASET)
     session = SessionLocal()
     try:
-        cities = session.query(City).filter(
-            City.centroid_lat.isnot(None),
-            City.centroid_lon.isnot(None)
-        ).all()
-
-        CHUNK_SIZE = 1000
-        for i in range(0, len(cities), CHUNK_SIZE):
-            pipe = redis_client.pipeline()
-            for city in cities[i:i + CHUNK_SIZE]:
-                try:
-                    lon = float(city.centroid_lon)
-                    lat = float(city.centroid_lat)
-                    pipe.geoadd("cities:geo", (lon, lat, city.geoidfq))
-                except (TypeError, ValueError):
-                    continue
+        stamp = session.execute(text(CITIES_STAMP_SQL)).scalar()
+        if not force and stamp == redis_client.get(stamp_key) and redis_client.exists(cities_geo_index()):
+            total = redis_client.zcard(cities_geo_index())
+            print(f"City index up to date ({total} cities); skipping load.")
+            return total
+
+        rows = session.execute(
+            select(City.geoidfq, City.centroid_lat, City.centroid_lon).where(
+                City.centroid_lat.isnot(None),
+                City.centroid_lon.isnot(None)
+            ).execution_options(yield_per=CHUNK_SIZE)
+        )
+        seen = set()
+        changed = []
+        for chunk in rows.partitions():
+            geoidfqs = [geoidfq for geoidfq, _, _ in chunk]
+            seen.update(geoidfqs)
+            pipe = redis_client.pipeline(transaction=False)
+            changed += _sync_city_chunk(pipe, geoidfqs, [lat for _, lat, _ in chunk], [lon for _, _, lon in chunk])
             pipe.execute()
-        print(f"Loaded {len(cities)} cities into Redis.")
-        return len(cities)
+
+        removed = [geoidfq for geoidfq, _ in redis_client.zscan_iter(cities_geo_index(), count=CHUNK_SIZE)
+                   if geoidfq not in seen]
+        for i in range(0, len(removed), CHUNK_SIZE):
+            redis_client.zrem(cities_geo_index(), *removed[i:i + CHUNK_SIZE])
+        stale = changed + removed
+        for i in range(0, len(stale), CHUNK_SIZE):
+            redis_client.unlink(*[key for geoidfq in stale[i:i + CHUNK_SIZE]
+                                  for key in (city_data_key(geoidfq), city_meta_key(geoidfq))])
+        if stale:
+            # Stored GEOSEARCH results of hot centers may list moved or removed cities
+            delete_keys("nearby:*")
+
+        redis_client.set(stamp_key, stamp)
+        total = redis_client.zcard(cities_geo_index())
+        print(f"Synced {total} cities into Redis: {len(changed)} added or moved, {len(removed)} removed.")
+        return total
     finally:
         session.close()
 
 def city_data_key(geoidfq):
     return f"city:data:{geoidfq}"
 
-def geojson_state_key(geoidfq):
-    return f"geojson:state:{geoidfq}"
+def city_meta_key(geoidfq):
+    return f"city:meta:{geoidfq}"
+
+def _geojson_key(kind, geoidfq, tier):
+    # Full-resolution keys keep their original, tier-less names
+    if tier == "full":
+        return f"geojson:{kind}:{geoidfq}"
+    return f"geojson:{kind}:{geoidfq}:{tier}"
+
+def geojson_state_key(geoidfq, tier="full"):
+    return _geojson_key("state", geoidfq, tier)
+
+def geojson_county_key(geoidfq, tier="full"):
+    return _geojson_key("county", geoidfq, tier)
 
-def geojson_county_key(geoidfq):
-    return f"geojson:county:{geoidfq}"
+def geojson_city_key(geoidfq, tier="full"):
+    return _geojson_key("city", geoidfq, tier)
+
+def geojson_zcta_key(geoidfq, tier="full"):
+    return _geojson_key("zcta", geoidfq, tier)
 
 def cities_geo_index():
     return "cities:geo"
+
+def nearby_results_key(lat, lng, radius):
+    return f"nearby:{lat:.6f}:{lng:.6f}:{radius:g}"
+
+def dataset_version_key(dataset):
+    return f"dataset:version:{dataset}"
+
+def dataset_stamp_key(dataset):
+    return f"dataset:stamp:{dataset}"
+
+def get_dataset_version(dataset):
+    return redis_client.get(dataset_version_key(dataset))
+
+def bump_dataset_version(dataset):
+    """
+    Mark a dataset as reloaded so every process holding derived in-memory state rebuilds it.
+    """
+    return redis_client.incr(dataset_version_key(dataset))
+
+def delete_keys(pattern):
+    """
+    Delete every key matching a glob pattern, in batches. Returns the number deleted.
+    """
+    deleted = 0
+    batch = []
+    for key in redis_client.scan_iter(match=pattern, count=1000):
+        batch.append(key)
+        if len(batch) >= 1000:
+            deleted += redis_client.unlink(*batch)
+            batch = []
+    if batch:
+        deleted += redis_client.unlink(*batch)
+    return deleted
+
+def local_get_many(namespace, keys):
+    """
+    Read keys from the in-process tier only. Returns key -> value for the ones present (negatives included).
+    """
+    local = _local_caches[namespace]
+    found = {}
+    for key in keys:
+        value = local.get(key)
+        if value is not None:
+            found[key] = value
+    return found
+
+def local_set_many(namespace, values):
+    local = _local_caches[namespace]
+    ttl = CACHE_NAMESPACES[namespace].local_ttl
+    for key, value in values.items():
+        local.set(key, value, ttl)
+
+def get_many(namespace, ids, key_for, loader, is_valid=None):
+    """
+    Two-tier cached lookup: in-process LRU, then Redis (one MGET), then `loader`.
+
+    Concurrent misses for the same key within this process are coalesced: one
+    thread runs the loader, the others wait for its result (and fall back to Redis,
+    then their own load, if it never reaches the local tier). Ids the loader does
+    not return are cached as negatives for the namespace's negative TTL.
+
+    Args:
+        namespace (str): Key of CACHE_NAMESPACES.
+        ids (list): Ids to look up.
+        key_for (callable): id -> Redis key.
+        loader (callable): list of missing ids -> {id: encoded value}.
+        is_valid (callable): Optional check on cached values; failing ones are reloaded.
+
+    Returns:
+        tuple[dict, dict]: id -> encoded value for the ids that exist, and this call's
+        {"hits": n, "misses": m} counts.
+    """
+    ns = CACHE_NAMESPACES[namespace]
+    keys = {cid: key_for(cid) for cid in dict.fromkeys(ids)}
+    counts = {"local_hits": 0, "hits": 0, "misses": 0, "negative_hits": 0, "coalesced": 0}
+
+    def usable(value):
+        return value is not None and (value == NEGATIVE or is_valid is None or is_valid(value))
+
+    values = {}
+    with metrics.stage("cache_local"):
+        local = local_get_many(namespace, keys.values())
+    for cid, key in keys.items():
+        if usable(local.get(key)):
+            values[cid] = local[key]
+    counts["local_hits"] = len(values)
+
+    pending = [cid for cid in keys if cid not in values]
+    if pending:
+        cached = redis_client.mget([keys[cid] for cid in pending])
+        from_redis = {cid: value for cid, value in zip(pending, cached) if usable(value)}
+        local_set_many(namespace, {keys[cid]: value for cid, value in from_redis.items()})
+        values.update(from_redis)
+        counts["hits"] = len(from_redis)
+
+    missing = [cid for cid in keys if cid not in values]
+    owned, waiting = [], []
+    with _inflight_lock:
+        for cid in missing:
+            event = _inflight.get(keys[cid])
+            if event is None:
+                _inflight[keys[cid]] = threading.Event()
+                owned.append(cid)
+            else:
+                waiting.append((cid, event))
+
+    def load(cids):
+        with metrics.stage("cache_load"):
+            loaded = loader(cids)
+        fresh = {cid: loaded.get(cid) or NEGATIVE for cid in cids}
+        pipe = redis_client.pipeline(transaction=False)
+        for cid, value in fresh.items():
+            pipe.set(keys[cid], value, ex=ns.negative_ttl if value == NEGATIVE else ns.ttl)
+        pipe.execute()
+        local_set_many(namespace, {keys[cid]: value for cid, value in fresh.items()})
+        values.update(fresh)
+        counts["misses"] += len(cids)
+
+    try:
+        if owned:
+            load(owned)
+    finally:
+        with _inflight_lock:
+            for cid in owned:
+                _inflight.pop(keys[cid]).set()
+
+    unresolved = []
+    for cid, event in waiting:
+        event.wait(Config.CACHE_LOAD_TIMEOUT)
+        value = _local_caches[namespace].get(keys[cid])
+        if usable(value):
+            values[cid] = value
+            counts["coalesced"] += 1
+        else:
+            unresolved.append(cid)
+    if unresolved:
+        # The owner's loader failed, or its value was evicted from (or too big for) the local tier
+        cached = redis_client.mget([keys[cid] for cid in unresolved])
+        from_redis = {cid: value for cid, value in zip(unresolved, cached) if usable(value)}
+        values.update(from_redis)
+        counts["hits"] += len(from_redis)
+        unresolved = [cid for cid in unresolved if cid not in from_redis]
+        if unresolved:
+            load(unresolved)
+
+    counts["negative_hits"] = sum(1 for value in values.values() if value == NEGATIVE)
+    record_cache_stats(namespace, **counts)
+    stats = {"hits": counts["local_hits"] + counts["hits"] + counts["coalesced"], "misses": counts["misses"]}
+    return {cid: value for cid, value in values.items() if value != NEGATIVE}, stats
+
+def record_cache_stats(namespace, hits, misses, **counts):
+    metrics.record_cache_lookups(namespace, hits=hits, misses=misses, **counts)
+    with _cache_stats_lock:
+        _cache_stats[namespace]["hits"] += hits
+        _cache_stats[namespace]["misses"] += misses
+        for name, count in counts.items():
+            _cache_stats[namespace][name] = _cache_stats[namespace].get(name, 0) + count
+
+def get_cache_stats():
+    with _cache_stats_lock:
+        stats = {namespace: dict(counts) for namespace, counts in _cache_stats.items()}
+    for counts in stats.values():
+        hits = counts["hits"] + counts.get("local_hits", 0) + counts.get("coalesced", 0)
+        lookups = hits + counts["misses"]
+        counts["hit_ratio"] = hits / lookups if lookups else None
+    for namespace, local in _local_caches.items():
+        stats.setdefault(namespace, {"hits": 0, "misses": 0, "hit_ratio": None})
+        stats[namespace]["local_entries"] = len(local)
+        stats[namespace]["local_bytes"] = local.size
+        stats[namespace]["local_max_bytes"] = local.max_bytes
+    return stats
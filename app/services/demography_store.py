@@ -0,0 +1,323 @@
+import threading
+import time
+
+import numpy as np
+
+from app.config import Config
+from app.services import cache
+from app.services.database import SessionLocal
+from app.models.entities import StateDemography, CountyDemography
+from app.utils.geo_utils import layer_for_geoidfq
+
+DEMOGRAPHY_DATASET = "demography"
+
+METRICS = (
+    "total_population",
+    "female_population",
+    "median_gross_rent_in_dollars",
+    "median_household_income_past12months",
+    "male_bachelors_degree_25yrs_above",
+    "female_bachelors_degree_25yrs_above",
+)
+
+# Counts can be apportioned to part of a county; medians can only be combined as weighted averages
+COUNT_METRICS = (
+    "total_population",
+    "female_population",
+    "male_bachelors_degree_25yrs_above",
+    "female_bachelors_degree_25yrs_above",
+)
+MEDIAN_METRICS = ("median_gross_rent_in_dollars", "median_household_income_past12months")
+
+WEIGHTINGS = ("area", "population")
+
+LEVELS = {"states": StateDemography, "counties": CountyDemography}
+
+
+def _json_number(value):
+    if not np.isfinite(value):
+        return None
+    return int(value) if float(value).is_integer() else float(value)
+
+
+class DemographyTable:
+    """
+    Columnar, NumPy-backed copy of one demography table, keyed by (geoidfq, year).
+
+    Metrics are float64 arrays with NaN for missing estimates.
+    """
+
+    def __init__(self, columns):
+        self.columns = {name: np.asarray(values, dtype=object) for name, values in columns.items()
+                        if name not in METRICS}
+        self.metrics = {name: np.asarray(columns[name], dtype=np.float64) for name in METRICS}
+        self.geoidfq = self.columns["geoidfq"]
+        self.year = np.asarray(columns["year"], dtype=np.int32)
+        self.years = sorted(set(self.year.tolist()))
+
+        # Row positions per geoidfq, ordered by year
+        order = np.lexsort((self.year, self.geoidfq.astype(str)))
+        self.rows_by_geoidfq = {}
+        for position in order:
+            self.rows_by_geoidfq.setdefault(self.geoidfq[position], []).append(position)
+        self.row_by_key = {(self.geoidfq[i], int(self.year[i])): i for i in range(len(self.year))}
+        self._sorted = {}
+
+    def __len__(self):
+        return len(self.year)
+
+    def record(self, position):
+        record = {name: values[position] for name, values in self.columns.items()}
+        record["year"] = int(self.year[position])
+        record.update({name: _json_number(values[position]) for name, values in self.metrics.items()})
+        return record
+
+    def records(self, geoidfq):
+        """
+        Every year of one geography as plain dicts (the shape /demographics returns).
+        """
+        return [self.record(position) for position in self.rows_by_geoidfq.get(geoidfq, [])]
+
+    def year_or_latest(self, year=None):
+        """
+        The requested year, or the latest loaded one. Raises LookupError when nothing is loaded.
+        """
+        if not self.years:
+            raise LookupError("No demographics have been loaded")
+        return year or self.years[-1]
+
+    def year_mask(self, year, state=None):
+        mask = self.year == year
+        if state is not None and "state" in self.columns:
+            mask &= self.columns["state"] == state
+        return mask
+
+    def sorted_values(self, metric, year):
+        """
+        Sorted non-missing values of a metric in one year, cached for percentile lookups.
+        """
+        key = (metric, year)
+        if key not in self._sorted:
+            values = self.metrics[metric][self.year == year]
+            self._sorted[key] = np.sort(values[~np.isnan(values)])
+        return self._sorted[key]
+
+
+class DemographyStore:
+    def __init__(self, tables, version):
+        self.tables = tables
+        self.version = version
+        self.checked_at = time.monotonic()
+
+
+_store = None
+_lock = threading.Lock()
+
+
+def load_table(session, model):
+    table = model.__table__
+    rows = session.execute(table.select()).all()
+    columns = {}
+    for column in table.columns:
+        values = [getattr(row, column.name) for row in rows]
+        if column.name in METRICS:
+            values = [np.nan if value is None else value for value in values]
+        columns[column.name] = values
+    return DemographyTable(columns)
+
+
+def build_demography_store():
+    """
+    Read both demography tables once into columnar arrays.
+    """
+    version = cache.get_dataset_version(DEMOGRAPHY_DATASET)
+    session = SessionLocal()
+    try:
+        store = DemographyStore({level: load_table(session, model) for level, model in LEVELS.items()}, version)
+    finally:
+        session.close()
+    print(f"Built demography store: {len(store.tables['states'])} state rows, "
+          f"{len(store.tables['counties'])} county rows.")
+    return store
+
+
+def _is_stale(store):
+    now = time.monotonic()
+    if now - store.checked_at < Config.DEMOGRAPHY_STORE_CHECK_INTERVAL:
+        return False
+    store.checked_at = now
+    return cache.get_dataset_version(DEMOGRAPHY_DATASET) != store.version
+
+
+def get_demography_store():
+    """
+    Return the process-wide store, loading it on first use and reloading it
+    whenever the demography dataset version changes.
+    """
+    global _store
+    store = _store
+    if store is not None and not _is_stale(store):
+        return store
+    with _lock:
+        if _store is store:  # nobody reloaded it while we waited for the lock
+            _store = build_demography_store()
+        return _store
+
+
+def get_table(level):
+    return get_demography_store().tables[level]
+
+
+def level_for_geoidfq(geoidfq):
+    level = layer_for_geoidfq(geoidfq)
+    if level in LEVELS:
+        return level
+    raise ValueError("geoidfq must identify a state (0400000US..) or a county (0500000US..)")
+
+
+def _validate(level=None, metric=None):
+    if level is not None and level not in LEVELS:
+        raise ValueError(f"Invalid level. Must be one of {', '.join(LEVELS)}.")
+    if metric is not None and metric not in METRICS:
+        raise ValueError(f"Invalid metric. Must be one of {', '.join(METRICS)}.")
+
+
+def get_records(geoidfq):
+    """
+    All years of demographics for a state or county geoidfq.
+    """
+    return get_table(level_for_geoidfq(geoidfq)).records(geoidfq)
+
+
+def rank(level, metric, year=None, order="desc", limit=10, state=None):
+    """
+    Top geographies by a metric in one year (latest year by default), optionally within one state.
+    """
+    _validate(level, metric)
+    if order not in ("asc", "desc"):
+        raise ValueError("Invalid order. Must be 'asc' or 'desc'.")
+    table = get_table(level)
+    year = table.year_or_latest(year)
+
+    positions = np.flatnonzero(table.year_mask(year, state) & ~np.isnan(table.metrics[metric]))
+    values = table.metrics[metric][positions]
+    ordering = np.argsort(-values if order == "desc" else values, kind="stable")[:limit]
+    return {
+        "level": level, "metric": metric, "year": year, "order": order, "state": state,
+        "total": int(len(positions)),
+        "results": [{
+            "rank": i + 1,
+            "geoidfq": table.geoidfq[positions[j]],
+            "name": table.columns["name"][positions[j]],
+            "value": _json_number(values[j]),
+        } for i, j in enumerate(ordering)]
+    }
+
+
+def percentile(geoidfq, metric, year=None):
+    """
+    Percentile rank of one geography's metric among all geographies of its level in that year.
+    """
+    _validate(metric=metric)
+    table = get_table(level_for_geoidfq(geoidfq))
+    year = table.year_or_latest(year)
+    position = table.row_by_key.get((geoidfq, year))
+    if position is None:
+        raise LookupError(f"No demographics for {geoidfq} in {year}")
+
+    value = table.metrics[metric][position]
+    if np.isnan(value):
+        return {"geoidfq": geoidfq, "metric": metric, "year": year, "value": None, "percentile": None}
+    values = table.sorted_values(metric, year)
+    below_or_equal = np.searchsorted(values, value, side="right")
+    return {
+        "geoidfq": geoidfq, "metric": metric, "year": year,
+        "value": _json_number(value),
+        "percentile": float(100.0 * below_or_equal / len(values)),
+        "rank": int(len(values) - below_or_equal + 1),
+        "out_of": int(len(values)),
+    }
+
+
+def time_series(geoidfq, metric):
+    """
+    A metric for one geography across every loaded year, with year-over-year change.
+    """
+    _validate(metric=metric)
+    table = get_table(level_for_geoidfq(geoidfq))
+    positions = table.rows_by_geoidfq.get(geoidfq)
+    if not positions:
+        raise LookupError(f"No demographics for {geoidfq}")
+
+    years = table.year[positions]
+    values = table.metrics[metric][positions]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        changes = np.concatenate(([np.nan], np.diff(values) / values[:-1] * 100.0))
+    return {
+        "geoidfq": geoidfq, "metric": metric,
+        "series": [{
+            "year": int(year),
+            "value": _json_number(value),
+            "change_pct": _json_number(change),
+        } for year, value, change in zip(years, values, changes)]
+    }
+
+
+def _weighted_median(values, weights):
+    order = np.argsort(values, kind="stable")
+    cumulative = np.cumsum(weights[order])
+    return values[order][np.searchsorted(cumulative, cumulative[-1] / 2)]
+
+
+def aggregate_counties(geoidfqs, fractions, areas, weighting="area", year=None):
+    """
+    Demographics of an area made up of (parts of) counties, per year.
+
+    Counts are apportioned by the fraction of each county's area that lies in
+    the area, i.e. assuming uniform density within a county. Median metrics are
+    combined as a weighted median and mean of the county values, weighted by the
+    county area inside ("area") or by the apportioned population ("population").
+
+    Args:
+        geoidfqs (list): County geoidfqs.
+        fractions (list): Fraction (0..1] of each county's area inside the area.
+        areas (list): Each county's area inside the area (any unit).
+        weighting (str): "area" or "population".
+        year (int): Only this year; every loaded year by default.
+
+    Returns:
+        list[dict]: One entry per year.
+    """
+    if weighting not in WEIGHTINGS:
+        raise ValueError(f"Invalid weighting. Must be one of {', '.join(WEIGHTINGS)}.")
+    table = get_table("counties")
+    if year is not None and year not in table.years:
+        raise LookupError(f"No county demographics for {year}")
+    fractions = np.asarray(fractions, dtype=np.float64)
+    areas = np.asarray(areas, dtype=np.float64)
+
+    results = []
+    for current in table.years if year is None else [year]:
+        positions = np.array([table.row_by_key.get((geoidfq, current), -1) for geoidfq in geoidfqs], dtype=np.int64)
+        present = positions >= 0
+        rows, share = positions[present], fractions[present]
+        entry = {"year": int(current), "counties": int(present.sum())}
+
+        for metric in COUNT_METRICS:
+            values = table.metrics[metric][rows] * share
+            known = ~np.isnan(values)
+            entry[metric] = _json_number(np.rint(values[known].sum())) if known.any() else None
+
+        weights = areas[present] if weighting == "area" else table.metrics["total_population"][rows] * share
+        for metric in MEDIAN_METRICS:
+            values = table.metrics[metric][rows]
+            known = ~np.isnan(values) & (weights > 0)
+            if not known.any():
+                entry[metric] = None
+                continue
+            entry[metric] = {
+                "weighted_median": _json_number(_weighted_median(values[known], weights[known])),
+                "weighted_mean": _json_number(np.average(values[known], weights=weights[known])),
+            }
+        results.append(entry)
+    return results
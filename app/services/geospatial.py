@@ -1,406 +1,867 @@
-import json
+import math
+import threading
+import time
+
+import numpy as np
+import shapely
 from flask import jsonify
-from sqlalchemy import text, or_
-from geoalchemy2.functions import ST_Distance, ST_SetSRID, ST_GeomFromText, ST_Within, ST_Contains
+from sqlalchemy import text
+from geoalchemy2.functions import ST_Distance, ST_SetSRID, ST_GeomFromText
 
-from app.services import cache
-from app.services.cache import city_data_key, cities_geo_index
+from app.config import Config
+from app.services import cache, demography_store, response_cache, search_index, spatial_index
+from app.services.cache import city_data_key, city_meta_key, cities_geo_index, nearby_results_key, geojson_state_key, geojson_county_key, \
+    geojson_city_key, geojson_zcta_key
 from app.services.database import get_db, SessionLocal
-from app.models.entities import City, County, State, StateDemography, CountyDemography
-from app.utils.geo_utils import to_geojson_from_wkb
+from app.models.entities import City, County, State, ZCTA, SimplifiedBoundary, BoundaryHierarchy
+from app.utils.geo_utils import to_geojson, to_geojson_from_wkb, haversine_meters, degree_radius, \
+    layer_for_geoidfq, FULL_TIER
+from app.utils import metrics
+from app.utils.json_utils import dumps, loads, fragment, json_response
+from app.utils.pagination import encode_cursor, decode_cursor
+
+BOUNDARY_LAYERS = {
+    "states": (State, geojson_state_key),
+    "counties": (County, geojson_county_key),
+    "cities": (City, geojson_city_key),
+    "zctas": (ZCTA, geojson_zcta_key),
+}
+
+def _load_boundary_geojson(db, layer, geoidfqs, tier):
+    model, _ = BOUNDARY_LAYERS[layer]
+    if tier != FULL_TIER:
+        rows = db.query(SimplifiedBoundary.geoidfq, SimplifiedBoundary.wkb_geometry).filter(
+            SimplifiedBoundary.layer == layer,
+            SimplifiedBoundary.tier == tier,
+            SimplifiedBoundary.geoidfq.in_(geoidfqs)
+        ).all()
+        with metrics.stage("geojson"):
+            return {geoidfq: dumps(to_geojson_from_wkb(geometry)) for geoidfq, geometry in rows}
+    if layer in ("states", "counties"):
+        # Already decoded in the in-memory boundary index; no need to go back to the DB
+        fresh = {}
+        for geoidfq in geoidfqs:
+            boundary = spatial_index.get_boundary(layer, geoidfq)
+            if boundary is not None:
+                fresh[geoidfq] = dumps(to_geojson(boundary.geometry))
+        return fresh
+    rows = db.query(model.geoidfq, model.wkb_geometry).filter(model.geoidfq.in_(geoidfqs)).all()
+    with metrics.stage("geojson"):
+        return {geoidfq: dumps(to_geojson_from_wkb(geometry)) for geoidfq, geometry in rows}
+
+def get_boundary_geojson(db, layer, geoidfqs, tier=FULL_TIER):
+    """
+    Fetch GeoJSON geometries of one boundary layer at a detail tier, cached per tier.
+
+    Goes through the two-tier "geojson" cache (cache.get_many). Misses come from
+    the precomputed gis.simplified_boundaries tier (or the full-resolution source
+    for the full tier).
+
+    Args:
+        layer (str): 'states', 'counties', 'cities' or 'zctas'.
+        geoidfqs (list[str]): Boundaries to fetch.
+        tier (str): One of GEOMETRY_TIERS.
 
-def search_boundaries_service(boundary_type: str, query: str):
+    Returns:
+        dict: geoidfq -> GeoJSON geometry as an already-encoded orjson.Fragment.
     """
-    Search for states or counties by name or geo_id, including geometry, with caching.
+    _, key_for = BOUNDARY_LAYERS[layer]
+    geoidfqs = list(dict.fromkeys(geoidfqs))
+    if not geoidfqs:
+        return {}
+    found, _ = cache.get_many(
+        "geojson", geoidfqs, lambda geoidfq: key_for(geoidfq, tier),
+        lambda missing: _load_boundary_geojson(db, layer, missing, tier)
+    )
+    result = {geoidfq: fragment(encoded) for geoidfq, encoded in found.items()}
+
+    # Tiers not built for these boundaries (negatively cached): serve them at full resolution instead
+    unbuilt = [geoidfq for geoidfq in geoidfqs if geoidfq not in result]
+    if unbuilt and tier != FULL_TIER:
+        result.update(get_boundary_geojson(db, layer, unbuilt, FULL_TIER))
+    return result
+
+def search_boundaries_service(boundary_type: str, query: str, tier: str = FULL_TIER):
+    """
+    Search for states or counties by name or geo_id, including geometry.
+
+    Matches come from the in-memory search index; geometries from the per-boundary GeoJSON cache.
 
     Args:
         boundary_type (str): 'states' or 'counties'.
         query (str): Search query.
+        tier (str): Geometry detail tier of the returned boundaries.
 
     Returns:
-        list[dict]: List of matched boundaries with name, geo_id and geometry.
+        list: Matched boundaries with name, geo_id and geometry.
     """
-    redis_client = cache.redis_client
-    query = query.lower()  # normalize input
+    if boundary_type not in ('states', 'counties'):
+        raise ValueError("Invalid boundaryType. Must be 'states' or 'counties'.")
 
-    # Define cache key using boundary type and query
-    cache_key = f"search:{boundary_type}:{query}"
+    matches = search_index.get_search_index().substring_search(query, [boundary_type])
+    with next(get_db()) as db:
+        geometries = get_boundary_geojson(db, boundary_type, [entry.geoidfq for entry in matches], tier)
+    return [{"name": entry.name, "geo_id": entry.geoid, "geometry": geometries.get(entry.geoidfq)}
+            for entry in matches]
 
-    # Try to get cached data
-    cached_results = redis_client.get(cache_key)
-    if cached_results:
-        # If cache is found, return it
-        return json.loads(cached_results)
+def fetch_boundary_geometries(geoidfqs, tier=FULL_TIER):
+    """
+    GeoJSON geometries for any mix of state, county, city and ZCTA geoidfqs, e.g. autocomplete picks.
 
-    # If no cache, query the database
-    db = next(get_db())
+    Returns:
+        dict: geoidfq -> geometry (None for unknown geoidfqs).
+    """
+    by_layer = {}
+    for geoidfq in geoidfqs:
+        layer = layer_for_geoidfq(geoidfq)
+        if layer is None:
+            raise ValueError(f"Unrecognised geoidfq: {geoidfq}")
+        by_layer.setdefault(layer, []).append(geoidfq)
+
+    geometries = dict.fromkeys(geoidfqs)
+    with next(get_db()) as db:
+        for layer, layer_geoidfqs in by_layer.items():
+            geometries.update(get_boundary_geojson(db, layer, layer_geoidfqs, tier))
+    return geometries
+
+# Fields every cached city:data payload carries, whichever endpoint wrote it
+CITY_PAYLOAD_FIELDS = {"name", "geoidfq", "state_name", "aland", "lat", "lng", "geojson"}
+
+def _city_payload(city):
+    return {
+        "name": city.name,
+        "geoidfq": city.geoidfq,
+        "state_name": city.state_name,
+        "aland": city.aland,
+        "lat": city.centroid_lat,
+        "lng": city.centroid_lon,
+        "geojson": to_geojson_from_wkb(city.wkb_geometry)
+    }
+
+def _is_current_city_payload(encoded):
+    # Entries written before the payload was unified may lack some fields
+    return CITY_PAYLOAD_FIELDS <= loads(encoded).keys()
+
+def _load_city_payloads(db, city_ids):
+    cities = db.query(City).filter(City.geoidfq.in_(city_ids)).all()
+    with metrics.stage("geojson"):
+        return {city.geoidfq: dumps(_city_payload(city)) for city in cities}
+
+def _load_city_metadata(db, city_ids):
+    rows = db.query(City.name, City.geoidfq, City.state_name, City.aland, City.centroid_lat, City.centroid_lon) \
+        .filter(City.geoidfq.in_(city_ids)).all()
+    return {row.geoidfq: dumps({
+        "name": row.name, "geoidfq": row.geoidfq, "state_name": row.state_name,
+        "aland": row.aland, "lat": row.centroid_lat, "lng": row.centroid_lon
+    }) for row in rows}
+
+def city_metadata(db, city_ids):
+    """
+    City payloads without the geometry, through the "city:meta" cache: misses
+    read only the scalar columns, never wkb_geometry.
 
-    if boundary_type == 'states':
-        results = db.query(State.name, State.geoid, State.wkb_geometry).filter(
-            or_(
-                State.name.ilike(f"%{query}%"),
-                State.geoid.ilike(f"%{query}%")
-            )
-        ).all()
-        data = [{"name": name, "geo_id": geoid, "geometry": to_geojson_from_wkb(geometry)} for name, geoid, geometry in
-                results]
-
-    elif boundary_type == 'counties':
-        results = db.query(County.name, County.geoid, County.wkb_geometry).filter(
-            or_(
-                County.name.ilike(f"%{query}%"),
-                County.geoid.ilike(f"%{query}%")
-            )
-        ).all()
-        data = [{"name": name, "geo_id": geoid, "geometry": to_geojson_from_wkb(geometry)} for name, geoid, geometry in
-                results]
+    Returns:
+        tuple[dict, dict]: geoidfq -> payload for the cities that exist, and the hit/miss counts.
+    """
+    city_ids = list(city_ids)
+    if not city_ids:
+        return {}, {"hits": 0, "misses": 0}
+    found, stats = cache.get_many("city:meta", city_ids, city_meta_key,
+                                  lambda missing: _load_city_metadata(db, missing))
+    return {cid: loads(value) for cid, value in found.items()}, stats
+
+def hydrate_cities(db, city_ids, tier=FULL_TIER):
+    """
+    Load city payloads for the given geoidfqs through the two-tier "city:data" cache.
 
-    else:
-        raise ValueError("Invalid boundaryType. Must be 'states' or 'counties'.")
+    Misses are read from the DB in one query. The cached payload carries the
+    full geometry; other tiers are swapped in from get_boundary_geojson, and
+    tier=None drops it.
 
-    # Store the results in the cache for 60 minutes (adjust as needed)
-    redis_client.setex(cache_key, 3600, json.dumps(data))
+    Returns:
+        tuple[list[dict], dict]: Payloads in the order of city_ids and the
+        {"hits": n, "misses": m} counts for this call.
+    """
+    city_ids = list(city_ids)
+    if not city_ids:
+        return [], {"hits": 0, "misses": 0}
+    found, stats = cache.get_many(
+        "city:data", city_ids, city_data_key,
+        lambda missing: _load_city_payloads(db, missing),
+        is_valid=_is_current_city_payload
+    )
 
-    return data
+    cities = [loads(found[cid]) for cid in city_ids if cid in found]
+    if tier is None:
+        cities = [{k: v for k, v in city_data.items() if k != "geojson"} for city_data in cities]
+    elif tier != FULL_TIER:
+        geometries = get_boundary_geojson(db, "cities", [city_data["geoidfq"] for city_data in cities], tier)
+        cities = [dict(city_data, geojson=geometries.get(city_data["geoidfq"])) for city_data in cities]
+    return cities, stats
 
-def get_nearby_cities_from_redis(lat, lng, radius, page, limit):
-    offset = (page - 1) * limit
-    redis_client = cache.redis_client
+# /nearby-redis count modes; "none" (the default) pages with GEOSEARCH COUNT and never scans for a total
+REDIS_NEARBY_COUNT_MODES = ("exact", "none")
 
-    all_city_ids = redis_client.geosearch(
-        cities_geo_index(),
-        longitude=lng,
-        latitude=lat,
-        radius=radius,
-        unit='m',
-        withdist=True,
-        sort='ASC'
-    )
+# Counts the matches inside Redis, so an exact total needs neither the members nor a stored copy of them
+NEARBY_COUNT_LUA = "return #redis.call('GEOSEARCH', KEYS[1], 'FROMLONLAT', ARGV[1], ARGV[2], 'BYRADIUS', ARGV[3], 'm')"
+
+# Results key of recently searched centers -> [requests, monotonic time its stored results expire]
+_nearby_centers = {}
+_nearby_centers_lock = threading.Lock()
 
-    total_count = len(all_city_ids)
-    paginated_city_ids = all_city_ids[offset:offset + limit]
-    city_ids = [item[0] for item in paginated_city_ids]
-    distances = {item[0]: item[1] for item in paginated_city_ids}
+def plan_nearby_search(lat, lng, radius, offset, limit, count_mode):
+    """
+    How to serve one /nearby-redis page (shared by the Flask and ASGI paths):
+
+    - ("stored", key): page through results already stored for this center.
+    - ("store", key): GEOSEARCHSTORE every match with its distance, then page
+      through it. Only for centers searched NEARBY_HOT_THRESHOLD times, so
+      their later pages and repeat searches cost a ZRANGE instead of a scan
+      of the whole radius.
+    - ("top_k", k): GEOSEARCH COUNT k, only enough rows to fill this page and
+      tell whether another one exists (plus a server-side count for exact totals).
+    """
+    key = nearby_results_key(lat, lng, radius)
+    now = time.monotonic()
+    with _nearby_centers_lock:
+        entry = _nearby_centers.pop(key, None) or [0, 0.0]
+        entry[0] += 1
+        _nearby_centers[key] = entry  # re-inserted, so the least recently searched center is first
+        if len(_nearby_centers) > Config.NEARBY_HOT_CENTERS:
+            del _nearby_centers[next(iter(_nearby_centers))]
+        if entry[1] > now:
+            return "stored", key
+        if entry[0] >= Config.NEARBY_HOT_THRESHOLD:
+            entry[1] = now + Config.NEARBY_RESULTS_TTL - 1
+            return "store", key
+    return "top_k", offset + limit + 1
+
+def nearby_store_commands(pipe, key, lat, lng, radius, offset, limit):
+    # Replies: total stored, expire, page of (geoidfq, distance)
+    pipe.geosearchstore(key, cities_geo_index(), longitude=lng, latitude=lat, radius=radius, unit="m",
+                        sort="ASC", storedist=True)
+    pipe.expire(key, Config.NEARBY_RESULTS_TTL)
+    pipe.zrange(key, offset, offset + limit - 1, withscores=True)
+
+def nearby_top_k_commands(pipe, lat, lng, radius, k, count_mode):
+    # Replies: nearest k (geoidfq, distance), then the total when count_mode is "exact"
+    pipe.geosearch(cities_geo_index(), longitude=lng, latitude=lat, radius=radius, unit="m",
+                   withdist=True, sort="ASC", count=k)
+    if count_mode == "exact":
+        pipe.eval(NEARBY_COUNT_LUA, 1, cities_geo_index(), lng, lat, radius)
+
+def nearby_page_payload(lat, lng, radius, page, limit, count_mode, rows, total_count, has_more):
+    return {
+        "latitude": lat,
+        "longitude": lng,
+        "radius": radius,
+        "page": page,
+        "limit": limit,
+        "total_count": total_count if count_mode == "exact" else None,
+        "has_more": has_more,
+        "nearby": rows,
+    }
+
+def _nearby_city_ids_from_redis(lat, lng, radius, offset, limit, count_mode):
+    """
+    One page of (geoidfq, distance) nearest first, the total (None when not counted) and whether more follow.
+    """
+    redis_client = cache.redis_client
+    plan, arg = plan_nearby_search(lat, lng, radius, offset, limit, count_mode)
+    if plan == "stored":
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zrange(arg, offset, offset + limit - 1, withscores=True)
+        pipe.zcard(arg)
+        page_rows, total_count = pipe.execute()
+        if total_count:
+            return page_rows, total_count, offset + limit < total_count
+        plan = "store"  # expired or deleted by a city sync since it was stored
+    if plan == "store":
+        pipe = redis_client.pipeline(transaction=False)
+        nearby_store_commands(pipe, arg, lat, lng, radius, offset, limit)
+        total_count, _, page_rows = pipe.execute()
+        return page_rows, total_count, offset + limit < total_count
+
+    pipe = redis_client.pipeline(transaction=False)
+    nearby_top_k_commands(pipe, lat, lng, radius, arg, count_mode)
+    rows, *total_count = pipe.execute()
+    return rows[offset:offset + limit], total_count[0] if total_count else None, len(rows) > offset + limit
+
+def get_nearby_cities_from_redis(lat, lng, radius, page, limit, count_mode="none"):
+    """
+    Nearby cities from the cities:geo index, nearest first.
+
+    Only the requested page is transferred: a top-k GEOSEARCH COUNT (with a
+    server-side count for count_mode "exact"), or a page of the results stored
+    with GEOSEARCHSTORE for hot centers (see plan_nearby_search).
+    """
+    offset = (page - 1) * limit
+    page_rows, total_count, has_more = _nearby_city_ids_from_redis(lat, lng, radius, offset, limit, count_mode)
+    distances = {geoidfq: distance for geoidfq, distance in page_rows}
 
     session = SessionLocal()
     try:
-        nearby = []
-        missing_ids = []
-        city_map = {}
-
-        # Try to get cached cities from Redis
-        for cid in city_ids:
-            key = city_data_key(cid)
-            cached_city = redis_client.get(key)
-            if cached_city:
-                city = json.loads(cached_city)
-                city_map[cid] = city
-            else:
-                missing_ids.append(cid)
-
-        # Fetch missing cities from DB
-        if missing_ids:
-            db_cities = session.query(City).filter(City.geoidfq.in_(missing_ids)).all()
-            for city in db_cities:
-                city_data = {
-                    "name": city.name,
-                    "geoidfq": city.geoidfq,
-                    "lat": city.centroid_lat,
-                    "lng": city.centroid_lon,
-                    "geojson": to_geojson_from_wkb(city.wkb_geometry)
-                }
-                redis_client.set(f"city:data:{city.geoidfq}", json.dumps(city_data))
-                city_map[city.geoidfq] = city_data
-
-        # Build nearby list
-        for cid in city_ids:
-            city_data = city_map.get(cid)
-            if city_data:
-                city_data["distance"] = distances[cid]
-                nearby.append(city_data)
-
-        return {
-            "latitude": lat,
-            "longitude": lng,
-            "radius": radius,
-            "page": page,
-            "limit": limit,
-            "total_count": total_count,
-            "nearby": nearby
-        }
+        nearby, stats = hydrate_cities(session, [geoidfq for geoidfq, _ in page_rows])
+        for city_data in nearby:
+            city_data["distance"] = distances[city_data["geoidfq"]]
+
+        payload = nearby_page_payload(lat, lng, radius, page, limit, count_mode, nearby, total_count, has_more)
+        payload["cache"] = stats
+        return payload
 
     finally:
         session.close()
 
-def fetch_demographics(lat, lng):
+def fetch_demographics(lat, lng, tier=FULL_TIER, accept_encoding=None, if_none_match=None):
     if lat is None or lng is None:
         return jsonify({"error": "lat and lng query parameters are required"}), 400
 
-    point_wkt = f'POINT({lng} {lat})'
     db = next(get_db())
-    redis_client = cache.redis_client
 
     try:
-        state_obj = db.query(State).filter(
-            ST_Contains(State.wkb_geometry, ST_SetSRID(ST_GeomFromText(point_wkt), 4326))
-        ).first()
-        if not state_obj:
+        # Point-in-polygon runs against the in-memory index, not PostGIS
+        with metrics.stage("point_in_polygon"):
+            state_id, county_id = spatial_index.lookup_point(lat, lng)
+        if not state_id:
             return jsonify({"error": "No state found for given coordinates"}), 404
-
-        county_obj = db.query(County).filter(
-            ST_Contains(County.wkb_geometry, ST_SetSRID(ST_GeomFromText(point_wkt), 4326))
-        ).first()
-        if not county_obj:
+        if not county_id:
             return jsonify({"error": "No county found for given coordinates"}), 404
 
-        state_geo_key = f"geojson:state:{state_obj.geoidfq}"
-        county_geo_key = f"geojson:county:{county_obj.geoidfq}"
+        def build():
+            state_obj = spatial_index.get_boundary("states", state_id)
+            county_obj = spatial_index.get_boundary("counties", county_id)
+
+            state_geojson = get_boundary_geojson(db, "states", [state_id], tier)[state_id]
+            county_geojson = get_boundary_geojson(db, "counties", [county_id], tier)[county_id]
+            with metrics.stage("demography"):
+                state_demographics = demography_store.get_records(state_id)
+                county_demographics = demography_store.get_records(county_id)
+
+            return {
+                "state": {
+                    "name": state_obj.name,
+                    "geography": state_geojson,
+                    "demographics": state_demographics
+                },
+                "county": {
+                    "name": county_obj.name,
+                    "geography": county_geojson,
+                    "demographics": county_demographics
+                }
+            }
 
-        # Try to get cached geometry
-        state_geojson = redis_client.get(state_geo_key)
-        county_geojson = redis_client.get(county_geo_key)
+        # Every point in the same county gets the same (cached, precompressed) response
+        key = response_cache.response_key("demographics", state_id, county_id, tier)
+        return response_cache.flask_response(key, build, accept_encoding, if_none_match)
 
-        # If not cached, convert and cache
-        if not state_geojson:
-            state_geojson = to_geojson_from_wkb(state_obj.wkb_geometry)
-            redis_client.set(state_geo_key, json.dumps(state_geojson))  # no TTL
-        else:
-            state_geojson = json.loads(state_geojson)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        if not county_geojson:
-            county_geojson = to_geojson_from_wkb(county_obj.wkb_geometry)
-            redis_client.set(county_geo_key, json.dumps(county_geojson))
-        else:
-            county_geojson = json.loads(county_geojson)
+def _batch_point(item):
+    """
+    Normalizes one batch input ({"lat", "lng", "id"?} object, [lat, lng] pair, or a raw NDJSON line).
+    """
+    if isinstance(item, (bytes, str)):
+        item = loads(item)
+    if isinstance(item, dict):
+        point_id, lat, lng = item.get("id"), item.get("lat"), item.get("lng", item.get("lon"))
+    elif isinstance(item, (list, tuple)) and len(item) == 2:
+        point_id, (lat, lng) = None, item
+    else:
+        raise ValueError("Each point must be an object with lat/lng or a [lat, lng] pair")
+    lat, lng = float(lat), float(lng)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat/lng out of range")
+    return point_id, lat, lng
+
+
+def _batch_chunks(items, chunk_size, max_points):
+    chunk = []
+    for index, item in enumerate(items):
+        if index >= max_points:
+            chunk.append((index, None, ValueError(f"Batch limited to {max_points} points; the rest were skipped")))
+            break
+        try:
+            chunk.append((index, _batch_point(item), None))
+        except (TypeError, ValueError) as e:
+            chunk.append((index, None, e))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_demographics_batch(items, tier=None):
+    """
+    Reverse-geocodes many points to state/county demographics, yielding one NDJSON line per point.
 
-        state_demo = db.query(StateDemography).filter_by(geoidfq=state_obj.geoidfq).all()
-        county_demo = db.query(CountyDemography).filter_by(geoidfq=county_obj.geoidfq).all()
+    Points are resolved a chunk at a time with a bulk query against the in-memory
+    boundary index. Each distinct state or county payload is encoded once and
+    spliced into every line that refers to it.
 
-        def model_to_dict(obj):
-            return {col.name: getattr(obj, col.name) for col in obj.__table__.columns}
+    Args:
+        items (iterable): Points as accepted by _batch_point, in request order.
+        tier (str): Geometry tier to include, or None to omit geometry.
 
-        return jsonify({
-            "state": {
-                "name": state_obj.name,
-                "geography": state_geojson,
-                "demographics": [model_to_dict(d) for d in state_demo]
-            },
-            "county": {
-                "name": county_obj.name,
-                "geography": county_geojson,
-                "demographics": [model_to_dict(d) for d in county_demo]
+    Yields:
+        bytes: NDJSON lines, in input order.
+    """
+    payloads = {"states": {}, "counties": {}}
+    db = SessionLocal() if tier is not None else None
+
+    def payloads_for(layer, geoidfqs):
+        cached = payloads[layer]
+        missing = [g for g in dict.fromkeys(geoidfqs) if g is not None and g not in cached]
+        geometries = get_boundary_geojson(db, layer, missing, tier) if missing and tier is not None else {}
+        for geoidfq in missing:
+            payload = {
+                "geoidfq": geoidfq,
+                "name": spatial_index.get_boundary(layer, geoidfq).name,
+                "demographics": demography_store.get_records(geoidfq)
             }
-        })
+            if tier is not None:
+                payload["geography"] = geometries.get(geoidfq)
+            cached[geoidfq] = fragment(dumps(payload))
+        return cached
+
+    try:
+        for chunk in _batch_chunks(items, Config.DEMOGRAPHICS_BATCH_CHUNK_SIZE, Config.DEMOGRAPHICS_BATCH_MAX_POINTS):
+            valid = [(index, point) for index, point, error in chunk if error is None]
+            with metrics.stage("point_in_polygon"):
+                state_ids, county_ids = spatial_index.lookup_points(
+                    [lat for _, (_, lat, _) in valid], [lng for _, (_, _, lng) in valid]
+                ) if valid else ([], [])
+            states = payloads_for("states", state_ids)
+            counties = payloads_for("counties", county_ids)
+            resolved = {index: (state_id, county_id) for (index, _), state_id, county_id
+                        in zip(valid, state_ids, county_ids)}
+
+            lines = []
+            for index, point, error in chunk:
+                if error is not None:
+                    lines.append(dumps({"index": index, "error": str(error)}))
+                    continue
+                point_id, lat, lng = point
+                state_id, county_id = resolved[index]
+                lines.append(dumps({
+                    "index": index, "id": point_id, "lat": lat, "lng": lng,
+                    "state": states.get(state_id),
+                    "county": counties.get(county_id)
+                }))
+            yield b"\n".join(lines) + b"\n"
+    finally:
+        if db is not None:
+            db.close()
+
+POLYGON_SORT_FIELDS = ("aland", "name", "distance")
 
+# Slack added to the prefilter shape so planar polygon edges and float
+# rounding never push a city inside the polygon out of the Redis search.
+PREFILTER_MARGIN = 1.01
+
+def _polygon_prefilter(polygon):
+    """
+    Pick the smaller Redis GEOSEARCH shape covering the polygon: its minimum
+    enclosing circle or its bounding box.
+
+    Returns geosearch kwargs (center and shape, sizes in meters).
+    """
+    circle_center = shapely.minimum_bounding_circle(polygon).centroid
+    hull_lngs, hull_lats = shapely.get_coordinates(polygon.convex_hull).T
+    radius = float(haversine_meters(circle_center.y, circle_center.x, hull_lats, hull_lngs).max()) * PREFILTER_MARGIN
+
+    min_lng, min_lat, max_lng, max_lat = polygon.bounds
+    box_lng, box_lat = (min_lng + max_lng) / 2, (min_lat + max_lat) / 2
+    # GEOSEARCH BYBOX measures east-west extent along each point's own parallel,
+    # which is widest on the parallel closest to the equator.
+    widest_lat = 0.0 if min_lat <= 0 <= max_lat else min(min_lat, max_lat, key=abs)
+    width = float(haversine_meters(widest_lat, min_lng, widest_lat, max_lng)) * PREFILTER_MARGIN
+    height = float(haversine_meters(min_lat, box_lng, max_lat, box_lng)) * PREFILTER_MARGIN
+
+    if np.pi * radius ** 2 <= width * height:
+        return {"longitude": circle_center.x, "latitude": circle_center.y, "radius": radius}
+    return {"longitude": box_lng, "latitude": box_lat, "width": width, "height": height}
+
+def _parse_polygon(wkt, repair=False):
+    """
+    Args:
+        repair (bool): Fix invalid (e.g. self-intersecting) polygons with make_valid instead of rejecting them.
+
+    Returns:
+        tuple: (polygon, None), or (None, error message) when the WKT is not a usable polygon.
+    """
+    try:
+        polygon = shapely.from_wkt(wkt)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return None, f"Invalid polygon WKT: {str(e)}"
+    if polygon.is_empty or polygon.geom_type not in ("Polygon", "MultiPolygon"):
+        return None, "polygon_wkt must be a non-empty Polygon or MultiPolygon"
+    if not polygon.is_valid:
+        if not repair:
+            return None, f"Invalid polygon: {shapely.is_valid_reason(polygon)}"
+        # Self-intersecting drawings would make the clipping fail
+        polygon = shapely.make_valid(polygon)
+    if polygon.area == 0:
+        return None, "polygon_wkt must enclose a non-zero area"
+    return polygon, None
 
 def fetch_cities_within_polygon(data, page, per_page, sort_by, sort_order):
     # Validate the required polygon field
-    if "polygon_wkt" not in data:
+    if not data or "polygon_wkt" not in data:
         return jsonify({"error": "polygon_wkt is required"}), 400
 
-    # Verify the polygon is valid
-    try:
-        polygon_geom = ST_SetSRID(ST_GeomFromText(data["polygon_wkt"]), 4326)
-    except Exception as e:
-        return jsonify({"error": f"Invalid polygon WKT: {str(e)}"}), 400
+    if sort_by not in POLYGON_SORT_FIELDS:
+        return jsonify({"error": f"sort_by must be one of {', '.join(POLYGON_SORT_FIELDS)}"}), 400
+    if sort_order not in ("asc", "desc"):
+        return jsonify({"error": "sort_order must be 'asc' or 'desc'"}), 400
+    if page < 1 or per_page < 1:
+        return jsonify({"error": "page and per_page must be positive integers"}), 400
+
+    polygon, error = _parse_polygon(data["polygon_wkt"])
+    if error:
+        return jsonify({"error": error}), 400
 
     redis_client = cache.redis_client
 
+    # ─── STEP 1: Prefilter candidates from Redis with a covering circle/box ────────
+    search_area = _polygon_prefilter(polygon)
+    redis_candidates = redis_client.geosearch(cities_geo_index(), unit="m", withcoord=True, **search_area)
+
+    # ─── STEP 2: Exact containment of every candidate centroid in one pass ────────
+    with metrics.stage("polygon_filter"):
+        candidate_ids = np.array([item[0] for item in redis_candidates], dtype=object)
+        coords = np.array([item[1] for item in redis_candidates], dtype=float).reshape(-1, 2)
+        shapely.prepare(polygon)
+        inside = shapely.contains_xy(polygon, coords[:, 0], coords[:, 1])
+        city_ids = candidate_ids[inside]
+        centroid = polygon.centroid
+        distances = haversine_meters(centroid.y, centroid.x, coords[inside, 1], coords[inside, 0])
+
     # Open a DB session
     with next(get_db()) as db:
-        # ─── STEP 1: Compute Bounding Circle (center & radius) ─────────────────────
-        # This raw SQL uses PostGIS functions to compute:
-        # - the centroid of the polygon, and
-        # - an approximate radius from the centroid to one point on the polygon's exterior.
-        bounding_result = db.execute(
-            text("""
-            WITH poly AS (
-              SELECT ST_GeomFromText(:polygon_wkt, 4326) AS geom
-            ),
-            center AS (
-              SELECT ST_Centroid(geom) AS centroid FROM poly
-            ),
-            radius AS (
-              SELECT ST_DistanceSphere(centroid, ST_PointN(ST_ExteriorRing(geom), 1)) AS radius
-              FROM poly, center
-            )
-            SELECT ST_Y(centroid) AS lat, ST_X(centroid) AS lng, radius 
-            FROM center, radius;
-            """),
-            {"polygon_wkt": data["polygon_wkt"]}
-        ).mappings().fetchone()
-
-        if not bounding_result:
-            return jsonify({"error": "Failed to compute bounding circle"}), 500
-
-        center_lat = bounding_result["lat"]
-        center_lng = bounding_result["lng"]
-        radius_meters = bounding_result["radius"]
-
-        # ─── STEP 2: Get Candidate Cities from Redis Using the Bounding Circle ───────
-        # Use Redis geospatial query to retrieve candidate cities within the bounding circle.
-        redis_candidates = redis_client.geosearch(
-            cities_geo_index(),
-            longitude=center_lng,
-            latitude=center_lat,
-            radius=radius_meters,
-            unit="m",
-            withdist=True,
-            sort="ASC"
-        )
-
-        # Extract city IDs from the redis results.
-        # Note: Each item is typically (city_id, distance)
-        candidate_ids = [item[0] for item in redis_candidates]
-
-        # If needed, you can further filter the candidates (e.g. with an in-memory check or DB query)
-        # to ensure the points actually fall within the original polygon.
-
-        # ─── STEP 3: Paginate Candidate City IDs ─────────────────────────────────────
-        total = len(candidate_ids)
+        # ─── STEP 3: Sort the matching cities before paginating ──────────────────
+        if sort_by == "distance":
+            metadata, stats = None, None
+            sort_keys = dict(zip(city_ids, distances))
+        else:
+            # Cached metadata of every match, which also serves the page below
+            metadata, stats = city_metadata(db, city_ids.tolist())
+            sort_keys = {cid: city[sort_by] for cid, city in metadata.items()}
+
+        reverse = sort_order == "desc"
+        # Cities without a value for the sort field always go last
+        present = sorted((cid for cid in city_ids if sort_keys.get(cid) is not None),
+                         key=lambda cid: (sort_keys[cid], cid), reverse=reverse)
+        ordered_ids = present + sorted(cid for cid in city_ids if sort_keys.get(cid) is None)
+
+        total = len(ordered_ids)
         start = (page - 1) * per_page
         end = start + per_page
-        paginated_city_ids = candidate_ids[start:end]
-
-        # ─── STEP 4: Retrieve City Data from Redis (or DB if not cached) ───────────────
-        city_map = {}
-        missing_ids = []
-        for cid in paginated_city_ids:
-            key = city_data_key(cid)
-            cached = redis_client.get(key)
-            if cached:
-                city_map[cid] = json.loads(cached)
-            else:
-                missing_ids.append(cid)
-
-        # Query the DB for any missing IDs and cache them for future use
-        if missing_ids:
-            db_cities = db.query(City).filter(City.geoidfq.in_(missing_ids)).all()
-            for city in db_cities:
-                city_data = {
-                    "name": city.name,
-                    "state_name": city.state_name,
-                    "aland": city.aland,
-                    "lat": city.centroid_lat,
-                    "lng": city.centroid_lon,
-                    "geoidfq": city.geoidfq,
-                    # Optionally include more details, such as geojson:
-                    # "geojson": to_geojson_from_wkb(city.wkb_geometry)
-                }
-                redis_client.set(f"city:data:{city.geoidfq}", json.dumps(city_data))
-                city_map[city.geoidfq] = city_data
+        paginated_city_ids = ordered_ids[start:end]
+        distance_by_id = dict(zip(city_ids, distances))
 
-        # Maintain the original order from our candidate IDs
-        cities = [city_map[cid] for cid in paginated_city_ids if cid in city_map]
+        # ─── STEP 4: Metadata of the page from Redis (or DB if not cached), no geometry ──
+        if metadata is None:
+            metadata, stats = city_metadata(db, paginated_city_ids)
+        cities = [dict(metadata[cid], distance=float(distance_by_id[cid]))
+                  for cid in paginated_city_ids if cid in metadata]
 
         # ─── Return the Aggregated Result ─────────────────────────────────────────────
-        return jsonify({
-            "bounding_circle": {
-                "center": {"lat": center_lat, "lng": center_lng},
-                "radius_meters": radius_meters
+        return json_response({
+            "prefilter": {
+                "shape": "circle" if "radius" in search_area else "box",
+                "center": {"lat": search_area["latitude"], "lng": search_area["longitude"]},
+                "radius_meters": search_area.get("radius"),
+                "width_meters": search_area.get("width"),
+                "height_meters": search_area.get("height"),
+                "candidates": len(candidate_ids)
             },
             "cities": cities,
             "pagination": {
                 "page": page,
                 "per_page": per_page,
+                "sort_by": sort_by,
+                "sort_order": sort_order,
                 "total_cities": total,
                 "total_pages": (total + per_page - 1) // per_page
-            }
+            },
+            "cache": stats
         })
 
-def fetch_nearby_cities(lat, lng, radius, page, limit):
+def aggregate_polygon_demographics(data, weighting="area", year=None):
+    """
+    Estimates county demographics for an arbitrary polygon, per year.
+
+    The polygon is intersected with the in-memory county polygons, whose areas
+    are precomputed, so nothing touches PostGIS. See
+    demography_store.aggregate_counties for how counts and medians are combined.
+    """
+    if not data or "polygon_wkt" not in data:
+        return jsonify({"error": "polygon_wkt is required"}), 400
+    polygon, error = _parse_polygon(data["polygon_wkt"], repair=True)
+    if error:
+        return jsonify({"error": error}), 400
+
+    with metrics.stage("polygon_overlay"):
+        overlaps = spatial_index.county_overlaps(polygon)
+    try:
+        with metrics.stage("demography"):
+            years = demography_store.aggregate_counties(
+                [o.geoidfq for o in overlaps], [o.fraction for o in overlaps], [o.area for o in overlaps],
+                weighting, year
+            )
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except LookupError as le:
+        return jsonify({"error": str(le)}), 404
+
+    return json_response({
+        "weighting": weighting,
+        "counties": [{"geoidfq": o.geoidfq, "name": o.name, "fraction": o.fraction} for o in overlaps],
+        "years": years
+    })
+
+# The planar ST_DWithin can be answered from the GIST index on wkb_geometry and
+# narrows the rows the exact geography distance check has to look at.
+NEARBY_CITIES_FILTER = """
+    ST_DWithin(
+        city_table.wkb_geometry,
+        ST_SetSRID(ST_MakePoint(:lng, :lat), 4326),
+        :radius_degrees
+    )
+    AND ST_DWithin(
+        city_table.wkb_geometry::geography,
+        ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography,
+        :radius
+    )
+"""
+
+NEARBY_COUNT_MODES = ("exact", "estimate", "none")
+
+def fetch_nearby_cities(lat, lng, radius, page, limit, tier=FULL_TIER, count_mode="none"):
+    """
+    Nearby cities paged by OFFSET. The total is only counted when asked for
+    (count_mode 'exact' or 'estimate'); has_more comes from fetching one extra row.
+    """
+    if count_mode not in NEARBY_COUNT_MODES:
+        return jsonify({"error": f"count must be one of {', '.join(NEARBY_COUNT_MODES)}"}), 400
     offset = (page - 1) * limit
+    params = {"lat": lat, "lng": lng, "radius": radius, "radius_degrees": degree_radius(lat, radius)}
     session = SessionLocal()
     try:
         point_geom = ST_SetSRID(ST_GeomFromText(f'POINT({lng} {lat})'), 4326)
 
-        count_query = session.query(City).filter(
-            text("""
-                ST_DWithin(
-                    city_table.wkb_geometry::geography,
-                    ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography,
-                    :radius
-                )
-            """)
-        ).params(lat=lat, lng=lng, radius=radius)
-
-        total_count = count_query.count()
-
-        paginated_query = count_query.add_columns(
+        paginated_query = session.query(City.geoidfq).filter(
+            text(NEARBY_CITIES_FILTER)
+        ).params(**params).add_columns(
             ST_Distance(City.wkb_geometry, point_geom).label('distance')
-        ).order_by('distance').offset(offset).limit(limit)
+        ).order_by('distance').offset(offset).limit(limit + 1)
 
         results = paginated_query.all()
+        page_rows = results[:limit]
+        distances = dict(page_rows)
 
-        nearby = [{
-            "name": city.name,
-            "geoidfq": city.geoidfq,
-            "lat": city.centroid_lat,
-            "lng": city.centroid_lon,
-            "distance": distance,
-            "geojson": to_geojson_from_wkb(city.wkb_geometry)
-        } for city, distance in results]
+        nearby, stats = hydrate_cities(session, [geoidfq for geoidfq, _ in page_rows], tier)
+        for city_data in nearby:
+            city_data["distance"] = distances[city_data["geoidfq"]]
 
-        return jsonify({
+        total_count = _count_nearby_cities(session, params, count_mode)
+        return json_response({
             "latitude": lat, "longitude": lng, "radius": radius,
             "page": page, "limit": limit,
             "total_count": total_count, "nearby": nearby,
-            "total_pages": (total_count + limit - 1) // limit
+            "total_count_estimated": count_mode == "estimate",
+            "total_pages": (total_count + limit - 1) // limit if total_count is not None else None,
+            "has_more": len(results) > limit,
+            "cache": stats
         })
     finally:
         session.close()
 
-def fetch_encompassing_boundaries(geoidfq, page, limit):
+# Layer whose boundaries are listed as the regions inside a boundary of the key layer
+CHILD_LAYERS = {"states": "counties", "counties": "cities"}
+CHILD_REGION_TYPES = {"counties": "County", "cities": "City"}
+
+def fetch_encompassing_boundaries(geoidfq, page, limit, tier=FULL_TIER, cursor=None, keyset=False,
+                                  accept_encoding=None, if_none_match=None):
+    """
+    Regions inside a state (its counties) or a county (its cities), from gis.boundary_hierarchy.
+
+    Children that straddle the boundary are included with their overlap_fraction.
+    Pages by offset, or by child geoidfq when keyset is set or a cursor is given.
+    """
+    layer = layer_for_geoidfq(geoidfq)
+    if layer == "cities":
+        return jsonify({"message": "No encompassing boundaries for cities."}), 200
+    # Only states and counties have regions inside them (ZCTAs and unknown ids have none)
+    if layer not in CHILD_LAYERS or spatial_index.get_boundary(layer, geoidfq) is None:
+        return jsonify({"error": "No regions found for the given geoidfq"}), 404
+    try:
+        after = decode_cursor(cursor, 1)[0] if cursor else None
+        if after is not None and not isinstance(after, str):
+            raise ValueError("Invalid cursor")
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    child_layer = CHILD_LAYERS[layer]
+    keyset = keyset or bool(cursor)
+    if keyset:
+        key = response_cache.response_key("encompassing", geoidfq, tier, limit, "keyset", after or "")
+    else:
+        key = response_cache.response_key("encompassing", geoidfq, tier, limit, page)
+    return response_cache.flask_response(
+        key, lambda: _encompassing_payload(geoidfq, child_layer, page, limit, tier, after, keyset),
+        accept_encoding, if_none_match
+    )
+
+def _encompassing_payload(geoidfq, child_layer, page, limit, tier, after, keyset):
     with next(get_db()) as db:
-        state = db.query(State).filter(State.geoidfq == geoidfq).first()
-        county = db.query(County).filter(County.geoidfq == geoidfq).first()
-        city = db.query(City).filter(City.geoidfq == geoidfq).first()
-
-        if not state and not county and not city:
-            return jsonify({"error": "No regions found for the given geoidfq"}), 404
-
-        encompassing_regions = []
-        total_count = 0
-        offset = (page - 1) * limit
-
-        # Function to handle the building of response and pagination
-        def add_encompassing_regions(query, region_type):
-            nonlocal total_count
-            total_count = query.count()
-            regions = query.offset(offset).limit(limit).all()
-            return [{
-                "name": region.name,
-                "type": region_type,
-                "geoidfq": region.geoidfq,
-                "geojson": to_geojson_from_wkb(region.wkb_geometry)
-            } for region in regions]
-
-        # If state is provided
-        if state:
-            counties_query = db.query(County).filter(
-                ST_Within(County.wkb_geometry, state.wkb_geometry)
-            )
-            encompassing_regions = add_encompassing_regions(counties_query, "County")
+        children = db.query(BoundaryHierarchy).filter(BoundaryHierarchy.parent_geoidfq == geoidfq)
+        total_count = children.count()
+        query = db.query(
+            BoundaryHierarchy.child_geoidfq, BoundaryHierarchy.child_name, BoundaryHierarchy.overlap_fraction
+        ).filter(BoundaryHierarchy.parent_geoidfq == geoidfq).order_by(BoundaryHierarchy.child_geoidfq)
+        if keyset:
+            if after is not None:
+                query = query.filter(BoundaryHierarchy.child_geoidfq > after)
+            rows = query.limit(limit + 1).all()
+        else:
+            rows = query.offset((page - 1) * limit).limit(limit).all()
 
-        # If county is provided
-        elif county:
-            cities_query = db.query(City).filter(
-                ST_Within(City.wkb_geometry, county.wkb_geometry)
-            )
-            encompassing_regions = add_encompassing_regions(cities_query, "City")
+        page_rows = rows[:limit]
+        geometries = get_boundary_geojson(db, child_layer, [row.child_geoidfq for row in page_rows], tier)
 
-        # If city is provided (no encompassing boundaries for cities in the current setup)
-        elif city:
-            return jsonify({"message": "No encompassing boundaries for cities."}), 200
+    pagination = {"limit": limit, "total_count": total_count}
+    if keyset:
+        pagination["next_cursor"] = encode_cursor(page_rows[-1].child_geoidfq) if len(rows) > limit else None
+    else:
+        pagination.update(page=page, total_pages=(total_count + limit - 1) // limit)
+
+    return {
+        "encompassing_regions": [{
+            "name": row.child_name,
+            "type": CHILD_REGION_TYPES[child_layer],
+            "geoidfq": row.child_geoidfq,
+            "overlap_fraction": row.overlap_fraction,
+            "geojson": geometries.get(row.child_geoidfq)
+        } for row in page_rows],
+        "pagination": pagination
+    }
+
+NEARBY_COUNT_SQL = f"SELECT count(*) FROM gis.city_table WHERE {NEARBY_CITIES_FILTER}"
+NEARBY_ESTIMATE_SQL = f"EXPLAIN (FORMAT JSON) SELECT 1 FROM gis.city_table WHERE {NEARBY_CITIES_FILTER}"
+
+def nearby_keyset_query(lat, lng, radius, limit, after=None):
+    """
+    SQL and bind parameters for one keyset page of nearby cities (shared by the Flask and ASGI paths).
 
-        return jsonify({
-            "encompassing_regions": encompassing_regions,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total_count": total_count,
-                "total_pages": (total_count + limit - 1) // limit
-            }
-        })
\ No newline at end of file
+    Selects limit + 1 rows so the caller can tell whether another page exists.
+    """
+    params = {"lat": lat, "lng": lng, "radius": radius, "radius_degrees": degree_radius(lat, radius),
+              "limit_plus_one": limit + 1}
+    keyset_filter = ""
+    if after:
+        # The plain >= prefilter discards nearer rows before the row-value comparison
+        keyset_filter = """
+            AND city_table.wkb_geometry <-> ST_SetSRID(ST_MakePoint(:lng, :lat), 4326) >= :after_distance
+            AND (city_table.wkb_geometry <-> ST_SetSRID(ST_MakePoint(:lng, :lat), 4326), city_table.ogc_fid)
+                > (:after_distance, :after_fid)
+        """
+        params.update(after_distance=after[0], after_fid=after[1])
+
+    sql = f"""
+        SELECT
+            city_table.ogc_fid,
+            city_table.geoidfq,
+            city_table.wkb_geometry <-> ST_SetSRID(ST_MakePoint(:lng, :lat), 4326) AS knn_distance,
+            ST_Distance(
+                city_table.wkb_geometry::geography,
+                ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography
+            ) AS distance
+        FROM gis.city_table
+        WHERE {NEARBY_CITIES_FILTER} {keyset_filter}
+        ORDER BY city_table.wkb_geometry <-> ST_SetSRID(ST_MakePoint(:lng, :lat), 4326),
+                 city_table.ogc_fid
+        LIMIT :limit_plus_one
+    """
+    return sql, params
+
+def decode_nearby_cursor(cursor):
+    """
+    The (knn distance, ogc_fid) a keyset /nearby page resumes after. Raises ValueError.
+    """
+    distance, fid = decode_cursor(cursor, 2)
+    try:
+        after = float(distance), int(fid)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not math.isfinite(after[0]):
+        raise ValueError("Invalid cursor")
+    return after
+
+def next_nearby_cursor(rows, limit):
+    # The extra (limit + 1)th row only signals that another page exists
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor(last["knn_distance"], last["ogc_fid"])
+
+def _count_nearby_cities(session, params, count_mode):
+    """
+    Total matches for a keyset /nearby query: exact, the planner's row estimate, or skipped.
+    """
+    if count_mode == "none":
+        return None
+    if count_mode == "estimate":
+        plan = session.execute(text(NEARBY_ESTIMATE_SQL), params).scalar()
+        return int(plan[0]["Plan"]["Plan Rows"])
+    return session.execute(text(NEARBY_COUNT_SQL), params).scalar()
+
+def fetch_nearby_cities_keyset(lat, lng, radius, limit, cursor=None, count_mode="none", tier=FULL_TIER):
+    """
+    Nearby cities paged with a continuation token instead of OFFSET.
+
+    Rows are walked in index-assisted KNN order (`<->`, ties broken by ogc_fid)
+    and each page resumes after the (knn distance, ogc_fid) of the previous
+    page's last row. Nothing can seek into the KNN index scan, so page N still
+    visits every nearer row, like OFFSET does; the distance prefilter only makes
+    skipping them cheap. What the cursor buys is pages that stay stable while
+    cities are added or removed.
+    Note that KNN order is planar (degrees); the reported distance is in meters.
+
+    Args:
+        cursor (str | None): Token from the previous page's next_cursor; None for the first page.
+        count_mode (str): 'exact', 'estimate' or 'none'.
+
+    Returns:
+        Response: JSON with the page of cities, next_cursor (None on the last page) and total_count.
+    """
+    try:
+        after = decode_nearby_cursor(cursor) if cursor else None
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    if count_mode not in NEARBY_COUNT_MODES:
+        return jsonify({"error": f"count must be one of {', '.join(NEARBY_COUNT_MODES)}"}), 400
+
+    sql, params = nearby_keyset_query(lat, lng, radius, limit, after)
+    session = SessionLocal()
+    try:
+        rows = session.execute(text(sql), params).mappings().all()
+        page_rows = rows[:limit]
+
+        distances = {row["geoidfq"]: row["distance"] for row in page_rows}
+        nearby, stats = hydrate_cities(session, [row["geoidfq"] for row in page_rows], tier)
+        for city_data in nearby:
+            city_data["distance"] = distances[city_data["geoidfq"]]
+
+        return json_response({
+            "latitude": lat, "longitude": lng, "radius": radius,
+            "limit": limit, "nearby": nearby,
+            "next_cursor": next_nearby_cursor(rows, limit),
+            "total_count": _count_nearby_cities(session, params, count_mode),
+            "total_count_estimated": count_mode == "estimate",
+            "cache": stats
+        })
+    finally:
+        session.close()
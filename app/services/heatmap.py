@@ -0,0 +1,248 @@
+import math
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from app.config import Config
+from app.services import cache
+from app.services.database import SessionLocal
+from app.services.demography_store import COUNT_METRICS, METRICS, get_demography_store
+from app.utils import metrics
+
+GRID_DATASET = "demography_grid"
+
+# Edge length (EPSG:3857 meters) of the hexagons at each resolution, coarsest first
+HEX_SIZES = (200_000, 100_000, 50_000, 25_000, 12_500, 6_250)
+
+# A cell should be at least this many pixels wide at the requested zoom
+MIN_CELL_PIXELS = 16
+
+# Web Mercator meters per pixel of a 256px tile at zoom 0
+METERS_PER_PIXEL_Z0 = 2 * math.pi * 6378137 / 256
+
+# Degrees of longitude per EPSG:3857 meter
+DEGREES_PER_METER = 360.0 / (2 * math.pi * 6378137)
+
+BREAK_QUANTILES = (0.2, 0.4, 0.6, 0.8)
+
+
+class GridLayer:
+    """
+    One resolution of the hexagon grid: the cells (ordered by longitude) and, per
+    cell/county overlap, the share of the county's area in that cell.
+    """
+
+    def __init__(self, resolution, i, j, lngs, lats, geoidfqs, fractions, land, version):
+        keys = (i.astype(np.int64) << 32) | (j.astype(np.int64) & 0xFFFFFFFF)
+        _, first, cell_of_row = np.unique(keys, return_index=True, return_inverse=True)
+        # Cells ordered by longitude, so a viewport is a searchsorted slice plus a latitude mask
+        order = np.argsort(lngs[first], kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+
+        self.resolution = resolution
+        self.size = HEX_SIZES[resolution]
+        self.i, self.j = i[first][order], j[first][order]
+        self.lngs, self.lats = lngs[first][order], lats[first][order]
+        self.cell_of_row = rank[cell_of_row.ravel()]
+        self.counties, self.county_of_row = np.unique(geoidfqs, return_inverse=True)
+        self.fractions = fractions
+        self.land = np.nan_to_num(land)
+        # (metric, year, density) -> (values per cell, breaks); only valid for self.demography
+        self.rasters = {}
+        self.demography = None
+        self.version = version
+        self.checked_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.lngs)
+
+    def _cell_sums(self, weights):
+        return np.bincount(self.cell_of_row, weights=weights, minlength=len(self))
+
+    def rasterize(self, table, metric, year, density):
+        """
+        A county metric spread over the cells; NaN where no overlapping county has a value.
+
+        Counts are apportioned by area share (uniform density within a county); as a
+        density they are divided by the land area they were apportioned from. Medians
+        become the land-weighted mean of the overlapping counties' values.
+        """
+        positions = np.array([table.row_by_key.get((geoidfq, year), -1) for geoidfq in self.counties],
+                             dtype=np.int64)[self.county_of_row]
+        values = np.where(positions >= 0, table.metrics[metric][positions], np.nan)
+        known = ~np.isnan(values)
+        values = np.where(known, values, 0.0)
+        land = self._cell_sums(np.where(known, self.land, 0.0))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if metric in COUNT_METRICS:
+                result = self._cell_sums(values * self.fractions)
+                result[self._cell_sums(known) == 0] = np.nan
+                if density:
+                    result = np.where(land > 0, result / (land / 1e6), np.nan)
+            else:
+                result = np.where(land > 0, self._cell_sums(values * self.land) / land, np.nan)
+
+        finite = result[np.isfinite(result)]
+        breaks = np.quantile(finite, BREAK_QUANTILES).tolist() if len(finite) else []
+        return result, breaks
+
+    def raster(self, metric, year, density):
+        store = get_demography_store()
+        if store is not self.demography:
+            self.rasters = {}
+            self.demography = store
+        key = (metric, year, density)
+        raster = self.rasters.get(key)
+        if raster is None:
+            raster = self.rasters[key] = self.rasterize(store.tables["counties"], metric, year, density)
+        return raster
+
+    def viewport(self, bbox):
+        """
+        Positions of the cells whose center lies in bbox, padded by one cell so edge cells are included.
+        """
+        min_lng, min_lat, max_lng, max_lat = bbox
+        pad = 2 * self.size * DEGREES_PER_METER
+        if min_lng <= max_lng:
+            spans = [(min_lng - pad, max_lng + pad)]
+        else:  # crosses the antimeridian
+            spans = [(min_lng - pad, 180.0), (-180.0, max_lng + pad)]
+        positions = np.concatenate([
+            np.arange(*np.searchsorted(self.lngs, span)) for span in spans
+        ])
+        lats = self.lats[positions]
+        return positions[(lats >= min_lat - pad) & (lats <= max_lat + pad)]
+
+
+_grids = {}
+_lock = threading.Lock()
+
+
+def build_grid_layer(resolution):
+    """
+    Load one resolution of gis.demography_grid into memory.
+    """
+    version = cache.get_dataset_version(GRID_DATASET)
+    session = SessionLocal()
+    try:
+        rows = session.execute(text("""
+            SELECT i, j, lng, lat, geoidfq, fraction, land_m2
+            FROM gis.demography_grid
+            WHERE resolution = :resolution
+        """), {"resolution": resolution}).all()
+    finally:
+        session.close()
+    if not rows:
+        raise LookupError(f"Heatmap grid resolution {resolution} has not been built")
+    i, j, lngs, lats, geoidfqs, fractions, land = zip(*rows)
+    layer = GridLayer(
+        resolution, np.array(i, dtype=np.int32), np.array(j, dtype=np.int32),
+        np.array(lngs, dtype=np.float64), np.array(lats, dtype=np.float64), np.array(geoidfqs, dtype=object),
+        np.array(fractions, dtype=np.float64), np.array(land, dtype=np.float64), version
+    )
+    print(f"Built heatmap grid resolution {resolution}: {len(layer)} cells, {len(rows)} county overlaps.")
+    return layer
+
+
+def _is_stale(layer):
+    now = time.monotonic()
+    if now - layer.checked_at < Config.BOUNDARY_INDEX_CHECK_INTERVAL:
+        return False
+    layer.checked_at = now
+    return cache.get_dataset_version(GRID_DATASET) != layer.version
+
+
+def get_grid_layer(resolution):
+    """
+    Return the process-wide layer for a resolution, loading it on first use and
+    reloading it whenever the grid has been rebuilt.
+    """
+    layer = _grids.get(resolution)
+    if layer is not None and not _is_stale(layer):
+        return layer
+    with _lock:
+        if _grids.get(resolution) is layer:  # nobody reloaded it while we waited for the lock
+            _grids[resolution] = build_grid_layer(resolution)
+        return _grids[resolution]
+
+
+def resolution_for_zoom(zoom):
+    """
+    Finest resolution whose cells are still at least MIN_CELL_PIXELS wide at a web-map zoom.
+    """
+    min_width = MIN_CELL_PIXELS * METERS_PER_PIXEL_Z0 / 2 ** zoom
+    resolution = 0
+    for candidate, size in enumerate(HEX_SIZES):
+        if 2 * size >= min_width:
+            resolution = candidate
+    return resolution
+
+
+def parse_bbox(value):
+    """
+    Parse "min_lng,min_lat,max_lng,max_lat". Raises ValueError.
+    """
+    try:
+        bbox = [float(part) for part in (value or "").split(",")]
+    except ValueError:
+        bbox = []
+    if len(bbox) != 4:
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+    min_lng, min_lat, max_lng, max_lat = bbox
+    if not (-180 <= min_lng <= 180 and -180 <= max_lng <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise ValueError("bbox is out of range")
+    return bbox
+
+
+def heatmap(metric, bbox, zoom=None, resolution=None, year=None, density=False):
+    """
+    Grid cells of one county metric inside a viewport.
+
+    Cells are flat-topped EPSG:3857 hexagons with edge `cell_size_m`, centered on
+    lng/lat; `breaks` are quantiles over the whole grid, so colors stay stable
+    while panning.
+
+    Raises:
+        ValueError: Bad metric, resolution, or a viewport with too many cells.
+        LookupError: No demographics for the year, or the grid has not been built.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Invalid metric. Must be one of {', '.join(METRICS)}.")
+    if density and metric not in COUNT_METRICS:
+        raise ValueError(f"density only applies to {', '.join(COUNT_METRICS)}")
+    if resolution is None:
+        resolution = resolution_for_zoom(zoom) if zoom is not None else 0
+    if not 0 <= resolution < len(HEX_SIZES):
+        raise ValueError(f"Invalid resolution. Must be 0 to {len(HEX_SIZES) - 1}.")
+    table = get_demography_store().tables["counties"]
+    year = table.year_or_latest(year)
+    if year not in table.years:
+        raise LookupError(f"No county demographics for {year}")
+
+    layer = get_grid_layer(resolution)
+    with metrics.stage("heatmap"):
+        values, breaks = layer.raster(metric, year, density)
+        positions = layer.viewport(bbox)
+        positions = positions[np.isfinite(values[positions])]
+        if len(positions) > Config.HEATMAP_MAX_CELLS:
+            raise ValueError(f"Viewport covers {len(positions)} cells at resolution {resolution} "
+                             f"(max {Config.HEATMAP_MAX_CELLS}); zoom in or use a coarser resolution")
+        cell_values = values[positions]
+        cell_values = np.round(cell_values, 2) if density else np.rint(cell_values).astype(np.int64)
+
+    return {
+        "metric": metric, "year": year, "density": density,
+        "resolution": resolution, "cell_size_m": layer.size, "shape": "hexagon", "crs": "EPSG:3857",
+        "bbox": list(bbox), "breaks": breaks, "count": int(len(positions)),
+        "cells": {
+            "i": layer.i[positions].tolist(),
+            "j": layer.j[positions].tolist(),
+            "lng": np.round(layer.lngs[positions], 5).tolist(),
+            "lat": np.round(layer.lats[positions], 5).tolist(),
+            "value": cell_values.tolist(),
+        },
+    }
@@ -0,0 +1,147 @@
+"""
+Whole-response cache with conditional GET for the heavy GeoJSON endpoints.
+
+A response body is encoded once and kept in Redis as a hash of its identity,
+gzip and brotli variants plus a content hash. A repeat request then costs one
+HMGET for the variant its Accept-Encoding prefers: no GeoJSON is read and nothing
+is encoded or compressed. A revalidation whose If-None-Match still matches gets a
+304 after a single HGET.
+"""
+import gzip
+import hashlib
+import threading
+
+import brotli
+from flask import Response
+from werkzeug.http import parse_accept_header, parse_etags
+
+from app.config import Config
+from app.services import cache, demography_store, spatial_index
+from app.utils import metrics
+from app.utils.json_utils import dumps
+
+# Content codings we store, preferred first when the client accepts both equally
+RESPONSE_ENCODINGS = ("br", "gzip")
+
+_COMPRESSORS = {
+    "br": lambda body: brotli.compress(body, quality=Config.RESPONSE_BROTLI_QUALITY),
+    "gzip": lambda body: gzip.compress(body, compresslevel=Config.RESPONSE_GZIP_LEVEL, mtime=0),
+}
+
+
+# Response key -> requests seen, least recently requested first
+_requests = {}
+_requests_lock = threading.Lock()
+
+
+def response_key(name, *parts):
+    """
+    Redis key of one cached response, scoped to the boundary and demography versions
+    this process's indexes were built from: a reload changes every key and the old
+    entries simply expire. Tier and hierarchy rebuilds delete response:* explicitly.
+    """
+    versions = (spatial_index.get_boundary_index().version, demography_store.get_demography_store().version)
+    return "response:" + ":".join(str(part) for part in (name, *versions, *parts))
+
+
+def is_popular(key):
+    """
+    Count one request for key. True once it has been requested RESPONSE_POPULAR_THRESHOLD
+    times while among this process's RESPONSE_POPULAR_KEYS most recent keys.
+    """
+    with _requests_lock:
+        count = _requests.pop(key, 0) + 1
+        _requests[key] = count
+        if len(_requests) > Config.RESPONSE_POPULAR_KEYS:
+            del _requests[next(iter(_requests))]
+    return count >= Config.RESPONSE_POPULAR_THRESHOLD
+
+
+def negotiate(accept_encoding):
+    """
+    The stored content coding the client prefers, or "identity".
+    """
+    accepted = parse_accept_header(accept_encoding)
+    best = max(RESPONSE_ENCODINGS, key=accepted.quality)
+    return best if accepted.quality(best) > 0 else "identity"
+
+
+def _etag(content_hash, encoding):
+    # Each coding is a different representation, so it needs its own strong validator
+    return content_hash if encoding == "identity" else f"{content_hash}-{encoding}"
+
+
+def _headers(content_hash, encoding):
+    headers = {
+        "ETag": f'"{_etag(content_hash, encoding)}"',
+        "Cache-Control": f"public, max-age={Config.RESPONSE_MAX_AGE}",
+        "Vary": "Accept-Encoding",
+    }
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return headers
+
+
+def _variants(body, encodings):
+    variants = {"etag": hashlib.blake2b(body, digest_size=16).hexdigest(), "identity": body}
+    with metrics.stage("compress"):
+        for encoding in encodings:
+            variants[encoding] = _COMPRESSORS[encoding](body)
+    return variants
+
+
+def cached_response(key, build, accept_encoding=None, if_none_match=None, store=True):
+    """
+    Serve a JSON response from the response cache, building and storing it on a miss.
+
+    Args:
+        key (str): From response_key().
+        build (callable): Returns the payload; only called on a miss.
+        accept_encoding (str): The request's Accept-Encoding header.
+        if_none_match (str): The request's If-None-Match header.
+        store (bool): Keep the response on a miss; otherwise it is only built and sent.
+
+    Returns:
+        tuple: (status, body bytes, headers) - status is 200 or 304.
+    """
+    encoding = negotiate(accept_encoding)
+    conditions = parse_etags(if_none_match)
+    client = cache.binary_redis_client
+
+    if conditions:
+        content_hash = client.hget(key, "etag")
+        if content_hash is not None and conditions.contains(_etag(content_hash.decode(), encoding)):
+            cache.record_cache_stats("response", hits=1, misses=0, not_modified=1)
+            return 304, b"", _headers(content_hash.decode(), encoding)
+
+    content_hash, body = client.hmget(key, "etag", encoding)
+    if body is not None:
+        cache.record_cache_stats("response", hits=1, misses=0)
+        return 200, body, _headers(content_hash.decode(), encoding)
+
+    cache.record_cache_stats("response", hits=0, misses=1)
+    payload = build()
+    with metrics.stage("json_encode"):
+        body = dumps(payload)
+    if not store or len(body) > Config.RESPONSE_CACHE_MAX_BYTES:
+        # Not kept: only compress what this client is sent
+        variants = _variants(body, [encoding] if encoding != "identity" else [])
+    else:
+        variants = _variants(body, RESPONSE_ENCODINGS)
+        pipe = client.pipeline()
+        pipe.hset(key, mapping=variants)
+        pipe.expire(key, Config.RESPONSE_CACHE_TTL)
+        pipe.execute()
+    content_hash = variants["etag"]
+    if conditions.contains(_etag(content_hash, encoding)):
+        return 304, b"", _headers(content_hash, encoding)
+    return 200, variants[encoding], _headers(content_hash, encoding)
+
+
+def flask_response(key, build, accept_encoding=None, if_none_match=None, store=True):
+    """
+    cached_response() as a Flask Response. The route passes the request headers in,
+    so services calling this work without a request context.
+    """
+    status, body, headers = cached_response(key, build, accept_encoding, if_none_match, store)
+    return Response(body, status=status, mimetype="application/json", headers=headers)
@@ -0,0 +1,233 @@
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+from app.config import Config
+from app.services import cache
+from app.services.database import SessionLocal
+from app.services.spatial_index import BOUNDARIES_DATASET
+from app.models.entities import City, County, State, ZCTA
+
+SEARCH_LAYERS = ("states", "counties", "cities", "zctas")
+
+SearchEntry = namedtuple("SearchEntry", ["layer", "geoidfq", "geoid", "name", "label", "aland"])
+
+# Match classes, best first
+EXACT, NAME_PREFIX, WORD_PREFIX, GEOID_PREFIX, SUBSTRING, FUZZY = range(6)
+
+MATCH_NAMES = {EXACT: "exact", NAME_PREFIX: "prefix", WORD_PREFIX: "prefix", GEOID_PREFIX: "prefix",
+               SUBSTRING: "substring", FUZZY: "fuzzy"}
+
+# Trigram similarity (shared / union, as in pg_trgm) a name needs to count as a fuzzy match
+MIN_TRIGRAM_SIMILARITY = 0.3
+
+# Prefix matches considered per query; very short prefixes ("s") match tens of thousands of names
+MAX_PREFIX_CANDIDATES = 1000
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text):
+    """
+    Lowercases, strips accents and collapses punctuation to single spaces ("Doña Ana" -> "dona ana").
+    """
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode()
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    Autocomplete over every boundary name: a sorted prefix table plus a trigram inverted index.
+
+    Prefix keys are each normalized name, every word-suffix of it ("york" for
+    "new york") and the geoid, so one bisect finds all prefix matches.
+    """
+
+    def __init__(self, entries, version):
+        self.entries = entries
+        self.names = [normalize(entry.name) for entry in entries]
+        self.layers = np.array([SEARCH_LAYERS.index(entry.layer) for entry in entries], dtype=np.int8)
+        self.aland = np.array([entry.aland or 0 for entry in entries], dtype=np.int64)
+        self.version = version
+        self.checked_at = time.monotonic()
+
+        keys = []
+        postings = defaultdict(list)
+        for entry_id, (entry, name) in enumerate(zip(entries, self.names)):
+            keys.append((name, NAME_PREFIX, entry_id))
+            for match in re.finditer(" ", name):
+                keys.append((name[match.end():], WORD_PREFIX, entry_id))
+            if entry.geoid:
+                keys.append((entry.geoid.lower(), GEOID_PREFIX, entry_id))
+            for trigram in trigrams(name):
+                postings[trigram].append(entry_id)
+        keys.sort()
+        self.prefix_keys = [key for key, _, _ in keys]
+        self.prefix_matches = [(match, entry_id) for _, match, entry_id in keys]
+        self.trigram_postings = {trigram: np.array(ids, dtype=np.int32) for trigram, ids in postings.items()}
+        self.trigram_counts = np.array([len(trigrams(name)) for name in self.names], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _prefix_candidates(self, query, candidates):
+        start = bisect_left(self.prefix_keys, query)
+        for i in range(start, min(start + MAX_PREFIX_CANDIDATES, len(self.prefix_keys))):
+            if not self.prefix_keys[i].startswith(query):
+                break
+            match, entry_id = self.prefix_matches[i]
+            if match == NAME_PREFIX and self.names[entry_id] == query:
+                match = EXACT
+            if match < candidates.get(entry_id, (FUZZY + 1,))[0]:
+                candidates[entry_id] = (match, 1.0)
+
+    def _trigram_candidates(self, query, candidates):
+        query_trigrams = trigrams(query)
+        lists = [self.trigram_postings[t] for t in query_trigrams if t in self.trigram_postings]
+        if not lists:
+            return
+        ids, shared = np.unique(np.concatenate(lists), return_counts=True)
+        similarity = shared / (len(query_trigrams) + self.trigram_counts[ids] - shared)
+        # Names holding every query trigram may contain the query verbatim, however long they are
+        keep = (similarity >= MIN_TRIGRAM_SIMILARITY) | (shared == len(query_trigrams))
+        for entry_id, score in zip(ids[keep].tolist(), similarity[keep].tolist()):
+            if entry_id in candidates:
+                continue
+            if query in self.names[entry_id]:
+                candidates[entry_id] = (SUBSTRING, score)
+            elif score >= MIN_TRIGRAM_SIMILARITY:
+                candidates[entry_id] = (FUZZY, score)
+
+    def search(self, query, layers=None, limit=10, fuzzy=True):
+        """
+        Ranked matches for a query: exact name, then name prefix, word prefix,
+        geoid prefix, substring and (with fuzzy) trigram-similar names. Ties go to
+        states before counties before places before ZCTAs, then larger land area.
+
+        Returns:
+            list[tuple[SearchEntry, int, float]]: (entry, match class, similarity).
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        candidates = {}
+        self._prefix_candidates(query, candidates)
+        if len(query) >= 3:
+            self._trigram_candidates(query, candidates)
+        if not fuzzy:
+            candidates = {entry_id: rank for entry_id, rank in candidates.items() if rank[0] != FUZZY}
+        if layers:
+            allowed = {SEARCH_LAYERS.index(layer) for layer in layers}
+            candidates = {entry_id: rank for entry_id, rank in candidates.items() if self.layers[entry_id] in allowed}
+
+        ranked = sorted(candidates.items(), key=lambda item: (
+            item[1][0], -item[1][1], self.layers[item[0]], -self.aland[item[0]], self.names[item[0]]
+        ))
+        return [(self.entries[entry_id], match, score) for entry_id, (match, score) in ranked[:limit]]
+
+    def substring_search(self, query, layers):
+        """
+        Every entry of the given layers whose name or geoid contains the query (ILIKE '%query%' semantics).
+        """
+        query = normalize(query)
+        allowed = {SEARCH_LAYERS.index(layer) for layer in layers}
+        if len(query) >= 3:
+            # Any substring match shares all of the query's trigrams
+            lists = [self.trigram_postings.get(t, np.empty(0, dtype=np.int32)) for t in trigrams(query)]
+            ids, counts = np.unique(np.concatenate(lists), return_counts=True)
+            name_matches = set(ids[counts == len(lists)].tolist())
+        else:
+            name_matches = set(range(len(self.entries)))
+        return [
+            entry for entry_id, entry in enumerate(self.entries)
+            if self.layers[entry_id] in allowed and (
+                (entry_id in name_matches and query in self.names[entry_id])
+                or query in (entry.geoid or "").lower()
+            )
+        ]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _load_entries(session):
+    entries = []
+    for geoidfq, geoid, name, aland in session.query(State.geoidfq, State.geoid, State.name, State.aland):
+        entries.append(SearchEntry("states", geoidfq, geoid, name, name, aland))
+    for geoidfq, geoid, name, namelsad, state_name, aland in session.query(
+            County.geoidfq, County.geoid, County.name, County.namelsad, County.state_name, County.aland):
+        entries.append(SearchEntry("counties", geoidfq, geoid, name, f"{namelsad or name}, {state_name}", aland))
+    for geoidfq, geoid, name, stusps, aland in session.query(
+            City.geoidfq, City.geoid, City.name, City.stusps, City.aland):
+        entries.append(SearchEntry("cities", geoidfq, geoid, name, f"{name}, {stusps}", aland))
+    for geoidfq, zcta, aland in session.query(ZCTA.geoidfq, ZCTA.zcta5ce20, ZCTA.aland20):
+        entries.append(SearchEntry("zctas", geoidfq, zcta, zcta, f"ZIP {zcta}", aland))
+    # The source tables may hold the same boundary more than once
+    unique = {}
+    for entry in entries:
+        if entry.geoidfq and entry.name:
+            unique[entry.geoidfq] = entry
+    return list(unique.values())
+
+
+def build_search_index():
+    version = cache.get_dataset_version(BOUNDARIES_DATASET)
+    session = SessionLocal()
+    try:
+        index = SearchIndex(_load_entries(session), version)
+    finally:
+        session.close()
+    print(f"Built search index: {len(index)} names.")
+    return index
+
+
+def _is_stale(index):
+    now = time.monotonic()
+    if now - index.checked_at < Config.BOUNDARY_INDEX_CHECK_INTERVAL:
+        return False
+    index.checked_at = now
+    return cache.get_dataset_version(BOUNDARIES_DATASET) != index.version
+
+
+def get_search_index():
+    """
+    Return the process-wide search index, building it on first use and
+    rebuilding it whenever the boundary tables have been reloaded.
+    """
+    global _index
+    index = _index
+    if index is not None and not _is_stale(index):
+        return index
+    with _lock:
+        if _index is index:  # nobody rebuilt it while we waited for the lock
+            _index = build_search_index()
+        return _index
+
+
+def autocomplete(query, layers=None, limit=10, fuzzy=True):
+    """
+    Ranked ids and names matching a partial query, without geometry.
+    """
+    if layers:
+        unknown = set(layers) - set(SEARCH_LAYERS)
+        if unknown:
+            raise ValueError(f"Invalid layers. Must be among {', '.join(SEARCH_LAYERS)}.")
+    return [{
+        "layer": entry.layer,
+        "geoidfq": entry.geoidfq,
+        "geo_id": entry.geoid,
+        "name": entry.name,
+        "label": entry.label,
+        "match": MATCH_NAMES[match],
+        "score": round(score, 3),
+    } for entry, match, score in get_search_index().search(query, layers, limit, fuzzy)]
@@ -0,0 +1,261 @@
+import math
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import shapely
+from geoalchemy2.shape import to_shape
+
+from app.config import Config
+from app.services import cache
+from app.services.database import SessionLocal
+from app.models.entities import State, County
+
+BOUNDARIES_DATASET = "boundaries"
+
+Boundary = namedtuple("Boundary", ["geoidfq", "name", "geometry"])
+Overlap = namedtuple("Overlap", ["geoidfq", "name", "fraction", "area"])
+
+
+class BoundaryLayer:
+    """
+    Prepared polygons of one boundary table, bulk-loaded into an STRtree.
+    """
+
+    def __init__(self, geoidfqs, names, geometries):
+        self.geoidfqs = np.asarray(list(geoidfqs), dtype=object)
+        self.names = list(names)
+        self.geometries = np.asarray(geometries, dtype=object)
+        # Planar (square degree) areas; only ever used as denominators of overlap fractions
+        self.areas = shapely.area(self.geometries)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        self.positions = {geoidfq: i for i, geoidfq in enumerate(self.geoidfqs)}
+
+    def __len__(self):
+        return len(self.geoidfqs)
+
+    def locate(self, point):
+        # The tree only narrows down by bounding box; the prepared geometry
+        # does the exact test (same semantics as ST_Contains).
+        for idx in self.tree.query(point):
+            if self.geometries[idx].contains(point):
+                return self.geoidfqs[idx]
+        return None
+
+    def locate_many(self, points):
+        """
+        Vectorized locate() for an array of points; one bulk tree query for the whole array.
+
+        Returns:
+            numpy.ndarray: geoidfq (or None) per input point.
+        """
+        result = np.full(len(points), None, dtype=object)
+        point_idx, geometry_idx = self.tree.query(points, predicate="within")
+        # A point on a shared edge is within neither polygon; keep the first hit otherwise
+        _, first = np.unique(point_idx, return_index=True)
+        result[point_idx[first]] = self.geoidfqs[geometry_idx[first]]
+        return result
+
+    def overlaps(self, polygon):
+        """
+        Boundaries intersecting a polygon and the fraction of each one's area inside it.
+
+        Boundaries the polygon fully covers skip the intersection; only the ones
+        on its edge are clipped.
+
+        Returns:
+            tuple[numpy.ndarray, numpy.ndarray]: Positions into this layer and their fractions (0..1].
+        """
+        positions = self.tree.query(polygon, predicate="intersects")
+        fractions = np.ones(len(positions))
+        shapely.prepare(polygon)
+        partial = ~shapely.covers(polygon, self.geometries[positions])
+        if partial.any():
+            clipped = shapely.intersection(self.geometries[positions[partial]], polygon)
+            fractions[partial] = np.minimum(shapely.area(clipped) / self.areas[positions[partial]], 1.0)
+        # Shared edges intersect without any area in common
+        keep = fractions > 0
+        return positions[keep], fractions[keep]
+
+    def get(self, geoidfq):
+        idx = self.positions.get(geoidfq)
+        if idx is None:
+            return None
+        return Boundary(geoidfq, self.names[idx], self.geometries[idx])
+
+
+# CellCache.get() result for a cell nobody has looked up yet
+_MISSING = object()
+
+
+class CellCache:
+    """
+    Quantized (lat, lng) cell -> (state geoidfq, county geoidfq), for cells that lie
+    wholly inside one county; None for cells a boundary crosses, whose points are
+    always located exactly.
+    """
+
+    def __init__(self, degrees, max_cells):
+        self.degrees = degrees
+        self.max_cells = max_cells
+        self._cells = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cells)
+
+    def cell(self, lat, lng):
+        return math.floor(lat / self.degrees), math.floor(lng / self.degrees)
+
+    def bounds(self, cell):
+        lat, lng = cell[0] * self.degrees, cell[1] * self.degrees
+        return shapely.box(lng, lat, lng + self.degrees, lat + self.degrees)
+
+    def get(self, cell):
+        return self._cells.get(cell, _MISSING)
+
+    def set(self, cell, owner):
+        with self._lock:
+            if len(self._cells) >= self.max_cells:
+                # Oldest first; dicts keep insertion order
+                del self._cells[next(iter(self._cells))]
+            self._cells[cell] = owner
+
+
+class BoundaryIndex:
+    def __init__(self, states, counties, version):
+        self.layers = {"states": states, "counties": counties}
+        self.cells = CellCache(Config.POINT_CELL_DEGREES, Config.POINT_CELL_CACHE_SIZE)
+        self.version = version
+        self.checked_at = time.monotonic()
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def load_layer(session, model):
+    rows = session.query(model.geoidfq, model.name, model.wkb_geometry).filter(
+        model.wkb_geometry.isnot(None)
+    ).all()
+    return BoundaryLayer(
+        [geoidfq for geoidfq, _, _ in rows],
+        [name for _, name, _ in rows],
+        [to_shape(geometry) for _, _, geometry in rows],
+    )
+
+
+def build_boundary_index():
+    """
+    Load every state and county polygon from the DB into a fresh in-memory index.
+    """
+    # Read the version before the tables so a reload racing with the build
+    # leaves the index stale (and rebuilt later) rather than silently outdated.
+    version = cache.get_dataset_version(BOUNDARIES_DATASET)
+    session = SessionLocal()
+    try:
+        index = BoundaryIndex(load_layer(session, State), load_layer(session, County), version)
+    finally:
+        session.close()
+    print(f"Built boundary index: {len(index.layers['states'])} states, "
+          f"{len(index.layers['counties'])} counties.")
+    return index
+
+
+def _is_stale(index):
+    now = time.monotonic()
+    if now - index.checked_at < Config.BOUNDARY_INDEX_CHECK_INTERVAL:
+        return False
+    index.checked_at = now
+    return cache.get_dataset_version(BOUNDARIES_DATASET) != index.version
+
+
+def get_boundary_index():
+    """
+    Return the process-wide boundary index, building it on first use and
+    rebuilding it whenever the boundary tables have been reloaded.
+    """
+    global _index
+    index = _index
+    if index is not None and not _is_stale(index):
+        return index
+    with _lock:
+        if _index is index:  # nobody rebuilt it while we waited for the lock
+            _index = build_boundary_index()
+        return _index
+
+
+def _cell_owner(index, cell, state_id, county_id):
+    # The cell's (state, county) if it lies in both interiors, else None (a boundary crosses or
+    # touches it: a point on a boundary line is in neither polygon for locate())
+    if state_id is None or county_id is None:
+        return None
+    bounds = index.cells.bounds(cell)
+    for layer, geoidfq in (("counties", county_id), ("states", state_id)):
+        boundaries = index.layers[layer]
+        if not shapely.contains_properly(boundaries.geometries[boundaries.positions[geoidfq]], bounds):
+            return None
+    return state_id, county_id
+
+
+def lookup_point(lat, lng):
+    """
+    Resolve a coordinate to the (state geoidfq, county geoidfq) containing it.
+
+    Either element is None when the point falls outside every polygon of that layer.
+    Answers come from the quantized cell cache when the point's cell lies wholly
+    inside one county; points in cells a boundary crosses are located exactly.
+    """
+    index = get_boundary_index()
+    cell = index.cells.cell(lat, lng)
+    owner = index.cells.get(cell)
+    if owner is not _MISSING and owner is not None:
+        cache.record_cache_stats("point_cell", hits=1, misses=0)
+        return owner
+
+    point = shapely.Point(lng, lat)
+    state_id, county_id = index.layers["states"].locate(point), index.layers["counties"].locate(point)
+    if owner is _MISSING:
+        cache.record_cache_stats("point_cell", hits=0, misses=1)
+        index.cells.set(cell, _cell_owner(index, cell, state_id, county_id))
+    else:
+        cache.record_cache_stats("point_cell", hits=0, misses=1, boundary=1)
+    return state_id, county_id
+
+
+def lookup_points(lats, lngs):
+    """
+    Batch form of lookup_point for many coordinates.
+
+    Returns:
+        tuple: (state geoidfqs, county geoidfqs) as object arrays aligned with the input, None where unmatched.
+    """
+    index = get_boundary_index()
+    points = shapely.points(np.asarray(lngs, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+    return index.layers["states"].locate_many(points), index.layers["counties"].locate_many(points)
+
+
+def county_overlaps(polygon):
+    """
+    Counties intersecting a polygon, with the fraction of each county's area that lies inside it.
+
+    Returns:
+        list[Overlap]: One per county, largest fraction first; `area` is the
+        county's (planar) area inside the polygon.
+    """
+    counties = get_boundary_index().layers["counties"]
+    positions, fractions = counties.overlaps(polygon)
+    order = np.argsort(-fractions, kind="stable")
+    return [Overlap(counties.geoidfqs[positions[i]], counties.names[positions[i]], float(fractions[i]),
+                    float(fractions[i] * counties.areas[positions[i]])) for i in order]
+
+
+def get_boundary(layer, geoidfq):
+    """
+    Return the indexed Boundary ('states' or 'counties') for a geoidfq, or None
+    (also for layers the index does not hold).
+    """
+    boundaries = get_boundary_index().layers.get(layer)
+    return boundaries.get(geoidfq) if boundaries is not None else None
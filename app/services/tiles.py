@@ -0,0 +1,109 @@
+import hashlib
+import math
+
+from sqlalchemy import text
+
+from app.config import Config
+from app.services import cache
+from app.services.database import get_db
+
+# Layer -> (source table, attributes carried by each feature)
+TILE_LAYERS = {
+    "states": ("states_table", "geoidfq, name, stusps"),
+    "counties": ("counties_table", "geoidfq, name, namelsad, state_name"),
+    "cities": ("city_table", "geoidfq, name, stusps"),
+    "zctas": ("zcta_table", "affgeoid20 AS geoidfq, zcta5ce20 AS name"),
+}
+
+MAX_TILE_ZOOM = 22
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+TILE_SQL = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(:z, :x, :y) AS env,
+               ST_Transform(ST_TileEnvelope(:z, :x, :y, margin => :margin), 4326) AS env_4326
+    )
+    SELECT ST_AsMVT(tile, :layer, {extent}, 'geom') FROM (
+        SELECT {attributes},
+               ST_AsMVTGeom(
+                   ST_Transform(ST_Simplify(t.wkb_geometry, :tolerance, true), 3857),
+                   bounds.env, {extent}, {buffer}, true
+               ) AS geom
+        FROM gis.{table} t, bounds
+        WHERE t.wkb_geometry && bounds.env_4326
+    ) tile
+    WHERE geom IS NOT NULL
+"""
+
+
+def tile_key(layer, z, x, y):
+    return f"tile:{layer}:{z}:{x}:{y}"
+
+
+def validate_tile(layer, z, x, y):
+    if layer not in TILE_LAYERS:
+        raise ValueError(f"Invalid layer. Must be one of {', '.join(TILE_LAYERS)}.")
+    if not 0 <= z <= MAX_TILE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError("Tile coordinates out of range")
+
+
+def render_tile(layer, z, x, y):
+    """
+    Render one Mapbox vector tile straight from the GIST-indexed boundary table.
+
+    Geometries are simplified to about one tile pixel before being reprojected, so
+    low-zoom tiles do not transform every vertex of every polygon they cover.
+    """
+    table, attributes = TILE_LAYERS[layer]
+    # Degrees per pixel at this zoom, measured at the equator
+    tolerance = 360.0 / (2 ** z) / TILE_EXTENT
+    sql = TILE_SQL.format(table=table, attributes=attributes, extent=TILE_EXTENT, buffer=TILE_BUFFER)
+    with next(get_db()) as db:
+        tile = db.execute(text(sql), {
+            "layer": layer, "z": z, "x": x, "y": y,
+            "margin": TILE_BUFFER / TILE_EXTENT, "tolerance": tolerance
+        }).scalar()
+    return bytes(tile or b"")
+
+
+def get_tile(layer, z, x, y, refresh=False):
+    """
+    Return (tile bytes, ETag) for a tile, rendering and caching it in Redis on a miss.
+
+    Args:
+        refresh (bool): Re-render even if cached (used when seeding).
+    """
+    validate_tile(layer, z, x, y)
+    key = tile_key(layer, z, x, y)
+    tile = None if refresh else cache.binary_redis_client.get(key)
+    if tile is None:
+        cache.record_cache_stats("tile", hits=0, misses=1)
+        tile = render_tile(layer, z, x, y)
+        cache.binary_redis_client.set(key, tile, ex=Config.TILE_TTL)
+    else:
+        cache.record_cache_stats("tile", hits=1, misses=0)
+    return tile, hashlib.blake2b(tile, digest_size=16).hexdigest()
+
+
+def lnglat_to_tile(lng, lat, z):
+    """
+    Web Mercator tile (x, y) containing a coordinate at zoom z.
+    """
+    lat = max(min(lat, 85.0511), -85.0511)
+    n = 2 ** z
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_covering(bbox, z):
+    """
+    Every (x, y) tile at zoom z intersecting bbox = (min_lng, min_lat, max_lng, max_lat).
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    min_x, min_y = lnglat_to_tile(min_lng, max_lat, z)
+    max_x, max_y = lnglat_to_tile(max_lng, min_lat, z)
+    for x in range(min_x, max_x + 1):
+        for y in range(min_y, max_y + 1):
+            yield x, y
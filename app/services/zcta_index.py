@@ -0,0 +1,181 @@
+import threading
+import time
+
+import numpy as np
+import shapely
+from geoalchemy2.shape import to_shape
+
+from app.config import Config
+from app.services import cache, spatial_index
+from app.services.database import SessionLocal
+from app.services.spatial_index import BOUNDARIES_DATASET, BoundaryLayer
+from app.models.entities import ZCTA
+from app.utils.geo_utils import degree_radius, haversine_meters
+
+# Counties holding less than this share of a ZCTA are slivers from mismatched edges
+MIN_COUNTY_SHARE = 0.001
+
+
+class ZctaIndex:
+    """
+    Every ZCTA polygon in an STRtree for point lookups, plus a tree of their
+    centroids for radius searches.
+    """
+
+    def __init__(self, layer, zips, alands, version):
+        self.layer = layer
+        self.zips = list(zips)
+        self.alands = list(alands)
+        centroids = shapely.centroid(layer.geometries)
+        self.lats, self.lngs = shapely.get_y(centroids), shapely.get_x(centroids)
+        self.centroid_tree = shapely.STRtree(centroids)
+        self.by_zip = {zcta: i for i, zcta in enumerate(self.zips)}
+        # ZCTA geoidfq -> its counties; filled on first request per ZCTA
+        self.counties = {}
+        self.version = version
+        self.checked_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.zips)
+
+    def summary(self, position, distance=None):
+        result = {
+            "zcta": self.zips[position],
+            "geoidfq": self.layer.geoidfqs[position],
+            "aland": self.alands[position],
+            "lat": float(self.lats[position]),
+            "lng": float(self.lngs[position]),
+        }
+        if distance is not None:
+            result["distance"] = float(distance)
+        return result
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def build_zcta_index():
+    """
+    Load every ZCTA polygon from the DB into a fresh in-memory index.
+    """
+    version = cache.get_dataset_version(BOUNDARIES_DATASET)
+    session = SessionLocal()
+    try:
+        rows = session.query(ZCTA.geoidfq, ZCTA.zcta5ce20, ZCTA.aland20, ZCTA.wkb_geometry).filter(
+            ZCTA.wkb_geometry.isnot(None)
+        ).all()
+    finally:
+        session.close()
+    index = ZctaIndex(
+        BoundaryLayer([row.geoidfq for row in rows], [row.zcta5ce20 for row in rows],
+                      [to_shape(row.wkb_geometry) for row in rows]),
+        [row.zcta5ce20 for row in rows], [row.aland20 for row in rows], version
+    )
+    print(f"Built ZCTA index: {len(index)} ZCTAs.")
+    return index
+
+
+def _is_stale(index):
+    now = time.monotonic()
+    if now - index.checked_at < Config.BOUNDARY_INDEX_CHECK_INTERVAL:
+        return False
+    index.checked_at = now
+    return cache.get_dataset_version(BOUNDARIES_DATASET) != index.version
+
+
+def get_zcta_index():
+    """
+    Return the process-wide ZCTA index, building it on first use and
+    rebuilding it whenever the boundary tables have been reloaded.
+    """
+    global _index
+    index = _index
+    if index is not None and not _is_stale(index):
+        return index
+    with _lock:
+        if _index is index:  # nobody rebuilt it while we waited for the lock
+            _index = build_zcta_index()
+        return _index
+
+
+def _counties_for(index, position):
+    geoidfq = index.layer.geoidfqs[position]
+    counties = index.counties.get(geoidfq)
+    if counties is None:
+        polygon = index.layer.geometries[position]
+        area = index.layer.areas[position]
+        counties = [
+            {"geoidfq": overlap.geoidfq, "name": overlap.name, "share": overlap.area / area}
+            for overlap in spatial_index.county_overlaps(polygon) if area and overlap.area / area >= MIN_COUNTY_SHARE
+        ]
+        counties.sort(key=lambda county: -county["share"])
+        index.counties[geoidfq] = counties
+    return counties
+
+
+def _states_for(counties):
+    # County geoidfq 0500000USsscc -> state geoidfq 0400000USss
+    shares = {}
+    for county in counties:
+        state = "0400000US" + county["geoidfq"][9:11]
+        shares[state] = shares.get(state, 0.0) + county["share"]
+    states = []
+    for geoidfq, share in sorted(shares.items(), key=lambda item: -item[1]):
+        boundary = spatial_index.get_boundary("states", geoidfq)
+        states.append({"geoidfq": geoidfq, "name": boundary.name if boundary else None, "share": share})
+    return states
+
+
+def _resolve(index, position):
+    counties = _counties_for(index, position)
+    return dict(index.summary(position), counties=counties, states=_states_for(counties))
+
+
+def lookup_point(lat, lng):
+    """
+    The ZCTA containing a coordinate, with the counties and states it lies in.
+
+    Raises:
+        LookupError: The point is in no ZCTA (water, or unpopulated land).
+    """
+    index = get_zcta_index()
+    geoidfq = index.layer.locate(shapely.Point(lng, lat))
+    if geoidfq is None:
+        raise LookupError("No ZCTA found for given coordinates")
+    return _resolve(index, index.layer.positions[geoidfq])
+
+
+def get_zcta(zcta):
+    """
+    One ZCTA by 5-digit code or geoidfq, with the counties and states it lies in
+    (largest share of the ZCTA's area first).
+    """
+    index = get_zcta_index()
+    position = index.by_zip.get(zcta, index.layer.positions.get(zcta))
+    if position is None:
+        raise LookupError(f"Unknown ZCTA {zcta}")
+    return _resolve(index, position)
+
+
+def nearby(lat, lng, radius, page=1, limit=10):
+    """
+    ZCTAs whose centroid is within radius meters, nearest first.
+    """
+    index = get_zcta_index()
+    candidates = index.centroid_tree.query(
+        shapely.Point(lng, lat), predicate="dwithin", distance=degree_radius(lat, radius)
+    )
+    distances = haversine_meters(lat, lng, index.lats[candidates], index.lngs[candidates])
+    within = distances <= radius
+    candidates, distances = candidates[within], distances[within]
+    order = np.lexsort((candidates, distances))
+
+    offset = (page - 1) * limit
+    page_order = order[offset:offset + limit]
+    return {
+        "latitude": lat, "longitude": lng, "radius": radius,
+        "page": page, "limit": limit,
+        "total_count": int(len(order)),
+        "nearby": [index.summary(candidates[i], distances[i]) for i in page_order],
+    }
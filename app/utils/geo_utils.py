@@ -1,10 +1,109 @@
+import numpy as np
 from geoalchemy2.shape import to_shape
 from shapely.geometry import mapping
 
+# Simplification tolerance (degrees) of each precomputed geometry tier; "full"
+# is the original 500k boundary.
+GEOMETRY_TIERS = {"low": 0.05, "medium": 0.01, "high": 0.001, "full": None}
+FULL_TIER = "full"
+
+# Same sphere Redis uses for its GEO commands, so distances line up with GEOSEARCH.
+EARTH_RADIUS_METERS = 6372797.560856
+
+# Coordinate limits and precision of Redis GEO sorted-set scores (52-bit interleaved geohash)
+GEO_LAT_MIN, GEO_LAT_MAX = -85.05112878, 85.05112878
+GEO_LNG_MIN, GEO_LNG_MAX = -180.0, 180.0
+GEO_STEP = 26
+
+# Census summary-level prefix of each boundary layer's geoidfq
+GEOIDFQ_PREFIXES = {"0400000US": "states", "0500000US": "counties", "1600000US": "cities", "860Z200US": "zctas"}
+
+def layer_for_geoidfq(geoidfq):
+    """
+    Boundary layer ('states', 'counties', 'cities' or 'zctas') a geoidfq belongs to, or None if unrecognised.
+    """
+    return GEOIDFQ_PREFIXES.get((geoidfq or "")[:9])
+
+def to_geojson(shape_obj):
+    """
+    Converts a Shapely geometry to GeoJSON format.
+    """
+    return mapping(shape_obj)
+
 def to_geojson_from_wkb(wkb_element):
     """
     Converts WKB geometry to GeoJSON format using Shapely.
     """
     shape_obj = to_shape(wkb_element)
-    return mapping(shape_obj)
+    return to_geojson(shape_obj)
+
+def haversine_meters(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance in meters. Accepts scalars or NumPy arrays.
+    """
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(a))
 
+def degree_radius(lat, radius_meters):
+    """
+    Planar radius in degrees guaranteed to cover every point within radius_meters of latitude `lat`.
+
+    Lets a geography distance filter be paired with an ST_DWithin on geometry,
+    which the GIST index on wkb_geometry can serve.
+    """
+    # Shortest degree of latitude anywhere on the spheroid, with slack for rounding
+    lat_degrees = radius_meters / 110574.0 * 1.01
+    widest_lat = min(abs(lat) + lat_degrees, 89.9)
+    lng_degrees = radius_meters / (111320.0 * np.cos(np.radians(widest_lat))) * 1.01
+    return float(np.hypot(lat_degrees, lng_degrees))
+
+def _spread_bits(values):
+    # Moves bit i of a 32-bit value to bit 2i (Redis's interleave64)
+    values = values.astype(np.uint64)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+def geo_scores(lats, lngs):
+    """
+    Sorted-set scores Redis's GEOADD would store for these coordinates.
+
+    Port of geohashEncode + interleave64 from Redis, so the scores already in a
+    GEO index can be compared with the DB without a GEOPOS round trip.
+    Coordinates must be within GEO_LAT_MIN/MAX and GEO_LNG_MIN/MAX.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    lat_offset = (lats - GEO_LAT_MIN) / (GEO_LAT_MAX - GEO_LAT_MIN) * (1 << GEO_STEP)
+    lng_offset = (lngs - GEO_LNG_MIN) / (GEO_LNG_MAX - GEO_LNG_MIN) * (1 << GEO_STEP)
+    bits = _spread_bits(lat_offset.astype(np.uint32)) | (_spread_bits(lng_offset.astype(np.uint32)) << np.uint64(1))
+    return bits.astype(np.float64)
+
+def tier_for_zoom(zoom):
+    """
+    Maps a web-map zoom level to the coarsest geometry tier that still looks right at it.
+    """
+    if zoom <= 4:
+        return "low"
+    if zoom <= 7:
+        return "medium"
+    if zoom <= 10:
+        return "high"
+    return FULL_TIER
+
+def resolve_geometry_tier(detail=None, zoom=None):
+    """
+    Resolves the `detail` / `zoom` request parameters to a geometry tier.
+
+    An explicit detail wins over zoom; without either the full geometry is served.
+    Raises ValueError for an unknown detail.
+    """
+    if detail:
+        if detail not in GEOMETRY_TIERS:
+            raise ValueError(f"Invalid detail. Must be one of {', '.join(GEOMETRY_TIERS)}.")
+        return detail
+    if zoom is not None:
+        return tier_for_zoom(zoom)
+    return FULL_TIER
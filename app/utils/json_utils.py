@@ -0,0 +1,36 @@
+import orjson
+from flask import Response
+
+from app.utils import metrics
+
+def _default(obj):
+    # Numeric types orjson does not handle natively (e.g. Decimal from NUMERIC columns)
+    if hasattr(obj, "__float__"):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps(obj):
+    """
+    Encodes an object to JSON bytes with orjson.
+
+    Values wrapped in orjson.Fragment are already-encoded JSON and are copied
+    into the output verbatim, without being parsed or re-encoded.
+    """
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def loads(data):
+    return orjson.loads(data)
+
+def fragment(encoded):
+    """
+    Wraps already-encoded JSON (str or bytes, e.g. straight from Redis) for splicing into dumps().
+    """
+    return orjson.Fragment(encoded)
+
+def json_response(payload, status=200):
+    """
+    Builds a Flask JSON response from a payload that may contain cached fragments.
+    """
+    with metrics.stage("json_encode"):
+        body = dumps(payload)
+    return Response(body, status=status, mimetype="application/json")
@@ -0,0 +1,206 @@
+"""
+Request instrumentation: per-stage timings, DB query counts, Redis round trips
+and cache lookups, exported as Prometheus histograms/counters on /metrics and,
+per request, as a Server-Timing header.
+
+Stages are named blocks of service code (`with metrics.stage("geojson"): ...`).
+Their time is observed in a histogram and, while a request is being served,
+added to that request's breakdown. Stages may nest ("geojson" inside
+"cache_load"), so their durations do not sum to the total. DB and Redis time is
+captured by hooks on the SQLAlchemy engine and the Redis clients instead.
+
+Each process keeps its own registry; with several ASGI workers every worker is
+a separate scrape target.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+import redis
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+REQUEST_DURATION = Histogram(
+    "geo_request_duration_seconds", "Time to build the response, by route.",
+    ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS
+)
+STAGE_DURATION = Histogram(
+    "geo_stage_duration_seconds", "Time spent in instrumented service stages.",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+DB_QUERY_DURATION = Histogram(
+    "geo_db_query_duration_seconds", "Duration of individual SQL statements.", buckets=LATENCY_BUCKETS
+)
+REDIS_DURATION = Histogram(
+    "geo_redis_round_trip_duration_seconds", "Duration of Redis round trips (a pipeline is one).",
+    ["command"], buckets=LATENCY_BUCKETS
+)
+REQUEST_DB_QUERIES = Histogram(
+    "geo_request_db_queries", "SQL statements executed per request.", ["endpoint"], buckets=COUNT_BUCKETS
+)
+REQUEST_REDIS_ROUND_TRIPS = Histogram(
+    "geo_request_redis_round_trips", "Redis round trips per request.", ["endpoint"], buckets=COUNT_BUCKETS
+)
+CACHE_LOOKUPS = Counter(
+    "geo_cache_lookups_total", "Cache lookups by namespace and outcome (hits, local_hits, misses, ...).",
+    ["namespace", "result"]
+)
+
+
+class RequestTimings:
+    """
+    Breakdown of one request: seconds per stage plus DB/Redis totals.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.redis_round_trips = 0
+        self.redis_seconds = 0.0
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self, total):
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        if self.db_queries:
+            entries.append(f'db;desc="{self.db_queries} queries";dur={self.db_seconds * 1000:.2f}')
+        if self.redis_round_trips:
+            entries.append(f'redis;desc="{self.redis_round_trips} round trips";dur={self.redis_seconds * 1000:.2f}')
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+_current = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a block as the named stage. Keep names to a fixed set; they are metric labels.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.labels(name).observe(elapsed)
+        timings = _current.get()
+        if timings is not None:
+            timings.add_stage(name, elapsed)
+
+
+def timed(name):
+    """
+    Decorator form of stage().
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache_lookups(namespace, **counts):
+    for result, count in counts.items():
+        if count:
+            CACHE_LOOKUPS.labels(namespace, result).inc(count)
+
+
+def _record_db_query(elapsed):
+    DB_QUERY_DURATION.observe(elapsed)
+    timings = _current.get()
+    if timings is not None:
+        timings.db_queries += 1
+        timings.db_seconds += elapsed
+
+
+def _record_redis_round_trip(command, elapsed):
+    REDIS_DURATION.labels(command).observe(elapsed)
+    timings = _current.get()
+    if timings is not None:
+        timings.redis_round_trips += 1
+        timings.redis_seconds += elapsed
+
+
+def instrument_engine(engine):
+    """
+    Count and time every statement executed through the engine.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        _record_db_query(time.perf_counter() - conn.info["query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # A failed statement never reaches after_cursor_execute
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            _record_db_query(time.perf_counter() - starts.pop())
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            _record_redis_round_trip("PIPELINE", time.perf_counter() - start)
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    redis.Redis that records each command, and each pipeline execute, as one round trip.
+    """
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            _record_redis_round_trip(str(args[0]).upper(), time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def start_request():
+    _current.set(RequestTimings())
+
+
+def finish_request(endpoint, method, status):
+    """
+    Observe the current request's metrics.
+
+    Returns:
+        str: Its Server-Timing header value, or None outside a started request.
+    """
+    timings = _current.get()
+    if timings is None:
+        return None
+    _current.set(None)
+    total = time.perf_counter() - timings.started
+    REQUEST_DURATION.labels(endpoint, method, str(status)).observe(total)
+    REQUEST_DB_QUERIES.labels(endpoint).observe(timings.db_queries)
+    REQUEST_REDIS_ROUND_TRIPS.labels(endpoint).observe(timings.redis_round_trips)
+    return timings.server_timing(total)
+
+
+def render():
+    """
+    Returns:
+        tuple[bytes, str]: The Prometheus exposition and its content type.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
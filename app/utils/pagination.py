@@ -0,0 +1,23 @@
+import base64
+
+import orjson
+
+def encode_cursor(*values):
+    """
+    Encodes the sort key of the last row of a page as an opaque, URL-safe continuation token.
+    """
+    return base64.urlsafe_b64encode(orjson.dumps(values)).decode().rstrip("=")
+
+def decode_cursor(token, arity):
+    """
+    Decodes a token produced by encode_cursor() back into its list of values.
+
+    Raises ValueError if the token is malformed or does not hold `arity` values.
+    """
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != arity:
+        raise ValueError("Invalid cursor")
+    return values
@@ -0,0 +1,4 @@
+import os
+
+# The benchmarks wire their own Redis and indexes; importing the app must not connect to the real ones
+os.environ.setdefault("SKIP_APP_INIT", "1")
@@ -0,0 +1,161 @@
+"""
+Wires the service layer to benchmark stand-ins: a Redis (in-process fakeredis by
+default, or a real server), the in-memory indexes built straight from a
+synthetic dataset, and optionally a local PostGIS loaded with the same data.
+"""
+import math
+
+import redis
+from sqlalchemy import text
+
+from app.config import Config
+from app.services import cache, demography_store, search_index, spatial_index
+from app.services.database import Base, SessionLocal, engine
+from app.models.entities import City, County, State
+from app.utils.geo_utils import haversine_meters, to_geojson
+from app.utils.json_utils import dumps
+
+
+def connect_redis(url=None):
+    """
+    Point the cache module at a real Redis (url) or at an in-process fakeredis server.
+
+    Returns:
+        str: "redis" or "fakeredis".
+    """
+    if url:
+        cache.redis_client = redis.Redis.from_url(url, decode_responses=True)
+        cache.binary_redis_client = redis.Redis.from_url(url)
+        cache.redis_client.ping()
+        return "redis"
+    try:
+        import fakeredis
+    except ImportError as e:
+        raise SystemExit("fakeredis is required without --redis-url (pip install -r benchmarks/requirements.txt)") from e
+    server = fakeredis.FakeServer()
+    cache.redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    cache.binary_redis_client = fakeredis.FakeRedis(server=server)
+    _emulate_bybox(cache.redis_client)
+    return "fakeredis"
+
+
+def _emulate_bybox(client):
+    """
+    fakeredis cannot run GEOSEARCH BYBOX. Answer box searches (meters, centered on
+    a point, no COUNT) with a search of the circle around the box, keeping the
+    members inside it: north-south against the center's meridian, east-west
+    along each member's own parallel, as Redis measures them.
+    """
+    geosearch = client.geosearch
+
+    def search(name, *args, width=None, height=None, withcoord=False, withdist=False, **kwargs):
+        if width is None:
+            return geosearch(name, *args, withcoord=withcoord, withdist=withdist, **kwargs)
+        if args or kwargs.get("unit", "m") != "m" or kwargs.get("count") or kwargs.get("member"):
+            raise NotImplementedError("BYBOX emulation only covers meter boxes around a point without COUNT")
+        lng, lat = kwargs.pop("longitude"), kwargs.pop("latitude")
+        kwargs.pop("unit", None)
+        radius = math.hypot(width, height) / 2 * 1.05
+        rows = geosearch(name, longitude=lng, latitude=lat, radius=radius, unit="m",
+                         withdist=True, withcoord=True, **kwargs)
+        result = []
+        for member, distance, (member_lng, member_lat) in rows:
+            if (haversine_meters(member_lat, lng, lat, lng) > height / 2
+                    or haversine_meters(member_lat, member_lng, member_lat, lng) > width / 2):
+                continue
+            extra = ([distance] if withdist else []) + ([(member_lng, member_lat)] if withcoord else [])
+            result.append([member, *extra] if extra else member)
+        return result
+
+    client.geosearch = search
+
+
+def install_indexes(dataset):
+    """
+    Build the boundary, demography and search indexes from the dataset instead of the DB.
+    """
+    boundaries_version = cache.get_dataset_version(spatial_index.BOUNDARIES_DATASET)
+    spatial_index._index = spatial_index.BoundaryIndex(
+        spatial_index.BoundaryLayer([r.geoidfq for r in dataset.states], [r.name for r in dataset.states],
+                                    [r.geometry for r in dataset.states]),
+        spatial_index.BoundaryLayer([r.geoidfq for r in dataset.counties], [r.name for r in dataset.counties],
+                                    [r.geometry for r in dataset.counties]),
+        boundaries_version,
+    )
+    demography_store._store = demography_store.DemographyStore({
+        "states": demography_store.DemographyTable(dataset.state_demography),
+        "counties": demography_store.DemographyTable(dataset.county_demography),
+    }, cache.get_dataset_version(demography_store.DEMOGRAPHY_DATASET))
+
+    entries = [search_index.SearchEntry("states", r.geoidfq, r.geoid, r.name, r.name, r.aland)
+               for r in dataset.states]
+    entries += [search_index.SearchEntry("counties", r.geoidfq, r.geoid, r.name, f"{r.name}, {r.state_name}", r.aland)
+                for r in dataset.counties]
+    entries += [search_index.SearchEntry("cities", p.geoidfq, p.geoid, p.name, f"{p.name}, {p.stusps}", p.aland)
+                for p in dataset.cities]
+    search_index._index = search_index.SearchIndex(entries, boundaries_version)
+
+
+def warm_redis(dataset, chunk_size=5000):
+    """
+    Fill cities:geo and the city:data and city:meta payloads, as the app's startup sync and first reads would.
+    """
+    client = cache.redis_client
+    client.delete(cache.cities_geo_index())
+    for i in range(0, len(dataset.cities), chunk_size):
+        pipe = client.pipeline(transaction=False)
+        for place in dataset.cities[i:i + chunk_size]:
+            pipe.geoadd(cache.cities_geo_index(), (place.lng, place.lat, place.geoidfq))
+            # Same shape as geospatial._city_payload
+            payload = {
+                "name": place.name, "geoidfq": place.geoidfq, "state_name": place.state_name,
+                "aland": place.aland, "lat": place.lat, "lng": place.lng, "geojson": to_geojson(place.geometry)
+            }
+            pipe.set(cache.city_data_key(place.geoidfq), dumps(payload), ex=Config.CITY_DATA_TTL)
+            # Same shape as geospatial._load_city_metadata
+            del payload["geojson"]
+            pipe.set(cache.city_meta_key(place.geoidfq), dumps(payload), ex=Config.CITY_DATA_TTL)
+        pipe.execute()
+
+
+def load_postgis(dataset, allow_database=None):
+    """
+    Replace the boundary tables of the configured database with the synthetic dataset.
+
+    Refuses to touch a database whose name does not end in "bench" unless it is
+    passed explicitly as allow_database.
+    """
+    from app.scripts.load_data import build_boundary_hierarchy
+
+    database = engine.url.database
+    if not database.endswith("bench") and database != allow_database:
+        raise SystemExit(f"Refusing to overwrite database '{database}'; use a *bench database "
+                         f"or pass --allow-database {database}")
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        conn.execute(text("CREATE SCHEMA IF NOT EXISTS gis"))
+    Base.metadata.create_all(engine)
+
+    session = SessionLocal()
+    try:
+        session.execute(text("TRUNCATE gis.states_table, gis.counties_table, gis.city_table RESTART IDENTITY"))
+        session.execute(State.__table__.insert(), [{
+            "statefp": r.statefp, "geoidfq": r.geoidfq, "geoid": r.geoid, "stusps": r.stusps, "name": r.name,
+            "aland": r.aland, "awater": 0, "wkb_geometry": f"SRID=4326;{r.geometry.wkt}"
+        } for r in dataset.states])
+        session.execute(County.__table__.insert(), [{
+            "statefp": r.statefp, "countyfp": r.geoid[2:], "geoidfq": r.geoidfq, "geoid": r.geoid, "name": r.name,
+            "namelsad": r.name, "stusps": r.stusps, "state_name": r.state_name, "aland": r.aland, "awater": 0,
+            "wkb_geometry": f"SRID=4326;{r.geometry.wkt}"
+        } for r in dataset.counties])
+        session.execute(City.__table__.insert(), [{
+            "statefp": p.statefp, "placefp": p.geoid[2:], "geoidfq": p.geoidfq, "geoid": p.geoid, "name": p.name,
+            "namelsad": p.name, "stusps": p.stusps, "state_name": p.state_name, "aland": p.aland, "awater": 0,
+            "wkb_geometry": f"SRID=4326;{p.geometry.wkt}", "centroid_lat": p.lat, "centroid_lon": p.lng
+        } for p in dataset.cities])
+        session.commit()
+        session.execute(text("ANALYZE gis.states_table, gis.counties_table, gis.city_table"))
+    finally:
+        session.close()
+    build_boundary_hierarchy()
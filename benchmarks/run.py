@@ -0,0 +1,235 @@
+"""
+Offline latency/throughput benchmarks for the service functions behind each endpoint.
+
+Runs on a synthetic dataset against in-process fakes by default (fakeredis and
+the in-memory indexes); benchmarks that need PostGIS or a real Redis are
+reported as skipped unless --postgis / --redis-url are given.
+
+    python -m benchmarks.run --cities 20000 --iterations 500 --output bench.json
+    python -m benchmarks.run --baseline bench-main.json --threshold 0.2   # exit 1 on regressions
+
+With --postgis the configured database (POSTGRES_* env vars) is overwritten with
+the synthetic data, so point it at a throwaway *bench database.
+"""
+import argparse
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app import app as flask_app
+from app.services import demography_store, geospatial
+from app.services.search_index import autocomplete
+from app.utils.geo_utils import FULL_TIER
+from benchmarks import fixtures, synthetic
+
+Benchmark = namedtuple("Benchmark", ["name", "call", "requires"])
+
+
+def _status(result):
+    # Service functions return a Response, a (Response, status) tuple, or plain data
+    if isinstance(result, tuple):
+        return result[1]
+    return getattr(result, "status_code", 200)
+
+
+def _consume(result):
+    # Streaming responses only do their work when iterated
+    if hasattr(result, "__next__"):
+        for _ in result:
+            pass
+    return result
+
+
+def build_benchmarks(dataset, args):
+    rng = random.Random(args.seed)
+    points = synthetic.random_points(4096, dataset.bbox, args.seed)
+    point_cycle = itertools.cycle(points.tolist())
+    boundaries = [r.geoidfq for r in dataset.states + dataset.counties]
+    county_names = [r.name for r in dataset.counties]
+
+    def polygon_wkt():
+        lat, lng = next(point_cycle)
+        size = rng.uniform(0.1, 1.0)
+        return {"polygon_wkt": f"POLYGON(({lng} {lat}, {lng + size} {lat}, {lng + size} {lat + size}, "
+                               f"{lng} {lat + size / 2}, {lng} {lat}))"}
+
+    return [
+        Benchmark("fetch_demographics",
+                  lambda: geospatial.fetch_demographics(*next(point_cycle), FULL_TIER), set()),
+        Benchmark("get_nearby_cities_from_redis",
+                  lambda: geospatial.get_nearby_cities_from_redis(*next(point_cycle), args.radius, 1, 10), set()),
+        Benchmark("get_nearby_cities_from_redis_exact",
+                  lambda: geospatial.get_nearby_cities_from_redis(*next(point_cycle), args.radius, 1, 10, "exact"),
+                  set()),
+        Benchmark("search_boundaries_service",
+                  lambda: geospatial.search_boundaries_service("counties", rng.choice(county_names)[:4]), set()),
+        Benchmark("autocomplete",
+                  lambda: autocomplete(rng.choice(county_names)[:rng.randint(2, 6)]), set()),
+        Benchmark("demographics_rank",
+                  lambda: demography_store.rank("counties", "total_population", limit=25), set()),
+        Benchmark("stream_demographics_batch_1000",
+                  lambda: _consume(geospatial.stream_demographics_batch(
+                      [next(point_cycle) for _ in range(1000)])), set()),
+        # The polygon prefilter may choose GEOSEARCH BYBOX, which fixtures emulate on fakeredis
+        Benchmark("fetch_cities_within_polygon",
+                  lambda: geospatial.fetch_cities_within_polygon(polygon_wkt(), 1, 10, "distance", "asc"), set()),
+        Benchmark("fetch_cities_within_polygon_aland",
+                  lambda: geospatial.fetch_cities_within_polygon(polygon_wkt(), 1, 10, "aland", "desc"), set()),
+        Benchmark("fetch_nearby_cities",
+                  lambda: geospatial.fetch_nearby_cities(*next(point_cycle), args.radius, 1, 10, FULL_TIER),
+                  {"postgis"}),
+        Benchmark("fetch_nearby_cities_keyset",
+                  lambda: geospatial.fetch_nearby_cities_keyset(*next(point_cycle), args.radius, 10),
+                  {"postgis"}),
+        Benchmark("fetch_encompassing_boundaries",
+                  lambda: geospatial.fetch_encompassing_boundaries(rng.choice(boundaries), 1, 10), {"postgis"}),
+    ]
+
+
+def measure(call, iterations, warmup, threads):
+    """
+    Run a benchmark and summarise its per-call latencies and overall throughput.
+    """
+    def timed(_):
+        start = time.perf_counter()
+        status = _status(call())
+        return time.perf_counter() - start, status
+
+    with flask_app.app_context():
+        for _ in range(warmup):
+            call()
+        started = time.perf_counter()
+        if threads > 1:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                samples = list(pool.map(timed, range(iterations)))
+        else:
+            samples = [timed(i) for i in range(iterations)]
+        elapsed = time.perf_counter() - started
+
+    latencies = np.array([latency for latency, _ in samples]) * 1000
+    return {
+        "iterations": iterations,
+        "threads": threads,
+        "errors": sum(1 for _, status in samples if status >= 400),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p90_ms": float(np.percentile(latencies, 90)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+        "ops_per_s": iterations / elapsed,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    Print p50 changes against a baseline run. Returns the names that regressed beyond threshold.
+    """
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before or "p50_ms" not in before or "p50_ms" not in current:
+            continue
+        change = current["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        flag = "REGRESSION" if change > threshold else ""
+        print(f"  {name:34s} p50 {before['p50_ms']:8.3f} -> {current['p50_ms']:8.3f} ms ({change:+.1%}) {flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--states", type=int, default=16)
+    parser.add_argument("--counties-per-side", type=int, default=6, help="Counties per state = this squared")
+    parser.add_argument("--cities", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--radius", type=float, default=25000, help="Radius (m) for the nearby benchmarks")
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=1, help="Concurrent callers per benchmark")
+    parser.add_argument("--only", help="Comma-separated benchmark names to run")
+    parser.add_argument("--redis-url", help="Use this Redis instead of fakeredis (its keys get overwritten)")
+    parser.add_argument("--postgis", action="store_true", help="Load the dataset into the configured database")
+    parser.add_argument("--allow-database", help="Database name --postgis may overwrite besides *bench ones")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    print(f"Generating {args.states} states, {args.states * args.counties_per_side ** 2} counties, "
+          f"{args.cities} places...")
+    dataset = synthetic.generate(args.states, args.counties_per_side, args.cities, seed=args.seed)
+
+    redis_kind = fixtures.connect_redis(args.redis_url)
+    fixtures.install_indexes(dataset)
+    fixtures.warm_redis(dataset)
+    available = {redis_kind}
+    if args.postgis:
+        fixtures.load_postgis(dataset, args.allow_database)
+        available.add("postgis")
+
+    only = set(args.only.split(",")) if args.only else None
+    results = {}
+    for benchmark in build_benchmarks(dataset, args):
+        if only and benchmark.name not in only:
+            continue
+        missing = benchmark.requires - available
+        if missing:
+            results[benchmark.name] = {"skipped": f"needs {', '.join(sorted(missing))}"}
+            print(f"  {benchmark.name:34s} skipped ({results[benchmark.name]['skipped']})")
+            continue
+        result = measure(benchmark.call, args.iterations, args.warmup, args.threads)
+        results[benchmark.name] = result
+        print(f"  {benchmark.name:34s} p50 {result['p50_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms  "
+              f"{result['ops_per_s']:9.1f} ops/s  errors {result['errors']}")
+
+    skipped = [name for name, result in results.items() if "skipped" in result]
+    if skipped:
+        # Say what this run did not cover, so an offline run is not mistaken for a full one
+        print(f"NOT MEASURED ({len(skipped)} of {len(results)}): {', '.join(skipped)}. "
+              f"Pass --postgis (and --redis-url) to cover them.")
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "redis": redis_kind,
+            "postgis": args.postgis,
+            "scale": {"states": len(dataset.states), "counties": len(dataset.counties),
+                      "cities": len(dataset.cities), "seed": args.seed},
+            "iterations": args.iterations,
+            "threads": args.threads,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {baseline['meta'].get('commit')}:")
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Synthetic states, counties, places and demographics with the shapes and id
+formats of the real census data, at a configurable scale.
+
+States tile a rectangle over the continental US, each state is split into a
+grid of counties, and places are small polygons scattered at random (some
+straddle county lines, as real ones do).
+"""
+import math
+import random
+from collections import namedtuple
+
+import numpy as np
+import shapely
+
+from app.services.demography_store import METRICS
+
+Region = namedtuple("Region", ["geoidfq", "geoid", "name", "statefp", "stusps", "state_name", "aland", "geometry"])
+Place = namedtuple("Place", ["geoidfq", "geoid", "name", "statefp", "stusps", "state_name", "aland", "geometry",
+                             "lat", "lng"])
+Dataset = namedtuple("Dataset", ["states", "counties", "cities", "state_demography", "county_demography", "bbox"])
+
+BBOX = (-124.0, 25.0, -67.0, 49.0)
+
+_SYLLABLES = ["an", "ber", "cal", "dor", "el", "fen", "gar", "hal", "is", "jor", "kel", "lan", "mar", "nor",
+              "or", "pen", "quin", "ros", "san", "ter", "ul", "ver", "wes", "yar", "zan"]
+
+# Rough square meters per square degree at US latitudes, for plausible aland values
+M2_PER_DEG2 = 111_000 * 85_000
+
+
+def _name(rng, words=1):
+    return " ".join(
+        "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize() for _ in range(words)
+    )
+
+
+def _demography(rng, regions, years, county=False):
+    columns = {name: [] for name in ("id", "name", "geoidfq", "state", "year") + METRICS}
+    if county:
+        columns["county"] = []
+    for region in regions:
+        population = rng.randint(5_000, 5_000_000 if not county else 500_000)
+        for year in years:
+            population = int(population * rng.uniform(0.98, 1.04))
+            columns["id"].append(len(columns["id"]) + 1)
+            columns["name"].append(region.name)
+            columns["geoidfq"].append(region.geoidfq)
+            columns["state"].append(region.statefp)
+            columns["year"].append(year)
+            if county:
+                columns["county"].append(region.geoid[2:])
+            columns["total_population"].append(population)
+            columns["female_population"].append(int(population * rng.uniform(0.48, 0.52)))
+            columns["median_gross_rent_in_dollars"].append(rng.randint(600, 2500))
+            columns["median_household_income_past12months"].append(rng.randint(35_000, 140_000))
+            columns["male_bachelors_degree_25yrs_above"].append(int(population * rng.uniform(0.05, 0.2)))
+            columns["female_bachelors_degree_25yrs_above"].append(int(population * rng.uniform(0.05, 0.2)))
+    return columns
+
+
+def generate(states=16, counties_per_side=6, cities=20_000, years=range(2015, 2024), seed=42):
+    """
+    Build a synthetic dataset.
+
+    Args:
+        states (int): Number of states.
+        counties_per_side (int): Each state is split into counties_per_side^2 counties.
+        cities (int): Number of places.
+        years (iterable): Demography years.
+        seed (int): RNG seed, so runs at the same scale are comparable.
+    """
+    rng = random.Random(seed)
+    min_lng, min_lat, max_lng, max_lat = BBOX
+    cols = math.ceil(math.sqrt(states))
+    rows = math.ceil(states / cols)
+    width, height = (max_lng - min_lng) / cols, (max_lat - min_lat) / rows
+
+    state_regions, county_regions = [], []
+    for i in range(states):
+        statefp = f"{i + 1:02d}"
+        name = _name(rng)
+        left, bottom = min_lng + (i % cols) * width, min_lat + (i // cols) * height
+        box = shapely.box(left, bottom, left + width, bottom + height)
+        stusps = name[:2].upper()
+        state_regions.append(Region(f"0400000US{statefp}", statefp, name, statefp, stusps, name,
+                                    int(box.area * M2_PER_DEG2), box))
+        cw, ch = width / counties_per_side, height / counties_per_side
+        for j in range(counties_per_side ** 2):
+            countyfp = f"{2 * j + 1:03d}"
+            cleft, cbottom = left + (j % counties_per_side) * cw, bottom + (j // counties_per_side) * ch
+            cbox = shapely.box(cleft, cbottom, cleft + cw, cbottom + ch)
+            county_regions.append(Region(f"0500000US{statefp}{countyfp}", f"{statefp}{countyfp}",
+                                         f"{_name(rng)} County", statefp, stusps, name,
+                                         int(cbox.area * M2_PER_DEG2), cbox))
+
+    place_list = []
+    for i in range(cities):
+        state = rng.choice(state_regions)
+        left, bottom, right, top = state.geometry.bounds
+        lng, lat = rng.uniform(left, right), rng.uniform(bottom, top)
+        placefp = f"{i:05d}"
+        polygon = shapely.Point(lng, lat).buffer(rng.uniform(0.005, 0.06), quad_segs=4)
+        place_list.append(Place(f"1600000US{state.statefp}{placefp}", f"{state.statefp}{placefp}",
+                                _name(rng, rng.choice((1, 1, 2))), state.statefp, state.stusps, state.state_name,
+                                int(polygon.area * M2_PER_DEG2), polygon, lat, lng))
+
+    years = list(years)
+    return Dataset(state_regions, county_regions, place_list,
+                   _demography(rng, state_regions, years), _demography(rng, county_regions, years, county=True),
+                   BBOX)
+
+
+def random_points(n, bbox=BBOX, seed=7):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.uniform(bbox[1], bbox[3], n), rng.uniform(bbox[0], bbox[2], n)])